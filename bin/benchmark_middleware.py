@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark the per-request overhead of the middleware stack.
+
+A page and a static file are requested directly through ASGI, with and without the
+middleware stack of the app. The overhead is the difference in time per request.
+
+    BASE_DIR=sites/aarhus python bin/benchmark_middleware.py --requests 5000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(".")
+
+# Check if the environment variable BASE_DIR is set
+if "BASE_DIR" not in os.environ:
+    print("Environment variable BASE_DIR is not set. E.g. set it like this:")
+    print("export BASE_DIR=sites/aarhus")
+    exit(1)
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from maya.core.logging import get_access_log
+from maya.core.middleware import middleware
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "maya", "static")
+PATHS = ("/records/1", "/static/css/default.css")
+
+
+async def _page(request: Request):
+    return HTMLResponse("<html><body>" + "record " * 1000 + "</body></html>")
+
+
+def _get_app(with_middleware: bool) -> Starlette:
+    routes = [Route("/records/1", _page), Mount("/static", StaticFiles(directory=STATIC_DIR))]
+    return Starlette(routes=routes, middleware=middleware if with_middleware else [])
+
+
+async def _request(app: Starlette, path: str) -> None:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 50000),
+        "root_path": "",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"accept-encoding", b"gzip"), (b"user-agent", b"benchmark")],
+        "state": {},
+    }
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"{path} returned {message['status']}")
+
+    await app(scope, receive, send)
+
+
+async def _time_per_request(app: Starlette, path: str, num_requests: int) -> float:
+    for _ in range(min(num_requests, 100)):
+        await _request(app, path)
+
+    time_begin = time.perf_counter()
+    for _ in range(num_requests):
+        await _request(app, path)
+    return (time.perf_counter() - time_begin) / num_requests
+
+
+async def main(num_requests: int) -> None:
+    # Do not write the benchmark requests to the access log
+    get_access_log().disabled = True
+
+    bare_app = _get_app(with_middleware=False)
+    app = _get_app(with_middleware=True)
+
+    print(f"{'path':<28}{'bare':>12}{'middleware':>14}{'overhead':>12}")
+    for path in PATHS:
+        bare = await _time_per_request(bare_app, path, num_requests)
+        full = await _time_per_request(app, path, num_requests)
+        print(f"{path:<28}{bare * 1e6:>10.1f}us{full * 1e6:>12.1f}us{(full - bare) * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per path and app")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -10,6 +10,12 @@ from maya.core.middleware import middleware
 from maya.core.exception_handlers import exception_handlers
 from maya.core.hooks import get_hooks
 from maya.core.paths import get_data_dir_path
+from maya.core import api_client
+from maya.core import prefetch
+from maya.core.cache_maintenance import run_cache_maintenance_forever
+from maya.records.facet_tree import get_facet_tree
+from maya.database import utils as database_utils
+import asyncio
 import contextlib
 import os
 import sys
@@ -22,6 +28,7 @@ routes = hooks.after_routes_init(routes)
 @contextlib.asynccontextmanager
 async def lifespan(app):
 
+    cache_maintenance_task = None
     try:
 
         sys.path.append(".")
@@ -40,8 +47,25 @@ async def lifespan(app):
         if api_key == "api_key":
             log.error("API_KEY is missing. Please set the API_KEY environment variable before running the app.")
             raise RuntimeError("Missing required environment variable: API_KEY")
+
+        # One pooled HTTP client per worker for all upstream API calls
+        await api_client.open_async_client()
+
+        # Long-lived sqlite3 connections per database URL
+        await database_utils.open_connection_pools(settings.get("sqlite3_pool_size", 4))
+
+        # Compile the facet tree before the first search
+        get_facet_tree()
+
+        # Keep the cache table within its budget while the server runs
+        cache_maintenance_task = asyncio.create_task(run_cache_maintenance_forever())
         yield
     finally:
+        if cache_maintenance_task:
+            cache_maintenance_task.cancel()
+        await prefetch.cancel_all()
+        await api_client.close_async_client()
+        await database_utils.close_connection_pools()
         log.info("App lifecycle ended")
 
 
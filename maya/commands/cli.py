@@ -148,8 +148,10 @@ async def _run_cron_tasks() -> None:
 
     - Expire orders
     - Send renewal emails
+    - Delete expired cache values
     """
     from maya.orders.service import cron_orders_expire, cron_renewal_emails
+    from maya.core.cache_maintenance import run_cache_maintenance
 
     # Expire orders
     try:
@@ -163,8 +165,14 @@ async def _run_cron_tasks() -> None:
     except Exception:
         pass
 
+    # Delete expired cache values
+    try:
+        await run_cache_maintenance()
+    except Exception:
+        pass
+
 
-@cli.command(help="Run scheduled cron tasks (orders expire, renewal emails).")
+@cli.command(help="Run scheduled cron tasks (orders expire, renewal emails, cache maintenance).")
 @click.argument("base_dir")
 def cron(base_dir: str):
     """
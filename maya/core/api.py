@@ -11,13 +11,25 @@ from starlette.exceptions import HTTPException
 from maya.core.api_error import raise_openaws_exception
 from maya.core.api_auth import get_auth_adapter
 from maya.core.api_request import get_auth_headers
-from maya.core.api_user import get_user_adapter
+from maya.core.api_user import get_user_adapter, invalidate_me_cache, invalidate_me_cache_user
 from maya.core import api_client
+from maya.core import request_timing
+from maya.core import single_flight
 from maya.core import user
 from maya.core.dynamic_settings import settings
 from maya.core import query
 from maya.core.logging import get_log
-from maya.core.proxy_cache import proxy_cache_get, proxy_cache_set, proxy_record_cache_key
+from maya.core.proxy_cache import (
+    PROXY_CACHE_SEARCH_EXPIRE,
+    proxy_cache_fetch,
+    proxy_cache_set,
+    get_record_tags,
+    get_resource_tag,
+    proxy_record_cache_key,
+    proxy_resource_cache_key,
+    proxy_records_cache_key,
+    search_cache_stats,
+)
 from urllib.parse import quote
 import typing
 from time import time
@@ -28,6 +40,9 @@ log = get_log()
 
 base_url = str(settings["api_base_url"])
 
+# The api only returns search results up to this position
+MAX_SEARCH_RESULTS = 10000
+
 
 def get_time_used(request: Request) -> typing.Any:
     """
@@ -39,7 +54,7 @@ def get_time_used(request: Request) -> typing.Any:
 
     total_time_request = time_end - time_begin
     time_table = {
-        "api_calls": api_client.REQUEST_TIME_USED,
+        "api_calls": request_timing.get_request_timings().get("upstream", {}),
         "total_time_request": total_time_request,
     }
 
@@ -50,7 +65,11 @@ async def auth_login_post(request: Request):
     """
     POST an email and password to the api in order to login
     """
-    return await get_auth_adapter().login(request)
+    invalidate_me_cache(request)
+    try:
+        return await get_auth_adapter().login(request)
+    finally:
+        clear_principal(request)
 
 
 async def auth_register_post(request: Request):
@@ -65,13 +84,17 @@ async def auth_verify_post(request: Request):
     POST a token to the api in order to verify an email
     """
     await get_auth_adapter().verify(request)
+    invalidate_me_cache(request)
+    clear_principal(request)
 
 
 def auth_logout(request: Request) -> None:
     """
     Clear authentication state for the active API profile.
     """
+    invalidate_me_cache(request)
     get_auth_adapter().logout(request)
+    clear_principal(request)
 
 
 async def users_me_get(request: Request) -> dict:
@@ -105,6 +128,7 @@ async def users_data_post(request: Request, id: str, data: dict):
             json_response = response.json()
             raise_openaws_exception(response.status_code, json_response)
 
+        invalidate_me_cache_user(id)
         return response.json()
 
 
@@ -220,6 +244,7 @@ async def users_patch_permissions(request: Request) -> typing.Any:
         )
 
         if response.is_success:
+            invalidate_me_cache_user(uuid)
             return response.json()
         else:
             response.raise_for_status()
@@ -263,30 +288,58 @@ async def auth_request_verify_post(request: Request) -> None:
     await get_auth_adapter().request_verify(request)
 
 
+async def get_principal(request: Request) -> user.Principal:
+    """
+    Get the current user as a Principal. It is resolved at most once per request and
+    stored in the request state. Requests without an access token in the session are
+    anonymous and never call the user adapter.
+    """
+    state = getattr(request, "state", None)
+    principal = getattr(state, "principal", None)
+    if principal is not None:
+        return principal
+
+    session = getattr(request, "session", None)
+    if session is not None and "access_token" not in session:
+        principal = user.ANONYMOUS_PRINCIPAL
+    else:
+        try:
+            me = await users_me_get(request)
+            principal = user.principal_from_me(me)
+        except Exception:
+            principal = user.ANONYMOUS_PRINCIPAL
+
+    if state is not None:
+        state.principal = principal
+    return principal
+
+
+def clear_principal(request: Request) -> None:
+    """
+    Clear the resolved user from the request state, e.g. after login or logout.
+    """
+    state = getattr(request, "state", None)
+    for name in ("principal", "me"):
+        if hasattr(state, name):
+            delattr(state, name)
+
+
 async def is_logged_in(request: Request) -> bool:
     """
     Check if the current user is logged in.
     """
-    try:
-        await users_me_get(request)
-        return True
-
-    except Exception:
-        return False
+    principal = await get_principal(request)
+    return principal.is_logged_in
 
 
 async def me_get(request: Request) -> dict:
     """
-    GET the user data if logged in. Or except and return an empty user dict.\n
+    GET the user data if logged in. Or return an empty user dict.\n
     This is used when we need to know if a user is logged in or not - wihtout\n
     raising an exception
     """
-    try:
-        me: dict = await users_me_get(request)
-        return me
-
-    except Exception:
-        return {}
+    principal = await get_principal(request)
+    return principal.me if principal.is_logged_in else {}
 
 
 async def me_permissions(request: Request) -> list[str]:
@@ -295,30 +348,21 @@ async def me_permissions(request: Request) -> list[str]:
     ['root', 'admin', 'employee', 'user', 'guest'] and\n
     ['soft_delete', 'researcher', 'hard_delete', 'read', 'update', 'create', 'restore', 'scoped_read',]
     """
-    try:
-        me = await users_me_get(request)
-        return user.permissions_from_me(me)
-    except Exception:
-        return []
+    principal = await get_principal(request)
+    return principal.permissions_list
 
 
 async def me_verified(request: Request) -> bool:
-    try:
-        me = await users_me_get(request)
-        verified = me["is_verified"]
-        if verified:
-            return True
-    except Exception:
-        pass
-    return False
+    principal = await get_principal(request)
+    return principal.is_verified
 
 
 async def has_permission(request: Request, permission: str) -> bool:
     """
     Check if the current user has a specific permission.
     """
-    user_permissions_list = await me_permissions(request)
-    return permission in user_permissions_list
+    principal = await get_principal(request)
+    return principal.has_permission(permission)
 
 
 async def proxies_record_get_by_id(request: Request, record_id: str) -> typing.Any:
@@ -328,27 +372,36 @@ async def proxies_record_get_by_id(request: Request, record_id: str) -> typing.A
 
     logged_in = await is_logged_in(request)
     cache_key = proxy_record_cache_key(record_id)
-    if not logged_in:
-        cached_record = await proxy_cache_get(cache_key)
-        if cached_record is not None:
-            return cached_record
+    url = base_url + "/proxy/records/" + record_id
 
-    async with api_client.get_async_client() as client:
-        url = base_url + "/proxy/records/" + record_id
-        headers = {"Accept": "application/json"}
-        response = await client.get(url, headers=headers)
+    async def fetch_record():
+        async with api_client.get_async_client() as client:
+            headers = {"Accept": "application/json"}
+            response = await client.get(url, headers=headers)
 
-        if response.is_success:
-            record = response.json()
-            if not logged_in:
-                await proxy_cache_set(cache_key, record)
-            return record
-        else:
+            if response.is_success:
+                record = response.json()
+                if not logged_in:
+                    await proxy_cache_set(cache_key, record, tags=get_record_tags(record_id, record))
+                return record
+            else:
 
-            if response.status_code == 404:
-                raise HTTPException(404)
+                if response.status_code == 404:
+                    raise HTTPException(404)
 
-            response.raise_for_status()
+                response.raise_for_status()
+
+    # Concurrent identical requests share a single upstream request (and a single cache write)
+    scope = "user" if logged_in else "anonymous"
+
+    async def fetch_record_once():
+        return await single_flight.run(single_flight.get_key(url, scope), fetch_record)
+
+    if logged_in:
+        return await fetch_record_once()
+
+    record, _ = await proxy_cache_fetch(cache_key, fetch_record_once)
+    return record
 
 
 def _check_query_params(query_params_before_search: list) -> list:
@@ -364,8 +417,8 @@ def _check_query_params(query_params_before_search: list) -> list:
         size_val = size[0]
         start_val = start[0]
 
-        if int(size_val) + int(start_val) > 10000:
-            max_size = 10000 - int(start_val)
+        if int(size_val) + int(start_val) > MAX_SEARCH_RESULTS:
+            max_size = MAX_SEARCH_RESULTS - int(start_val)
 
     if max_size:
         query_params_before_search = [(key, value) for key, value in query_params_before_search if key != "size"]
@@ -376,43 +429,55 @@ def _check_query_params(query_params_before_search: list) -> list:
 
 async def proxies_records(request: Request, query_params_before_search: typing.Optional[list] = None) -> typing.Any:
     """
-    GET search results from the api
-
+    GET search results from the api.
+    Results for anonymous users are cached if proxy_cache_search_expire is set.
     """
     query_params_before_search = query_params_before_search or []
     query_params_before_search = _check_query_params(query_params_before_search)
 
     query_str = query.get_str_from_list(query_params_before_search)
     query_str = quote(query_str)
+    url = base_url + "/proxy/records?params=" + query_str
 
-    async with api_client.get_async_client() as client:
-        url = base_url + "/proxy/records?params=" + query_str
-        response = await client.get(url)
-
-        if response.is_success:
-            return response.json()
-        else:
-            response.raise_for_status()
+    use_cache = await _use_search_cache(request)
+    return await _proxy_records_get(url, query_params_before_search, use_cache)
 
 
 async def proxies_get_resource(request, type: str, id: str) -> typing.Any:
     """
-    GET a resource from the api
+    GET a resource from the api. Resources are cached for anonymous users.
     """
-    async with api_client.get_async_client() as client:
-        url = base_url + f"/proxy/{type}/{id}"
-        response = await client.get(url)
+    url = base_url + f"/proxy/{type}/{id}"
+    logged_in = await is_logged_in(request)
+    cache_key = proxy_resource_cache_key(type, id)
 
-        if response.is_success:
-            json = response.json()
-            return json
+    async def fetch_resource():
+        async with api_client.get_async_client() as client:
+            response = await client.get(url)
 
-        else:
+            if response.is_success:
+                json = response.json()
+                if not logged_in:
+                    await proxy_cache_set(cache_key, json, tags=[get_resource_tag(type, id)])
+                return json
 
-            if response.status_code == 404:
-                raise HTTPException(404)
+            else:
 
-            response.raise_for_status()
+                if response.status_code == 404:
+                    raise HTTPException(404)
+
+                response.raise_for_status()
+
+    scope = "user" if logged_in else "anonymous"
+
+    async def fetch_resource_once():
+        return await single_flight.run(single_flight.get_key(url, scope), fetch_resource)
+
+    if logged_in:
+        return await fetch_resource_once()
+
+    resource, _ = await proxy_cache_fetch(cache_key, fetch_resource_once)
+    return resource
 
 
 async def proxies_get_relations(request: Request, type: str, id: str) -> typing.Any:
@@ -420,13 +485,8 @@ async def proxies_get_relations(request: Request, type: str, id: str) -> typing.
     GET relations from the api
     """
 
-    async with api_client.get_async_client() as client:
-        url = base_url + f"/proxy/{type}/{id}/relations"
-        response = await client.get(url)
-        if response.is_success:
-            return response.json()
-        else:
-            response.raise_for_status()
+    url = base_url + f"/proxy/{type}/{id}/relations"
+    return await single_flight.run(single_flight.get_key(url), lambda: _proxy_get_json(url))
 
 
 async def proxies_post_relations(request: Request):
@@ -473,15 +533,9 @@ async def proxies_records_from_list(request, query_params) -> typing.Any:
     """
     query_str = query.get_str_from_list(query_params)
     query_str = quote(query_str)
+    url = base_url + "/proxy/records?params=" + query_str
 
-    async with api_client.get_async_client() as client:
-        url = base_url + "/proxy/records?params=" + query_str
-        response = await client.get(url)
-
-        if response.is_success:
-            return response.json()
-        else:
-            response.raise_for_status()
+    return await single_flight.run(single_flight.get_key(url), lambda: _proxy_get_json(url))
 
 
 async def proxies_auto_complete(request: Request, query_params: list = []) -> typing.Any:
@@ -550,27 +604,71 @@ async def proxies_view_ids(request: Request) -> typing.Any:
 
     """
     items = request.query_params.multi_items()
-    return await proxies_view_ids_from_list(items)
+    use_cache = await _use_search_cache(request)
+    return await proxies_view_ids_from_list(items, use_cache=use_cache)
 
 
-async def proxies_view_ids_from_list(items: list) -> typing.Any:
+async def proxies_view_ids_from_list(items: list, use_cache: bool = False) -> typing.Any:
     """
-    Get all ids from the api
+    Get all ids from the api.
+    Cursor pages are cached if use_cache is True and proxy_cache_search_expire is set.
     """
     query_str = ""
     for key, value in items:
         query_str += f"{key}={value}&"
 
     query_str = quote(query_str)
+    url = base_url + "/proxy/records?params=" + query_str
 
+    records = await _proxy_records_get(url, items, use_cache)
+    records["status_code"] = 0
+    return records
+
+
+async def _use_search_cache(request: Request) -> bool:
+    """
+    Check if the search cache is enabled and the user is anonymous.
+    The login state is only resolved if the search cache is enabled.
+    """
+    if PROXY_CACHE_SEARCH_EXPIRE is None:
+        return False
+    return not await is_logged_in(request)
+
+
+async def _proxy_records_get(url: str, query_params: list, use_cache: bool) -> typing.Any:
+    """
+    GET search results or id pages from the proxy. Use the search cache if use_cache is True.
+    """
+    cache_key = proxy_records_cache_key(query_params)
+
+    async def fetch_records():
+        records = await _proxy_get_json(url)
+        if use_cache:
+            await proxy_cache_set(cache_key, records, PROXY_CACHE_SEARCH_EXPIRE)
+        return records
+
+    scope = "anonymous" if use_cache else "user"
+
+    async def fetch_records_once():
+        return await single_flight.run(single_flight.get_key(url, scope), fetch_records)
+
+    if not use_cache or PROXY_CACHE_SEARCH_EXPIRE is None:
+        return await fetch_records_once()
+
+    records, cache_status = await proxy_cache_fetch(cache_key, fetch_records_once, PROXY_CACHE_SEARCH_EXPIRE)
+    search_cache_stats.record(query_params, hit=cache_status != "miss")
+    return records
+
+
+async def _proxy_get_json(url: str) -> typing.Any:
+    """
+    GET a proxy endpoint without authentication and return the parsed JSON.
+    """
     async with api_client.get_async_client() as client:
-        url = base_url + "/proxy/records?params=" + query_str
         response = await client.get(url)
 
         if response.is_success:
-            records = response.json()
-            records["status_code"] = 0
-            return records
+            return response.json()
         else:
             response.raise_for_status()
 
@@ -4,14 +4,19 @@ Shared HTTP client and API profile helpers.
 
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from time import time
+import typing
 
 import httpx
 
 from maya.core.dynamic_settings import settings
+from maya.core import request_timing
 
-REQUEST_TIME_USED: dict = {}
+# Shared pooled client. Opened and closed in the app lifespan (one per worker).
+_shared_client: typing.Optional[httpx.AsyncClient] = None
 
 
 @dataclass(frozen=True)
@@ -49,31 +54,94 @@ async def _response_httpx_timer(response):
     set_time_used(request_name, elapsed_time)
 
 
-def get_async_client() -> httpx.AsyncClient:
+def _get_client_settings() -> dict:
     """
-    Get an async httpx client with custom events.
+    Get the api_client settings merged with the defaults.
+    """
+    client_settings = {
+        "timeout": 7,
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30,
+        "host_limits": {},
+    }
+    client_settings.update(settings.get("api_client", {}))
+    return client_settings
+
+
+def _get_limits(limit_settings: dict) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=limit_settings.get("max_connections"),
+        max_keepalive_connections=limit_settings.get("max_keepalive_connections"),
+        keepalive_expiry=limit_settings.get("keepalive_expiry"),
+    )
+
+
+def _create_async_client() -> httpx.AsyncClient:
     """
+    Create an async httpx client with custom events and connection pool limits.
+
+    Cookies are never persisted on the client, as the same client is shared between
+    the requests of different users.
+    """
+    client_settings = _get_client_settings()
+
+    # Per-host pools, e.g. {"https://aarhusiana.appspot.com": {"max_connections": 10}}
+    mounts = {}
+    for host_pattern, host_limits in client_settings["host_limits"].items():
+        limit_settings = {**client_settings, **host_limits}
+        mounts[host_pattern] = httpx.AsyncHTTPTransport(limits=_get_limits(limit_settings))
+
     return httpx.AsyncClient(
         event_hooks={"request": [_request_custom_header, _request_start_time], "response": [_response_httpx_timer]},
-        timeout=7,
+        timeout=client_settings["timeout"],
+        limits=_get_limits(client_settings),
+        mounts=mounts,
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
     )
 
 
-def set_time_used(name: str, elapsed: float) -> None:
+async def open_async_client() -> httpx.AsyncClient:
+    """
+    Open the shared pooled client. Called from the app lifespan.
     """
-    Set response time as a state on the request in order to show API call timing.
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = _create_async_client()
+    return _shared_client
+
+
+async def close_async_client() -> None:
+    """
+    Close the shared pooled client. Called from the app lifespan.
     """
-    if name not in REQUEST_TIME_USED:
-        REQUEST_TIME_USED[name] = [elapsed]
-    else:
-        REQUEST_TIME_USED[name].append(elapsed)
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
 
 
-def reset_time_used() -> None:
+@asynccontextmanager
+async def get_async_client() -> typing.AsyncIterator[httpx.AsyncClient]:
+    """
+    Get an async httpx client with custom events.
+
+    Yields the shared pooled client when the app lifespan has opened it. Outside the
+    app (CLI commands, cron, tests) a short-lived client is created and closed again.
+    """
+    if _shared_client is not None and not _shared_client.is_closed:
+        yield _shared_client
+        return
+
+    async with _create_async_client() as client:
+        yield client
+
+
+def set_time_used(name: str, elapsed: float) -> None:
     """
-    Reset API call timing for the current request lifecycle.
+    Add the response time of an API call to the timings of the current request.
     """
-    REQUEST_TIME_USED.clear()
+    request_timing.add_time("upstream", name, elapsed)
 
 
 def get_api_profile() -> ApiProfile:
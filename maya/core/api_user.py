@@ -5,12 +5,18 @@ Version-specific user adapters for the external API.
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import copy
+import hashlib
+import time
+import typing
 
 from starlette.requests import Request
 
 from maya.core.api_client import get_api_profile, get_async_client
 from maya.core.api_error import OpenAwsException
 from maya.core.api_request import get_auth_headers
+from maya.core.dynamic_settings import settings
 from maya.core.translate import translate
 
 
@@ -46,10 +52,105 @@ def get_user_adapter() -> UserAdapter:
     return V1UserAdapter(profile.base_url)
 
 
+class MeCache:
+    """
+    In-process cache of `/users/me` responses keyed by a hash of the access token.
+    Entries are also indexed by user id, so they can be invalidated when a user is
+    changed by someone else (e.g. an admin changing permissions).
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.user_keys: dict[str, set[str]] = {}
+
+    def get(self, key: str, expire_in: int) -> typing.Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        cached_at, me = entry
+        if time.monotonic() - cached_at > expire_in:
+            self.delete(key)
+            return None
+
+        return copy.deepcopy(me)
+
+    def set(self, key: str, me: dict) -> None:
+        self.delete(key)
+        self.entries[key] = (time.monotonic(), copy.deepcopy(me))
+        self.user_keys.setdefault(_get_user_id(me), set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self.delete(next(iter(self.entries)))
+
+    def delete(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        user_id = _get_user_id(entry[1])
+        keys = self.user_keys.get(user_id, set())
+        keys.discard(key)
+        if not keys:
+            self.user_keys.pop(user_id, None)
+
+    def delete_user(self, user_id: str) -> None:
+        for key in list(self.user_keys.get(str(user_id), set())):
+            self.delete(key)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.user_keys.clear()
+
+
+me_cache = MeCache()
+
+
+def _get_user_id(me: dict) -> str:
+    return str(me.get("id", ""))
+
+
+def _get_me_cache_key(request: Request) -> typing.Optional[str]:
+    session = getattr(request, "session", None) or {}
+    access_token = session.get("access_token")
+    if not access_token:
+        return None
+    return hashlib.sha256(str(access_token).encode()).hexdigest()
+
+
+def _get_me_cache_expire() -> typing.Optional[int]:
+    return settings.get("users_me_cache_expire")
+
+
+def invalidate_me_cache(request: Request) -> None:
+    """
+    Remove the cached user for the access token in the current session.
+    """
+    cache_key = _get_me_cache_key(request)
+    if cache_key:
+        me_cache.delete(cache_key)
+
+
+def invalidate_me_cache_user(user_id: str) -> None:
+    """
+    Remove all cached entries for a user, e.g. after the user's permissions are changed.
+    """
+    me_cache.delete_user(user_id)
+
+
 async def _fetch_me(request: Request, base_url: str) -> dict:
     if hasattr(request.state, "me"):
         return request.state.me
 
+    cache_key = _get_me_cache_key(request)
+    expire_in = _get_me_cache_expire()
+    if cache_key and expire_in:
+        me = me_cache.get(cache_key, expire_in)
+        if me is not None:
+            request.state.me = me
+            return me
+
     headers = get_auth_headers(request, {"Accept": "application/json"})
     url = base_url + "/users/me"
 
@@ -62,6 +163,8 @@ async def _fetch_me(request: Request, base_url: str) -> dict:
 
         if response.is_success:
             request.state.me = response.json()
+            if cache_key and expire_in:
+                me_cache.set(cache_key, request.state.me)
             return response.json()
 
     raise OpenAwsException(
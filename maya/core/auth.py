@@ -88,18 +88,17 @@ async def _check_authentication(request: Request, permissions, message, must_be_
         message = translate("You need to be logged in to view this page.")
 
     # Check if authenticated
-    is_logged_in = await api.is_logged_in(request)
-    if not is_logged_in:
+    principal = await api.get_principal(request)
+    if not principal.is_logged_in:
         _log_401_error(request, "Authentication required")
         if json_response:
             raise AuthExceptionJSON(message=message)
         raise AuthException(request, message=message, redirect_url=_get_redirect_url(request))
 
     # Check if verified user is needed
-    me = await api.users_me_get(request)
-    is_verified = await api.me_verified(request)
+    me = principal.me
 
-    if must_be_verified and not is_verified:
+    if must_be_verified and not principal.is_verified:
         _log_403_error(request, f"User {me['email']} is not verified")
         message = translate("You need to verify your email address to view this page.")
         if json_response:
@@ -110,8 +109,7 @@ async def _check_authentication(request: Request, permissions, message, must_be_
 
     # Check if user has the required permissions
     if permissions:
-        user_permissions_list = await api.me_permissions(request)
-        permission_granted = any(permission in user_permissions_list for permission in permissions)
+        permission_granted = any(principal.has_permission(permission) for permission in permissions)
 
         if not permission_granted:
             _log_403_error(request, f"User {me['email']} is missing required permissions")
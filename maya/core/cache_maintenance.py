@@ -0,0 +1,138 @@
+"""
+Maintenance of the sqlite3 cache table.
+
+Expired values are left in place on read, so without maintenance the table keeps
+growing with one row per record, resource, search, presigned URL and navigation state. A maintenance
+pass:
+
+1. Deletes expired values, per key prefix, in bounded batches.
+2. Evicts the oldest values until the table is within `max_rows` and `max_bytes`.
+
+Every batch is its own short write transaction, so requests are never blocked for long.
+The pass is run from `maya cron` and in the background of the server (see `app.py`).
+"""
+
+import asyncio
+import random
+import typing
+
+from maya.core import proxy_cache
+from maya.core.dynamic_settings import settings
+from maya.core.logging import get_log
+from maya.core.navigation_store import NAVIGATION_KEY_PREFIX, NAVIGATION_STORE_EXPIRE
+from maya.core.object_storage import PRESIGNED_URL_MAX_AGE
+from maya.database.cache import DatabaseCache
+from maya.database.crud_default import database_url
+from maya.database.utils import DatabaseConnection
+
+log = get_log()
+
+
+def get_maintenance_settings() -> dict:
+    maintenance_settings: dict = {
+        "batch_size": 1000,
+        "max_rows": 200_000,
+        "max_bytes": 500 * 1024 * 1024,
+        "interval": 60 * 60,
+    }
+    maintenance_settings.update(settings.get("cache_maintenance", {}))
+    return maintenance_settings
+
+
+def _get_max_age(expire_in: typing.Optional[int]) -> typing.Optional[int]:
+    """
+    Get the age in seconds after which a proxy cache value is never served, not even as stale.
+    None if the values never expire. 0 if the cache is disabled and all values may be deleted.
+    """
+    if expire_in is None:
+        return 0
+    if expire_in == 0:
+        return None
+    return expire_in + max(proxy_cache.PROXY_CACHE_STALE_WHILE_REVALIDATE, proxy_cache.PROXY_CACHE_STALE_IF_ERROR)
+
+
+def get_expire_rules() -> list[tuple[str, typing.Optional[int]]]:
+    """
+    Get (key prefix, max age) for every kind of value in the cache table.
+    """
+    return [
+        ("proxy_record:", _get_max_age(proxy_cache.PROXY_CACHE_EXPIRE)),
+        ("proxy_resource:", _get_max_age(proxy_cache.PROXY_CACHE_EXPIRE)),
+        ("proxy_records:", _get_max_age(proxy_cache.PROXY_CACHE_SEARCH_EXPIRE)),
+        ("boto3_", PRESIGNED_URL_MAX_AGE),
+        (NAVIGATION_KEY_PREFIX, NAVIGATION_STORE_EXPIRE),
+    ]
+
+
+async def run_cache_maintenance(max_batches: int = 1000) -> dict:
+    """
+    Delete expired values and evict the oldest values above the row and byte budget.
+    Stops after max_batches batches. Returns the number of deleted values.
+    """
+    result = {"expired": 0, "evicted": 0}
+    if not database_url:
+        return result
+
+    maintenance_settings = get_maintenance_settings()
+    batch_size = maintenance_settings["batch_size"]
+    database_connection = DatabaseConnection(database_url)
+    num_batches = 0
+
+    for key_prefix, max_age in get_expire_rules():
+        if max_age is None:
+            continue
+
+        while num_batches < max_batches:
+            async with database_connection.write_transaction_scope_async() as connection:
+                num_deleted = await DatabaseCache(connection).delete_expired_batch(key_prefix, max_age, batch_size)
+
+            num_batches += 1
+            result["expired"] += num_deleted
+            if num_deleted < batch_size:
+                break
+
+            # Let requests waiting for the writer go first
+            await asyncio.sleep(0)
+
+    async with database_connection.transaction_scope_async() as connection:
+        num_rows, num_bytes = await DatabaseCache(connection).get_size()
+
+    max_rows = maintenance_settings["max_rows"] or num_rows
+    max_bytes = maintenance_settings["max_bytes"] or num_bytes
+    while (num_rows > max_rows or num_bytes > max_bytes) and num_batches < max_batches:
+        evict_size = batch_size
+        if num_bytes <= max_bytes:
+            evict_size = min(batch_size, num_rows - max_rows)
+
+        async with database_connection.write_transaction_scope_async() as connection:
+            num_deleted, size_deleted = await DatabaseCache(connection).delete_oldest_batch(evict_size)
+
+        num_batches += 1
+        if not num_deleted:
+            break
+
+        num_rows -= num_deleted
+        num_bytes -= size_deleted
+        result["evicted"] += num_deleted
+        await asyncio.sleep(0)
+
+    log.info(f"Cache maintenance: {result['expired']} expired and {result['evicted']} evicted values deleted")
+    return result
+
+
+async def run_cache_maintenance_forever() -> None:
+    """
+    Run the cache maintenance every `interval` seconds. Each worker starts at a random
+    offset, so workers rarely run a pass at the same time.
+    """
+    interval = get_maintenance_settings()["interval"]
+    if not interval:
+        return
+
+    await asyncio.sleep(random.uniform(0, interval))
+    while True:
+        try:
+            await run_cache_maintenance()
+        except Exception:
+            log.exception("Error in cache maintenance")
+        await asyncio.sleep(interval)
@@ -29,10 +29,11 @@ async def get_context(request: Request, context_values: dict = {}, identifier: s
     hooks = get_hooks(request)
 
     # User specific context
-    is_logged_in = await api.is_logged_in(request)
-    permissions_list = await api.me_permissions(request)
-    is_verified = await api.me_verified(request)
-    is_employee = "employee" in permissions_list
+    principal = await api.get_principal(request)
+    is_logged_in = principal.is_logged_in
+    permissions_list = principal.permissions_list
+    is_verified = principal.is_verified
+    is_employee = principal.has_permission("employee")
 
     # search_query_str is used to display the last search query
     # it is e.g. present in the context_values if the request url is the search page
@@ -0,0 +1,136 @@
+"""
+ETags and conditional GET for rendered pages of anonymous visitors.
+
+For anonymous visitors a record, resource or search page is a function of the upstream
+payload, the templates and the input of the page (see `page_cache.get_key`). The strong
+ETag is a hash of all three, so it is computed before the page is normalized and rendered:
+
+    headers = etag.get_headers(request, record, last_modified=record.get("last_updated"))
+    if etag.is_not_modified(request, headers):
+        return etag.get_not_modified_response(headers)
+
+    return templates.TemplateResponse(request, "records/record.html", context, headers=headers)
+
+Pages with an ETag are sent with `Cache-Control: no-cache`, so browsers store them but
+always revalidate. `Last-Modified` is sent where upstream provides a timestamp. It is not
+used to answer requests, as the page also changes when the templates change.
+"""
+
+import dataclasses
+import datetime
+import email.utils
+import hashlib
+import json
+import os
+import typing
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+
+from maya.core.dynamic_settings import settings
+from maya.core import page_cache
+from maya.core.templates import template_dirs
+
+ETAG_ENABLED: bool = settings.get("etag_enabled", True)
+
+# Headers sent with a 304 response. They are the headers a client updates its stored response with
+NOT_MODIFIED_HEADERS = ("etag", "last-modified", "cache-control", "vary")
+
+
+def _get_template_version() -> str:
+    """
+    Get a hash of the version and the path, size and modification time of all templates.
+    It changes when the templates are deployed.
+    """
+    template_hash = hashlib.sha256(str(settings.get("version")).encode())
+    for template_dir in template_dirs:
+        for root, dirs, files in os.walk(template_dir):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                stat = os.stat(path)
+                template_hash.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return template_hash.hexdigest()
+
+
+template_version = _get_template_version()
+
+
+def _default(value: typing.Any) -> typing.Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    return str(value)
+
+
+def get_etag(request: Request, *payloads: typing.Any) -> str:
+    """
+    Get a strong ETag from the upstream payloads of a page, the templates and the input of the page.
+    """
+    payload_json = json.dumps(payloads, sort_keys=True, separators=(",", ":"), default=_default)
+    etag_hash = hashlib.sha256()
+    for part in (page_cache.get_key(request), template_version, payload_json):
+        etag_hash.update(part.encode())
+        etag_hash.update(b"\0")
+
+    return f'"{etag_hash.hexdigest()[:32]}"'
+
+
+def get_last_modified(timestamp: typing.Any) -> typing.Optional[str]:
+    """
+    Get a Last-Modified value from an ISO 8601 timestamp, e.g. "2019-05-09T11:38:26.571000".
+    Timestamps without a timezone are UTC. None if the timestamp can not be parsed.
+    """
+    if not isinstance(timestamp, str) or not timestamp:
+        return None
+
+    try:
+        date_time = datetime.datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+
+    if date_time.tzinfo is None:
+        date_time = date_time.replace(tzinfo=datetime.timezone.utc)
+
+    return email.utils.format_datetime(date_time.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def get_headers(request: Request, *payloads: typing.Any, last_modified: typing.Any = None) -> dict[str, str]:
+    """
+    Get the validator headers of a page. Empty if the page is private or ETags are disabled.
+    """
+    if not ETAG_ENABLED or request.method != "GET" or page_cache.has_private_session(request):
+        return {}
+
+    headers = {"ETag": get_etag(request, *payloads), "Cache-Control": "no-cache"}
+    last_modified_value = get_last_modified(last_modified)
+    if last_modified_value:
+        headers["Last-Modified"] = last_modified_value
+
+    return headers
+
+
+def is_not_modified(request: Request, headers: typing.Mapping[str, str]) -> bool:
+    """
+    Check if the If-None-Match header of the request matches the ETag in headers.
+    """
+    etag = Headers(headers).get("etag")
+    if_none_match = request.headers.get("if-none-match")
+    if not etag or not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison
+    etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in etags
+
+
+def get_not_modified_response(headers: typing.Mapping[str, str]) -> Response:
+    """
+    Get a 304 response with the validator and cache headers in headers.
+    """
+    not_modified_headers = {key: value for key, value in Headers(headers).items() if key in NOT_MODIFIED_HEADERS}
+    return Response(status_code=304, headers=not_modified_headers)
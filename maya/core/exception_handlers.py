@@ -12,13 +12,14 @@ and providing relevant context to the frontend or API client.
 """
 
 from starlette.exceptions import HTTPException
-from starlette.responses import RedirectResponse, JSONResponse
+from starlette.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from starlette.requests import Request
 from maya.core.templates import templates
 from maya.core.context import get_context
 from maya.core.translate import translate
 from maya.core.logging import get_log
 from maya.core.logging_context import get_request_client_ip
+from maya.core.paths import STATIC_PATH_PREFIX
 from maya.core import flash
 from maya.core.auth import AuthException, AuthExceptionJSON
 from httpx import HTTPStatusError, TimeoutException
@@ -49,6 +50,11 @@ async def not_found(request: Request, exc: HTTPException):
             "error_url": str(request.url),
         },
     )
+
+    # Static files are served without session, so there is no context for an error page
+    if request.url.path.startswith(STATIC_PATH_PREFIX):
+        return PlainTextResponse("Not Found", status_code=404)
+
     context = await get_context(request, context_values=context_values)
     return templates.TemplateResponse(request, "errors/default.html", context, status_code=404)
 
@@ -77,6 +77,7 @@ class JsonFormatter(logging.Formatter):
             "error_url": "error_url",
             "exception": "exception",
             "message": "message",
+            "timing": "timing",
         }
 
         for attr, log_key in extra_fields.items():
@@ -13,46 +13,64 @@ enhances the request/response lifecycle by adding features such as:
 - Access logging for auditing
 - GZip compression for efficient payload delivery
 
+All custom middleware is pure ASGI. Responses are altered by wrapping `send` and
+changing the headers of the `http.response.start` message, so no extra task is
+started and the body is not streamed through the middleware.
+
 Custom Middleware:
-- RequestBeginMiddleware: Records the start time of a request to track performance.
-- StaticPathSkippingMiddleware: Bypasses unnecessary logic for static file requests.
-- ResponseTimeLoggingMiddleware: Logs the time used for request handling.
-- NoCacheMiddleware: Controls caching behavior based on URL patterns.
-- BeforeResponseMiddleware: Applies custom logic to the response before it is sent.
 - AccessLogMiddleware: Logs detailed access information for each request.
+- ConcurrencyLimitMiddleware: Rejects requests exceeding the configured concurrency limits.
+- ResponseHeadersMiddleware: Sets the request start time and CSP nonce, and sends the
+  Server-Timing, Content-Security-Policy and Cache-Control headers in one pass.
+- SameOriginMiddleware: Rejects state-changing requests from other origins.
+- StaticPathSkippingMiddleware: Bypasses a wrapped middleware for static file requests.
+- PageCacheMiddleware: Serves rendered pages for anonymous users from the page cache.
+- BeforeResponseMiddleware: Applies custom logic to the response before it is sent.
 
 Third-party Middleware:
 - CORSMiddleware: Manages Cross-Origin Resource Sharing (CORS) policies.
 - SessionMiddleware: Manages user sessions using secure cookies.
-- SessionAutoloadMiddleware: Automatically loads session data on specified paths.
 - GZipMiddleware: Compresses responses using GZip to reduce payload size.
 
+Static files skip everything but access logging, concurrency limits, CORS, GZip and
+their Cache-Control header.
+
 The middleware list is assembled dynamically based on application settings.
 """
 
 import asyncio
-import json
 import os
-from time import time
+from time import monotonic, perf_counter, time
 
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from maya.core.dynamic_settings import settings
 from maya.core.logging import get_log, get_access_log
 from maya.core.logging_context import get_request_client_ip, reset_client_ip, set_client_ip
-from maya.core import api, api_client
+from maya.core.paths import STATIC_PATH_PREFIX
+from maya.core import proxy_cache
+from maya.core import page_cache
+from maya.core import etag
+from maya.core import request_timing
 from maya.core.hooks import get_hooks
 from maya.core.api_error import OpenAwsException
 from maya.settings_types import ConcurrencyLimitSettings
-from starlette.responses import JSONResponse, PlainTextResponse
 
 log = get_log()
 access_log = get_access_log()
 
+STATE_CHANGING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def _is_static(scope: Scope) -> bool:
+    return scope["path"].startswith(STATIC_PATH_PREFIX)
+
 
 class _ConcurrencyLimitRule:
     def __init__(self, config: ConcurrencyLimitSettings):
@@ -85,7 +103,7 @@ class _ConcurrencyLimitRule:
         return self._matches_any(path, self.paths) and not self._matches_any(path, self.exclude_paths)
 
 
-class ConcurrencyLimitMiddleware(BaseHTTPMiddleware):
+class ConcurrencyLimitMiddleware:
     """
     Apply independent, overlapping concurrency limits within this process.
 
@@ -95,8 +113,8 @@ class ConcurrencyLimitMiddleware(BaseHTTPMiddleware):
     exhausted.
     """
 
-    def __init__(self, app, limits: list[ConcurrencyLimitSettings]):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, limits: list[ConcurrencyLimitSettings]):
+        self.app = app
 
         if not limits:
             raise ValueError("limits must contain at least one concurrency limit")
@@ -104,233 +122,396 @@ class ConcurrencyLimitMiddleware(BaseHTTPMiddleware):
         self._limits = [_ConcurrencyLimitRule(config) for config in limits]
         self._counter_lock = asyncio.Lock()
 
-    async def dispatch(self, request: Request, call_next):
-        matching_limits = [limit for limit in self._limits if limit.matches(request.url.path)]
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        matching_limits = [limit for limit in self._limits if limit.matches(scope["path"])]
         if not matching_limits:
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
 
         async with self._counter_lock:
             exhausted_limits = [limit for limit in matching_limits if limit.active_requests >= limit.max_concurrency]
-            if exhausted_limits:
-                return PlainTextResponse(
-                    "Too Many Requests",
-                    status_code=429,
-                    headers={
-                        "Retry-After": str(max(limit.retry_after for limit in exhausted_limits)),
-                        "Cache-Control": "no-store",
-                    },
-                )
-
-            for limit in matching_limits:
-                limit.active_requests += 1
+            if not exhausted_limits:
+                for limit in matching_limits:
+                    limit.active_requests += 1
+
+        if exhausted_limits:
+            response = PlainTextResponse(
+                "Too Many Requests",
+                status_code=429,
+                headers={
+                    "Retry-After": str(max(limit.retry_after for limit in exhausted_limits)),
+                    "Cache-Control": "no-store",
+                },
+            )
+            await response(scope, receive, send)
+            return
 
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send)
         finally:
             async with self._counter_lock:
                 for limit in matching_limits:
                     limit.active_requests -= 1
 
 
-class RequestBeginMiddleware(BaseHTTPMiddleware):
+def _get_csp_policy(nonce: str) -> str:
+    asset_src = [
+        "'self'",
+        "data:",
+        "https://storage.googleapis.com",
+        "https://acastorage.blob.core.windows.net",
+        "https://nbg1.your-objectstorage.com",
+    ]
+
+    return (
+        "default-src 'self'; "
+        f"script-src 'self' 'nonce-{nonce}'; "
+        f"script-src-elem 'self' 'nonce-{nonce}'; "
+        "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
+        f"img-src {' '.join(asset_src)}; "
+        f"media-src {' '.join(asset_src)}; "
+        "font-src 'self' https://fonts.gstatic.com; "
+        "connect-src 'self' https://analytics.aarhusstadsarkiv.dk;"
+    )
+
+
+def _set_cache_control(path: str, headers: MutableHeaders) -> None:
     """
-    Used to set time_begin on request state in order to calculate time used on request
+    Control caching behavior based on URL patterns
     """
 
-    async def dispatch(self, request: Request, call_next):
-        """
-        Set time_begin on request state and add token to response header
-        """
-        request.state.time_begin = time()
-        response = await call_next(request)
+    # cache static files for 1 year. There should be versioning on the static files
+    # so they will be reloaded when version is changed
+    if path.startswith(STATIC_PATH_PREFIX):
+        headers["Cache-Control"] = "public, max-age=31536000"
+        return
+
+    # Pages with an ETag set their own Cache-Control, so they are revalidated
+    if "etag" in headers:
+        return
 
-        return response
+    ignore_paths = ["/records", "/search"]
+    for ignore_path in ignore_paths:
+        if path.startswith(ignore_path):
+            # Default cache. No cache directives are sent, so the browser
+            # will cache the response as it sees fit.
+            return
 
+    # Ensure no cache. Do not store any part of the response in the cache
+    # Will force the browser to always request a new version of the page
+    headers["Cache-Control"] = "no-store"
 
-class ApiLogMiddleware(BaseHTTPMiddleware):
+
+class ResponseHeadersMiddleware:
     """
-    Logs time spent on all API calls made during the request
+    Set the request state and the response headers in one pass.
+
+    - time_begin is set on the request state in order to calculate time used on request
+    - request-scoped timings (upstream calls, cache lookups, normalization and template render)
+      are sent as a Server-Timing header and logged if log_api_calls is set. Responses built
+      from stale proxy cache entries are marked with the X-Proxy-Cache header.
+    - a CSP nonce is set on the request state for use in templates and sent in the
+      Content-Security-Policy header
+    - Cache-Control is set based on URL patterns
+
+    Static files only get the Cache-Control header.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # ignore /static
-        path = request.url.path
-        if path.startswith("/static"):
-            return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        total_response_time = api.get_time_used(request)
-        log.debug(json.dumps(total_response_time, indent=4, ensure_ascii=False))
-        api_client.reset_time_used()
-        return response
+        path = scope["path"]
+        if _is_static(scope):
 
+            async def send_static(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    _set_cache_control(path, MutableHeaders(scope=message))
+                await send(message)
 
-class NoCacheMiddleware(BaseHTTPMiddleware):
-    """
-    Control caching behavior based on URL patterns
+            await self.app(scope, receive, send_static)
+            return
+
+        state = scope.setdefault("state", {})
+        state["time_begin"] = time()
+        state["csp_nonce"] = os.urandom(16).hex()
+
+        timing_token = request_timing.start_request_timing()
+        stale_token = proxy_cache.start_stale_tracking()
+        time_begin = perf_counter()
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                self._set_headers(scope, message, perf_counter() - time_begin)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            proxy_cache.reset_stale_tracking(stale_token)
+            request_timing.reset_request_timing(timing_token)
+
+    def _set_headers(self, scope: Scope, message: Message, total: float) -> None:
+        headers = MutableHeaders(scope=message)
+        path = scope["path"]
+        status_code = message["status"]
+
+        timings = request_timing.get_request_timings()
+        if settings.get("server_timing_header", True):
+            headers["Server-Timing"] = request_timing.get_server_timing_header(timings, total)
+
+        if proxy_cache.get_stale_keys():
+            headers[proxy_cache.STALE_HEADER] = "stale"
+
+        if settings["log_api_calls"]:
+            timing = {
+                "method": scope["method"],
+                "path": path,
+                "status_code": status_code,
+                "total": total,
+                "summary": request_timing.get_timing_summary(timings),
+                "api_calls": timings.get("upstream", {}),
+            }
+            log.info(f"Request timing: {scope['method']} {path} {total:.4f}s", extra={"timing": timing})
+
+        # A 304 updates the headers of the stored page, which uses the nonce it was rendered with.
+        # The nonce is read from the state, as a page from the page cache has its own nonce
+        if status_code != 304:
+            headers["Content-Security-Policy"] = _get_csp_policy(scope["state"]["csp_nonce"])
+
+        _set_cache_control(path, headers)
+
+
+class StaticPathSkippingMiddleware:
     """
+    Wrap a middleware, so it is skipped for static file requests. E.g.
 
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
+    Middleware(StaticPathSkippingMiddleware, middleware=Middleware(SessionMiddleware, secret_key="secret"))
+    """
 
-        path = request.url.path
-        ignore_paths = ["/records", "/search"]
-        for ignore_path in ignore_paths:
-            if path.startswith(ignore_path):
-                # Default cache. No cache directives are sent, so the browser
-                # will cache the response as it sees fit.
-                return response
+    def __init__(self, app: ASGIApp, middleware: Middleware):
+        self.app = app
+        middleware_class, args, kwargs = middleware
+        self.wrapped_app = middleware_class(app, *args, **kwargs)
 
-        # cache static files for 1 year. There should be versioning on the static files
-        # so they will be reloaded when version is changed
-        if path.startswith("/static"):
-            response.headers["Cache-Control"] = "public, max-age=31536000"
-            return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and _is_static(scope):
+            await self.app(scope, receive, send)
+            return
 
-        # Ensure no cache. Do not store any part of the response in the cache
-        # Will force the browser to always request a new version of the page
-        response.headers["Cache-Control"] = "no-store"
-        return response
+        await self.wrapped_app(scope, receive, send)
 
 
-class CSPMiddleware(BaseHTTPMiddleware):
+class PageCacheMiddleware:
     """
-    Content Security Policy middleware.
-    Adds a Content-Security-Policy header to each response.
+    Serve rendered pages for anonymous users from the page cache and store cacheable
+    responses. It is placed outside GZipMiddleware, so bodies are stored gzipped.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # Set nonce on request state for use in templates
-        nonce = os.urandom(16).hex()
-        request.state.csp_nonce = nonce
-
-        response = await call_next(request)
-
-        asset_src = [
-            "'self'",
-            "data:",
-            "https://storage.googleapis.com",
-            "https://acastorage.blob.core.windows.net",
-            "https://nbg1.your-objectstorage.com",
-        ]
-
-        csp_policy = (
-            "default-src 'self'; "
-            f"script-src 'self' 'nonce-{nonce}'; "
-            f"script-src-elem 'self' 'nonce-{nonce}'; "
-            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
-            f"img-src {' '.join(asset_src)}; "
-            f"media-src {' '.join(asset_src)}; "
-            "font-src 'self' https://fonts.gstatic.com; "
-            "connect-src 'self' https://analytics.aarhusstadsarkiv.dk;"
-        )
-
-        response.headers["Content-Security-Policy"] = csp_policy
-        return response
-
-
-class BeforeResponseMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _is_static(scope):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        expire = page_cache.get_expire(request)
+        if expire is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = page_cache.get_key(request)
+        cached_page = page_cache.page_cache.get(key)
+        if cached_page is not None:
+            # The cached body uses the nonce of the request it was rendered for
+            request.state.csp_nonce = cached_page.csp_nonce
+            response = cached_page.to_response()
+            if etag.is_not_modified(request, response.headers):
+                response = etag.get_not_modified_response(response.headers)
+            response.headers[page_cache.PAGE_CACHE_HEADER] = "hit"
+            await response(scope, receive, send)
+            return
+
+        response_start: Message | None = None
+        body_chunks: list[bytes] = []
+
+        async def send_to_cache(message: Message) -> None:
+            nonlocal response_start
+            if message["type"] == "http.response.start":
+                if page_cache.is_cacheable_response(message["status"], Headers(raw=message["headers"])):
+                    # Hold back the response until the body is complete
+                    response_start = message
+                    return
+
+            if response_start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            cached_page = page_cache.CachedPage(
+                status_code=response_start["status"],
+                raw_headers=list(response_start["headers"]),
+                body=b"".join(body_chunks),
+                csp_nonce=getattr(request.state, "csp_nonce", None),
+                expires_at=monotonic() + expire,
+            )
+            page_cache.page_cache.set(key, cached_page)
+
+            response = cached_page.to_response()
+            response.headers[page_cache.PAGE_CACHE_HEADER] = "miss"
+            await send({"type": "http.response.start", "status": response.status_code, "headers": response.raw_headers})
+            await send({"type": "http.response.body", "body": response.body})
+
+        await self.app(scope, receive, send_to_cache)
+
+
+class BeforeResponseMiddleware:
     """
-    Apply before_response hooks to the response before sending it to the client
+    Apply before_response hooks to the response before sending it to the client.
+    The hooks get a response with the status code and headers. The body is already streaming.
     """
 
-    async def dispatch(self, request, call_next):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _is_static(scope):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_after_hooks(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response = Response(status_code=message["status"])
+                response.raw_headers = list(message["headers"])
+
+                hooks = get_hooks(Request(scope))
+                response = await hooks.before_response(response)
+                message = {**message, "status": response.status_code, "headers": response.raw_headers}
 
-        response = await call_next(request)
-        hooks = get_hooks(request)
-        response = await hooks.before_response(response)
-        return response
+            await send(message)
 
+        await self.app(scope, receive, send_after_hooks)
 
-class AccessLogMiddleware(BaseHTTPMiddleware):
+
+class AccessLogMiddleware:
     """
     Log all access information for each request
     """
 
-    async def dispatch(self, request, call_next):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
         # Generate logging info from request
-        method = request.method
-        path = request.url.path
-        query_string = request.url.query
+        method = scope["method"]
+        path = scope["path"]
+        query_string = scope.get("query_string", b"").decode("latin-1")
         if query_string:
             query_string = f"?{query_string}"
-        user_agent = request.headers.get("user-agent", "-")
+        user_agent = Headers(scope=scope).get("user-agent", "-")
 
-        if request.client:
-            client_ip = request.client.host
-            client_port = request.client.port
+        client = scope.get("client")
+        if client:
+            client_ip, client_port = client[0], client[1]
         else:
             client_ip = "unknown"
             client_port = "unknown"
 
+        status_code = None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
         client_ip_token = set_client_ip(client_ip)
         try:
             start_time = time()
 
-            # Process the request and get the response
-            response = await call_next(request)
+            # Process the request and send the response
+            await self.app(scope, receive, send_with_status)
 
-            # Log response details after it's processed
-            status_code = response.status_code
+            # Log response details after it's sent
             duration = time() - start_time
 
             # Log the access information to access.log, including client IP and port
             access_log.info(
                 f'{client_ip}:{client_port} - "{method} {path}{query_string}" ' f'{status_code} {duration:.4f}s ua="{user_agent}'
             )
-
-            return response
         finally:
             reset_client_ip(client_ip_token)
 
 
-class SameOriginMiddleware(BaseHTTPMiddleware):
+class SameOriginMiddleware:
     """
     Control same-origin policy for state-changing requests
     """
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         allowed_origins: list | None = None,
         allow_same_origin: bool = True,
         exempt_path_prefixes: list | None = None,
     ):
-        super().__init__(app)
+        self.app = app
         self.allowed_origins = allowed_origins or []
         self.allow_same_origin = allow_same_origin
         self.exempt_path_prefixes = exempt_path_prefixes or []
 
-    async def dispatch(self, request: Request, call_next):
-        if request.method in {"POST", "PUT", "PATCH", "DELETE"}:
-            if any(request.url.path.startswith(prefix) for prefix in self.exempt_path_prefixes):
-                return await call_next(request)
-
-            origin = request.headers.get("origin")
-
-            try:
-                if not origin or origin == "null":
-                    raise OpenAwsException(403, "Forbidden. Bad Origin.")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in STATE_CHANGING_METHODS:
+            await self.app(scope, receive, send)
+            return
 
-                allowed = set(self.allowed_origins)
-                if self.allow_same_origin:
-                    same_origin = f"{request.url.scheme}://{request.url.netloc}"
-                    allowed.add(same_origin)
+        if any(scope["path"].startswith(prefix) for prefix in self.exempt_path_prefixes):
+            await self.app(scope, receive, send)
+            return
 
-                if origin not in allowed:
-                    raise OpenAwsException(403, "Forbidden. Bad Origin.")
-            except OpenAwsException as exc:
-                extra = {
-                    "client_ip": get_request_client_ip(request),
-                    "error_code": exc.status_code,
-                    "error_url": str(request.url),
-                }
-                log.exception(f"Forbidden request from origin: {origin}", extra=extra)
-                return JSONResponse({"error": True, "message": exc.message}, status_code=exc.status_code)
+        request = Request(scope)
+        origin = request.headers.get("origin")
 
-        return await call_next(request)
+        try:
+            if not origin or origin == "null":
+                raise OpenAwsException(403, "Forbidden. Bad Origin.")
+
+            allowed = set(self.allowed_origins)
+            if self.allow_same_origin:
+                same_origin = f"{request.url.scheme}://{request.url.netloc}"
+                allowed.add(same_origin)
+
+            if origin not in allowed:
+                raise OpenAwsException(403, "Forbidden. Bad Origin.")
+        except OpenAwsException as exc:
+            extra = {
+                "client_ip": get_request_client_ip(request),
+                "error_code": exc.status_code,
+                "error_url": str(request.url),
+            }
+            log.exception(f"Forbidden request from origin: {origin}", extra=extra)
+            response = JSONResponse({"error": True, "message": exc.message}, status_code=exc.status_code)
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
 
 
 middleware = []
@@ -342,18 +523,12 @@ middleware.append(
         limits=settings["concurrency_limits"],
     )
 )
-middleware.append(Middleware(RequestBeginMiddleware))
-
-if settings["log_api_calls"]:
-    middleware.append(Middleware(ApiLogMiddleware))
-
-middleware.append(Middleware(GZipMiddleware))
 
 # Indicate what domains the client browser should permit reading responses from. E.g. using fetch API calls
 middleware.append(Middleware(CORSMiddleware, allow_origins=settings["cors_allow_origins"]))
 
-# Instruct what resources and connections the client browser should permit
-middleware.append(Middleware(CSPMiddleware))
+# Request start time, request timings, Content-Security-Policy and Cache-Control
+middleware.append(Middleware(ResponseHeadersMiddleware))
 
 # Instruct what origins the client browser should permit for state-changing requests
 middleware.append(
@@ -365,7 +540,7 @@ middleware.append(
     )
 )
 
-# Session management with secure cookies
+# Session management with secure cookies. Static files do not use the session
 secret_key = str(os.getenv("SECRET"))
 session_cookie = settings["cookie"]["name"]  # type: ignore
 lifetime = settings["cookie"]["lifetime"]  # type: ignore
@@ -374,13 +549,20 @@ same_site = settings["cookie"]["samesite"]  # type: ignore
 
 middleware.append(
     Middleware(
-        SessionMiddleware,
-        session_cookie=session_cookie,
-        secret_key=secret_key,
-        https_only=cookie_httponly,
-        max_age=lifetime,
-        same_site=same_site,
+        StaticPathSkippingMiddleware,
+        middleware=Middleware(
+            SessionMiddleware,
+            session_cookie=session_cookie,
+            secret_key=secret_key,
+            https_only=cookie_httponly,
+            max_age=lifetime,
+            same_site=same_site,
+        ),
     )
 )
+
+# Rendered pages for anonymous users. Outside GZipMiddleware, so pages are stored gzipped
+middleware.append(Middleware(PageCacheMiddleware))
+middleware.append(Middleware(GZipMiddleware))
+
 middleware.append(Middleware(BeforeResponseMiddleware))
-middleware.append(Middleware(NoCacheMiddleware))
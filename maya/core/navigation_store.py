@@ -0,0 +1,107 @@
+"""
+Server-side store for the record navigation state of a visitor.
+
+The state of the last search page (query params, start, size, total and record ids) is
+used for prev/next navigation on the record page. It is kept out of the signed session
+cookie, so the cookie does not grow with up to 1000 record ids and is not re-signed and
+sent with every request. The session only holds a short opaque token, e.g.
+
+    request.session["navigation_token"] = "f1Qk7yL0bW2a"
+
+The state is written lazily by the record page, when it is opened with a search and the
+id window around the record has to be fetched. A search page does not write it, so
+anonymous visitors and crawlers that only browse search pages get no token and cause
+no write.
+
+The state is kept in a bounded in-memory LRU cache in front of the sqlite3 cache table,
+so it is shared by all workers and survives a restart.
+"""
+
+import secrets
+import time
+import typing
+
+from starlette.requests import Request
+
+from maya.core.dynamic_settings import settings
+from maya.core.logging import get_log
+from maya.database.cache import MemoryCache, TieredCache, dumps
+from maya.database.crud_default import database_url
+from maya.database.utils import DatabaseConnection
+
+log = get_log()
+
+NAVIGATION_TOKEN_SESSION_KEY = "navigation_token"
+NAVIGATION_KEY_PREFIX = "navigation:"
+
+# Seconds the navigation state is kept after it is stored
+NAVIGATION_STORE_EXPIRE: int = settings.get("navigation_store_expire", 60 * 60 * 24)
+
+_memory_cache_settings: dict = {"max_entries": 10000, "max_bytes": 50 * 1024 * 1024, "max_age": 60}
+_memory_cache_settings.update(settings.get("navigation_store_memory", {}))
+if not database_url:
+    # Memory is the only tier
+    _memory_cache_settings["max_age"] = 0
+memory_cache = MemoryCache(**_memory_cache_settings)
+navigation_store = TieredCache(DatabaseConnection(database_url), memory_cache)
+
+
+def get_navigation_token(request: Request, create: bool = False) -> typing.Optional[str]:
+    """
+    Get the navigation token of the session. A new token is added to the session if create is True.
+    """
+    token = request.session.get(NAVIGATION_TOKEN_SESSION_KEY)
+    if isinstance(token, str) and token:
+        return token
+
+    if not create:
+        return None
+
+    token = secrets.token_urlsafe(9)
+    request.session[NAVIGATION_TOKEN_SESSION_KEY] = token
+    return token
+
+
+def _get_key(token: str) -> str:
+    return f"{NAVIGATION_KEY_PREFIX}{token}"
+
+
+async def get_navigation_state(request: Request) -> typing.Optional[dict]:
+    """
+    Get the navigation state of the session. None if there is no state or it is expired.
+    """
+    token = get_navigation_token(request)
+    if not token:
+        return None
+
+    key = _get_key(token)
+    if not database_url:
+        return memory_cache.get(key, NAVIGATION_STORE_EXPIRE)
+
+    try:
+        return await navigation_store.get(key, NAVIGATION_STORE_EXPIRE)
+    except Exception:
+        log.exception("Error reading navigation state")
+        return None
+
+
+async def set_navigation_state(request: Request, state: dict) -> None:
+    """
+    Set the navigation state of the session. Nothing is written if the state is unchanged.
+    """
+    # Remove the state stored in the session cookie by earlier versions
+    request.session.pop("record_navigation_cache", None)
+
+    key = _get_key(typing.cast(str, get_navigation_token(request, create=True)))
+    json_data = dumps(state)
+    if memory_cache.get_raw(key, NAVIGATION_STORE_EXPIRE) == json_data:
+        return
+
+    if not database_url:
+        memory_cache.set_raw(key, json_data, int(time.time()))
+        return
+
+    try:
+        await navigation_store.set(key, state)
+    except Exception:
+        log.exception("Error writing navigation state")
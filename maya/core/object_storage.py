@@ -1,104 +1,156 @@
 from maya.core.logging import get_log
 from maya.database.crud_default import database_url
 from maya.database.utils import DatabaseConnection
-from maya.database.cache import DatabaseCache
+from maya.database.cache import DatabaseCache, MemoryCache, is_expired
+import asyncio
+import json
 import os
+import threading
+import time
+import typing
 import boto3
 
 AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 BOTO3_EXPIRE = 3600
+PRESIGN_URL_PREFIX = "https://nbg1.your-objectstorage.com/"
+
+# Pre-signed URLs are used until this many seconds before they expire
+BOTO3_EXPIRE_MARGIN = 300
+PRESIGNED_URL_MAX_AGE = BOTO3_EXPIRE - BOTO3_EXPIRE_MARGIN
+
+# Max number of URLs signed at the same time for a single batch
+PRESIGN_CONCURRENCY = 8
 
 log = get_log()
 
+# Pre-signed URLs memoized in this process
+presigned_url_memo = MemoryCache(max_entries=20000, max_bytes=20 * 1024 * 1024)
 
-async def set_presigned_urls_search(search_result: dict) -> dict:
+_s3_client = None
+_s3_client_lock = threading.Lock()
 
-    # Get thumbnail URL
-    thumbnail_url = search_result.get("thumbnail", "")
-    if thumbnail_url:
-        thumbnail_url = await _get_presigned_url(thumbnail_url)
-        search_result["thumbnail"] = thumbnail_url
 
-    portrait = search_result.get("portrait", "")
-    if portrait:
-        portrait = await _get_presigned_url(portrait)
-        search_result["portrait"] = portrait
+async def set_presigned_urls_search_results(search_results: list) -> list:
+    """
+    Set pre-signed URLs for all results on a search page using a single cache batch.
+    """
+    url_slots = []
+    for search_result in search_results:
+        url_slots.extend(_get_url_slots_search(search_result))
 
-    return search_result
+    await _set_presigned_urls(url_slots)
+    return search_results
 
 
 async def set_presigned_urls_record(record: dict) -> dict:
-    # Get thumbnail URL
-    thumbnail_url = record.get("thumbnail", "")
-    if thumbnail_url:
-        thumbnail_url = await _get_presigned_url(thumbnail_url)
-        record["thumbnail"] = thumbnail_url
-
-    # portrait
-    portrait = record.get("portrait", "")
-    if portrait:
-        portrait = await _get_presigned_url(portrait)
-        record["portrait"] = portrait
+    url_slots = _get_url_slots_search(record)
 
     if "representations" in record:
         representations = record["representations"]
         for key in ["full_image", "large_image", "record_image", "video", "audio", "web_document_url"]:
             if key in representations:
-                representations[key] = await _get_presigned_url(representations[key])
+                url_slots.append((representations, key))
+
+    await _set_presigned_urls(url_slots)
     return record
 
 
 async def set_presigned_urls_resource(resource: dict) -> dict:
+    url_slots: list = []
 
     # Get thumbnail URL
-    thumbnail_url = resource.get("thumbnail", "")
-    if thumbnail_url:
-        thumbnail_url = await _get_presigned_url(thumbnail_url)
-        resource["thumbnail"] = thumbnail_url
-
-    # portrait is a list of URLs
-    portrait = resource.get("portrait", "")
-    if portrait:
-        for i in range(len(portrait)):
-            portrait[i] = await _get_presigned_url(portrait[i])
-
-    # highlights is a list of URLs
-    if "highlights" in resource:
-        highlights = resource["highlights"]
-        for i in range(len(highlights)):
-            highlights[i] = await _get_presigned_url(highlights[i])
+    if resource.get("thumbnail", ""):
+        url_slots.append((resource, "thumbnail"))
 
+    # portrait and highlights are lists of URLs
+    for key in ["portrait", "highlights"]:
+        urls = resource.get(key) or []
+        url_slots.extend((urls, i) for i in range(len(urls)))
+
+    await _set_presigned_urls(url_slots)
     return resource
 
 
-async def _get_presigned_url(url: str):
+def _get_url_slots_search(search_result: dict) -> list:
+    """
+    Get (container, key) pairs for the thumbnail and the portrait URL.
+    """
+    return [(search_result, key) for key in ["thumbnail", "portrait"] if search_result.get(key, "")]
+
+
+async def _set_presigned_urls(url_slots: list) -> None:
+    """
+    Replace the URLs in the (container, key) pairs with pre-signed URLs.
+    """
+    if not url_slots:
+        return
 
-    # Check if URL shoud be generated
-    if not url.startswith("https://nbg1.your-objectstorage.com/"):
-        return url
+    presigned_urls = await _get_presigned_urls([container[key] for container, key in url_slots])
+    for container, key in url_slots:
+        container[key] = presigned_urls.get(container[key], container[key])
 
-    cache_key = f"boto3_{url}"
+
+async def _get_presigned_urls(urls: list) -> dict:
+    """
+    Get pre-signed URLs for many URLs. URLs are looked up in the memo, then in the cache
+    table with a single read query. New URLs are stored with a single upsert.
+    URLs that should not be signed are left out.
+    """
+
+    # Check which URLs shoud be generated
+    urls = list(dict.fromkeys(url for url in urls if isinstance(url, str) and url.startswith(PRESIGN_URL_PREFIX)))
+    if not urls:
+        return {}
+
+    presigned_urls = {}
+    for url in urls:
+        memoized_url = presigned_url_memo.get(url, expire_in=PRESIGNED_URL_MAX_AGE)
+        if memoized_url is not None:
+            presigned_urls[url] = memoized_url
+
+    # Read cached URLs without taking the write lock
     database_connection = DatabaseConnection(database_url)
-    async with database_connection.write_transaction_scope_async() as connection:
+    missing_urls = [url for url in urls if url not in presigned_urls]
+    if missing_urls:
+        async with database_connection.transaction_scope_async() as connection:
+            cached_urls = await DatabaseCache(connection).get_many_raw([f"boto3_{url}" for url in missing_urls])
+
+        for url in missing_urls:
+            cached_url = cached_urls.get(f"boto3_{url}")
+            if cached_url is None:
+                continue
 
-        database_cache = DatabaseCache(connection)
-        cached_url = await database_cache.get(cache_key, expire_in=BOTO3_EXPIRE)
+            json_data, unix_timestamp = cached_url
+            if not is_expired(unix_timestamp, PRESIGNED_URL_MAX_AGE):
+                presigned_url_memo.set_raw(url, json_data, unix_timestamp)
+                presigned_urls[url] = json.loads(json_data)
 
-        if cached_url:
-            return cached_url
+    # Generate new pre-signed URLs concurrently
+    semaphore = asyncio.Semaphore(PRESIGN_CONCURRENCY)
 
-        # Generate a new pre-signed URL
-        try:
-            presigned_url = await _generate_presigned_url(url)
+    async def generate(url: str) -> tuple[str, typing.Optional[str]]:
+        async with semaphore:
+            try:
+                return url, await _generate_presigned_url(url)
+            except Exception:
+                log.exception("Error generating pre-signed URL")
+                return url, None
 
-        except Exception:
-            log.exception("Error generating pre-signed URL")
-            return url
+    results = await asyncio.gather(*(generate(url) for url in urls if url not in presigned_urls))
+    generated_urls = {url: presigned_url for url, presigned_url in results if presigned_url is not None}
 
-        # Store the generated URL in cache
-        await database_cache.set(cache_key, presigned_url)
-    return presigned_url
+    # Store the generated URLs in cache
+    if generated_urls:
+        unix_timestamp = int(time.time())
+        for url, presigned_url in generated_urls.items():
+            presigned_url_memo.set_raw(url, json.dumps(presigned_url), unix_timestamp)
+
+        async with database_connection.write_transaction_scope_async() as connection:
+            await DatabaseCache(connection).set_many({f"boto3_{url}": presigned_url for url, presigned_url in generated_urls.items()})
+
+    presigned_urls.update(generated_urls)
+    return presigned_urls
 
 
 async def _generate_presigned_url(url: str) -> str:
@@ -110,19 +162,29 @@ async def _generate_presigned_url(url: str) -> str:
     # Get object key which is "520/000520432_f.jpg" part of the URL
     object_key = url.split("https://nbg1.your-objectstorage.com/aca-access/")[-1]
 
-    # Initialize the S3 client
-    s3 = boto3.client(
-        "s3",
-        endpoint_url="https://nbg1.your-objectstorage.com",
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    )
+    # Signing is CPU work in boto3. Keep it off the event loop
+    return await asyncio.to_thread(_sign_object_key, object_key)
+
 
-    # Generate the pre-signed URL
-    url = s3.generate_presigned_url(
+def _get_s3_client():
+    """
+    Get the S3 client shared by all requests in this process. boto3 clients are thread safe.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                "s3",
+                endpoint_url="https://nbg1.your-objectstorage.com",
+                aws_access_key_id=AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            )
+        return _s3_client
+
+
+def _sign_object_key(object_key: str) -> str:
+    return _get_s3_client().generate_presigned_url(
         ClientMethod="get_object",
         Params={"Bucket": "aca-access", "Key": object_key},
         ExpiresIn=BOTO3_EXPIRE,
     )
-
-    return url
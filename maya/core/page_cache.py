@@ -0,0 +1,186 @@
+"""
+Opt-in cache of rendered pages for anonymous visitors.
+
+For anonymous visitors a record, resource or search page is the same for the same input.
+The input is the path, the sorted query string, the language, whether the client accepts
+gzip and the cookies that change the output (`size`, `sort`, `view`, `dark_theme` and
+`search`, which holds the last search shown in the menus).
+
+Responses are cached after gzip, so a hit sends the stored body as is. The CSP nonce of
+the cached page is stored with it and reused for the Content-Security-Policy header, so
+all visitors served from the same entry share a nonce until the entry expires.
+
+Requests are never served from the cache and their responses are never stored if the
+session holds an access token or flash messages. Each worker has its own cache.
+
+Pages hold pre-signed URLs, so the expire of a route is capped at PAGE_CACHE_MAX_EXPIRE,
+which is below the time a pre-signed URL is still valid after it is used. When proxy
+cache tags are invalidated (e.g. after an edit) the cache of the worker that handled the
+edit is cleared. Other workers serve the old page until it expires.
+
+Settings:
+
+    "page_cache": {
+        "enabled": True,
+        "routes": [{"path": "/records/*", "expire": 120}, {"path": "/search", "expire": 60}],
+    }
+"""
+
+from collections import OrderedDict
+import dataclasses
+import hashlib
+import time
+import typing
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+
+from maya.core.dynamic_settings import settings
+from maya.core.object_storage import BOTO3_EXPIRE_MARGIN
+
+PAGE_CACHE_HEADER = "X-Page-Cache"
+
+# Cookies that change the rendered output of a cached page
+PAGE_CACHE_COOKIES = ("size", "sort", "view", "dark_theme", "search")
+
+# Session keys that make a request uncacheable
+PAGE_CACHE_BYPASS_SESSION_KEYS = ("access_token", "flash")
+
+# Pre-signed URLs in a page are valid at least BOTO3_EXPIRE_MARGIN seconds after rendering.
+# Half of it is left for the browser to load them from a cached page.
+PAGE_CACHE_MAX_EXPIRE = BOTO3_EXPIRE_MARGIN // 2
+
+RESOURCE_TYPES = ("collections", "people", "locations", "creators", "events", "organisations", "collectors")
+
+
+def get_page_cache_settings() -> dict:
+    page_cache_settings: dict = {
+        "enabled": False,
+        "max_entries": 1000,
+        "max_bytes": 100 * 1024 * 1024,
+        "routes": [
+            {"path": "/records/*", "expire": 120},
+            {"path": "/search", "expire": 60},
+            *({"path": f"/{resource_type}/*", "expire": 120} for resource_type in RESOURCE_TYPES),
+        ],
+    }
+    page_cache_settings.update(settings.get("page_cache", {}))
+    return page_cache_settings
+
+
+def _matches(path: str, pattern: str) -> bool:
+    if pattern.endswith("*"):
+        return path.startswith(pattern[:-1])
+    return path == pattern
+
+
+@dataclasses.dataclass
+class CachedPage:
+    status_code: int
+    raw_headers: list[tuple[bytes, bytes]]
+    body: bytes
+    csp_nonce: typing.Optional[str]
+    expires_at: float
+
+    def to_response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        response.raw_headers = [(key, value) for key, value in self.raw_headers if key != b"content-length"]
+        response.raw_headers.append((b"content-length", str(len(self.body)).encode()))
+        return response
+
+
+class PageCache:
+    """
+    Bounded in-process LRU cache of rendered pages. The size is the sum of the body sizes.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 100 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._pages: OrderedDict[str, CachedPage] = OrderedDict()
+
+    def get(self, key: str) -> typing.Optional[CachedPage]:
+        page = self._pages.get(key)
+        if page is None:
+            return None
+
+        if page.expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+
+        self._pages.move_to_end(key)
+        return page
+
+    def set(self, key: str, page: CachedPage) -> None:
+        self.delete(key)
+        if len(page.body) > self.max_bytes:
+            return
+
+        self._pages[key] = page
+        self.num_bytes += len(page.body)
+
+        while len(self._pages) > self.max_entries or self.num_bytes > self.max_bytes:
+            _, evicted_page = self._pages.popitem(last=False)
+            self.num_bytes -= len(evicted_page.body)
+
+    def delete(self, key: str) -> None:
+        page = self._pages.pop(key, None)
+        if page is not None:
+            self.num_bytes -= len(page.body)
+
+    def clear(self) -> None:
+        self._pages.clear()
+        self.num_bytes = 0
+
+
+_page_cache_settings = get_page_cache_settings()
+page_cache = PageCache(_page_cache_settings["max_entries"], _page_cache_settings["max_bytes"])
+
+
+def has_private_session(request: Request) -> bool:
+    """
+    Check if the session holds an access token or flash messages, so the rendered page is private.
+    """
+    session = request.scope.get("session") or {}
+    return any(key in session for key in PAGE_CACHE_BYPASS_SESSION_KEYS)
+
+
+def get_expire(request: Request) -> typing.Optional[int]:
+    """
+    Get the seconds a page may be cached for the request. None if the request may not use the cache.
+    The expire is capped at PAGE_CACHE_MAX_EXPIRE.
+    """
+    if not _page_cache_settings["enabled"] or request.method != "GET":
+        return None
+
+    if has_private_session(request):
+        return None
+
+    path = request.url.path
+    for route in _page_cache_settings["routes"]:
+        if _matches(path, route["path"]):
+            return min(route["expire"], PAGE_CACHE_MAX_EXPIRE) or None
+
+    return None
+
+
+def get_key(request: Request) -> str:
+    """
+    Get the cache key of the rendered page for the request.
+    """
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    parts = [
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        settings.get("language"),
+        accepts_gzip,
+        [request.cookies.get(name) for name in PAGE_CACHE_COOKIES],
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def is_cacheable_response(status_code: int, headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    return status_code == 200 and content_type.startswith("text/html")
@@ -9,10 +9,14 @@ It is then added to the environment when the server is started.
 The get_data_dir_path() function will return a path to the data directory.
 The data directory is a subdirectory of the base directory.
 
+STATIC_PATH_PREFIX is the URL path static files are served from.
+
 """
 
 import os
 
+STATIC_PATH_PREFIX = "/static"
+
 
 def get_base_dir_path(*sub_dirs: str) -> str:
     """
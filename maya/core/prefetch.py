@@ -0,0 +1,61 @@
+"""
+Opt-in background prefetch of the pages a visitor is likely to request next.
+
+After a record page is rendered, the previous and next record of the search are fetched
+into the proxy cache. After a search page is rendered, the next search page is fetched.
+Only pages for anonymous visitors are prefetched, as only their responses are cached.
+
+Prefetches run as background tasks with a per-worker budget: a prefetch is skipped if
+`prefetch_max_tasks` prefetches are running or the same key is already being prefetched.
+Running prefetches are cancelled on shutdown (see `app.py`).
+
+Usage:
+
+    prefetch.schedule(f"record:{record_id}", lambda: api.proxies_record_get_by_id(request, record_id))
+"""
+
+import asyncio
+import contextvars
+import typing
+
+from maya.core.dynamic_settings import settings
+from maya.core.logging import get_log
+
+log = get_log()
+
+PREFETCH_ENABLED: bool = settings.get("prefetch_enabled", False)
+PREFETCH_MAX_TASKS: int = settings.get("prefetch_max_tasks", 8)
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def schedule(key: str, fetch: typing.Callable[[], typing.Awaitable[typing.Any]]) -> bool:
+    """
+    Run fetch in a background task. Returns False if the prefetch is skipped.
+    """
+    if not PREFETCH_ENABLED or key in _tasks or len(_tasks) >= PREFETCH_MAX_TASKS:
+        return False
+
+    async def run():
+        try:
+            await fetch()
+        except Exception as e:
+            log.debug(f"Prefetch of {key} failed: {e!r}")
+        finally:
+            _tasks.pop(key, None)
+
+    # Run in an empty context, so the prefetch is not counted in the timings of the request
+    _tasks[key] = asyncio.create_task(run(), context=contextvars.Context())
+    return True
+
+
+async def cancel_all() -> None:
+    """
+    Cancel all running prefetches and wait for them to finish.
+    """
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
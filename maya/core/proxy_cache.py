@@ -1,49 +1,333 @@
+"""
+Cache for responses from the proxy endpoints of the external API.
+
+Entries are fresh for `expire_in` seconds. After that an entry is stale:
+
+- stale-while-revalidate: within `proxy_cache_stale_while_revalidate` seconds the stale
+  entry is served at once while a single background task refreshes it.
+- stale-if-error: within `proxy_cache_stale_if_error` seconds the stale entry is served
+  if the upstream request times out, fails to connect or returns a 5xx status.
+
+Responses built from a stale entry are marked with the `X-Proxy-Cache: stale` header.
+
+Entries are tagged with the entities they contain, e.g. "record:309478" or
+"resource:people:123". `proxy_cache_invalidate_tags` deletes all entries with a tag.
+"""
+
+import asyncio
+from contextvars import ContextVar, Token
+import dataclasses
 import json
+import time
 import typing
 
+import httpx
+
+from maya.core import page_cache
+from maya.core import search_query
 from maya.core.dynamic_settings import settings
-from maya.database.cache import DatabaseCache
+from maya.core.logging import get_custom_log
+from maya.core.request_timing import measure
+from maya.database.cache import MemoryCache, TieredCache
 from maya.database.crud_default import database_url
 from maya.database.utils import DatabaseConnection
 
+proxy_cache_log = get_custom_log("proxy_cache")
+
+# Query params that do not change which records are found, only how they are presented
+SEARCH_CACHE_IGNORE_KEYS = {"size", "start", "sort", "direction", "view", "cursor"}
+
+# Log the search cache hit rates for every N lookups
+SEARCH_CACHE_STATS_LOG_INTERVAL = 100
 
-def _get_proxy_cache_expire() -> typing.Optional[int]:
-    proxy_cache_expire = settings.get("proxy_cache_expire")
-    if proxy_cache_expire is None:
+
+def _get_cache_expire_setting(name: str) -> typing.Optional[int]:
+    cache_expire = settings.get(name)
+    if cache_expire is None:
         return None
 
-    if not isinstance(proxy_cache_expire, int):
-        raise TypeError("settings['proxy_cache_expire'] must be an int")
+    if not isinstance(cache_expire, int):
+        raise TypeError(f"settings['{name}'] must be an int")
 
-    return proxy_cache_expire
+    return cache_expire
 
 
-PROXY_CACHE_EXPIRE = _get_proxy_cache_expire()
+PROXY_CACHE_EXPIRE = _get_cache_expire_setting("proxy_cache_expire")
+PROXY_CACHE_SEARCH_EXPIRE = _get_cache_expire_setting("proxy_cache_search_expire")
+PROXY_CACHE_STALE_WHILE_REVALIDATE = _get_cache_expire_setting("proxy_cache_stale_while_revalidate") or 0
+PROXY_CACHE_STALE_IF_ERROR = _get_cache_expire_setting("proxy_cache_stale_if_error") or 0
+STALE_HEADER = "X-Proxy-Cache"
 database_connection = DatabaseConnection(database_url)
 
+# In-process L1 cache in front of the sqlite3 cache table
+_memory_cache_settings: dict = {"max_entries": 1000, "max_bytes": 50 * 1024 * 1024, "max_age": 60}
+_memory_cache_settings.update(settings.get("proxy_cache_memory", {}))
+memory_cache = MemoryCache(**_memory_cache_settings)
+proxy_cache = TieredCache(database_connection, memory_cache)
+
+
+async def proxy_cache_get(key: str, expire_in: typing.Optional[int] = PROXY_CACHE_EXPIRE) -> typing.Any:
+    """
+    Get a cached proxy value. Returns None if the cache is disabled (expire_in is None).
+    """
+    if not database_url or expire_in is None:
+        return None
+
+    with measure("cache", "proxy_cache_get"):
+        return await proxy_cache.get(key, expire_in=expire_in)
+
+
+async def proxy_cache_set(
+    key: str,
+    data: typing.Any,
+    expire_in: typing.Optional[int] = PROXY_CACHE_EXPIRE,
+    tags: typing.Optional[typing.Iterable[str]] = None,
+) -> None:
+    """
+    Set a cached proxy value. Does nothing if the cache is disabled (expire_in is None).
+    """
+    if not database_url or expire_in is None:
+        return None
+
+    with measure("cache", "proxy_cache_set"):
+        await proxy_cache.set(key, data, tags)
+
+
+async def proxy_cache_invalidate_tags(tags: typing.Iterable[str]) -> list[str]:
+    """
+    Delete all cached proxy values tagged with any of the tags. Returns the deleted keys.
+    The rendered pages in the page cache of this worker are cleared as well.
+    """
+    tags = list(tags)
+    if tags:
+        page_cache.page_cache.clear()
+
+    if not database_url or not tags:
+        return []
+
+    with measure("cache", "proxy_cache_invalidate"):
+        keys = await proxy_cache.delete_tags(tags)
+
+    proxy_cache_log.info(f"Invalidated {len(keys)} cache entries for tags {tags}")
+    return keys
+
+
+# Keys in a record that hold lists of linked resources
+RECORD_RESOURCE_KEYS = ("people", "locations", "organisations", "events", "creators", "collectors")
+
+
+def _normalize_id(id: typing.Any) -> str:
+    return str(id).lstrip("0") or "0"
+
+
+def get_record_tag(record_id: typing.Any) -> str:
+    return f"record:{_normalize_id(record_id)}"
+
+
+def get_resource_tag(resource_type: str, resource_id: typing.Any) -> str:
+    return f"resource:{resource_type}:{_normalize_id(resource_id)}"
+
+
+def get_record_tags(record_id: str, record: dict) -> list[str]:
+    """
+    Get the tags of a record: the record itself, its collection and its linked resources.
+    """
+    tags = [get_record_tag(record_id)]
+
+    collection = record.get("collection") or {}
+    if collection.get("id") is not None:
+        tags.append(get_resource_tag("collections", collection["id"]))
+
+    for resource_type in RECORD_RESOURCE_KEYS:
+        for resource in record.get(resource_type) or []:
+            if isinstance(resource, dict) and resource.get("id") is not None:
+                tags.append(get_resource_tag(resource_type, resource["id"]))
+
+    return tags
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    data: typing.Any
+    age: int
+    expire_in: int
+
+    @property
+    def fresh(self) -> bool:
+        return self.expire_in == 0 or self.age < self.expire_in
 
-async def proxy_cache_get(key: str) -> typing.Any:
-    if not database_url or PROXY_CACHE_EXPIRE is None:
+    @property
+    def revalidate(self) -> bool:
+        """
+        True if the stale entry may be served while it is refreshed in the background.
+        """
+        return self.age < self.expire_in + PROXY_CACHE_STALE_WHILE_REVALIDATE
+
+    @property
+    def usable_on_error(self) -> bool:
+        """
+        True if the stale entry may be served when upstream fails.
+        """
+        return self.age < self.expire_in + PROXY_CACHE_STALE_IF_ERROR
+
+
+async def proxy_cache_get_entry(key: str, expire_in: typing.Optional[int] = PROXY_CACHE_EXPIRE) -> typing.Optional[CacheEntry]:
+    """
+    Get a cached proxy entry that is fresh or may still be served as stale.
+    """
+    if not database_url or expire_in is None:
         return None
 
-    async with database_connection.transaction_scope_async() as connection:
-        database_cache = DatabaseCache(connection)
-        return await database_cache.get(key, expire_in=PROXY_CACHE_EXPIRE)
+    max_age = 0
+    if expire_in:
+        max_age = expire_in + max(PROXY_CACHE_STALE_WHILE_REVALIDATE, PROXY_CACHE_STALE_IF_ERROR)
 
+    with measure("cache", "proxy_cache_get"):
+        entry = await proxy_cache.get_entry(key, expire_in=max_age)
 
-async def proxy_cache_set(key: str, data: typing.Any) -> None:
-    if not database_url or PROXY_CACHE_EXPIRE is None:
+    if entry is None:
         return None
 
-    async with database_connection.write_transaction_scope_async() as connection:
-        database_cache = DatabaseCache(connection)
-        await database_cache.set(key, data)
+    data, unix_timestamp = entry
+    return CacheEntry(data, int(time.time()) - unix_timestamp, expire_in)
+
+
+async def proxy_cache_fetch(
+    key: str,
+    fetch: typing.Callable[[], typing.Awaitable[typing.Any]],
+    expire_in: typing.Optional[int] = PROXY_CACHE_EXPIRE,
+) -> tuple[typing.Any, str]:
+    """
+    Get a cached proxy value or fetch it. fetch is expected to store the fetched value
+    in the cache. Returns the value and the cache status: "hit", "stale" or "miss".
+    """
+    entry = await proxy_cache_get_entry(key, expire_in)
+    if entry is not None:
+        if entry.fresh:
+            return entry.data, "hit"
+
+        if entry.revalidate:
+            _refresh_in_background(key, fetch)
+            mark_stale(key)
+            return entry.data, "stale"
+
+    try:
+        return await fetch(), "miss"
+    except Exception as e:
+        if entry is not None and entry.usable_on_error and is_upstream_error(e):
+            proxy_cache_log.warning(f"Serving stale cache entry {key} (age {entry.age}s) after upstream error: {e!r}")
+            mark_stale(key)
+            return entry.data, "stale"
+        raise
+
+
+def is_upstream_error(e: Exception) -> bool:
+    """
+    Check if an exception is an upstream timeout, connection error or 5xx response.
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+_refresh_tasks: dict[str, asyncio.Task] = {}
+
+
+def _refresh_in_background(key: str, fetch: typing.Callable[[], typing.Awaitable[typing.Any]]) -> None:
+    """
+    Refresh a stale entry in a background task. Only one refresh per key runs at a time.
+    """
+    if key in _refresh_tasks:
+        return
+
+    async def refresh():
+        try:
+            await fetch()
+        except Exception as e:
+            proxy_cache_log.warning(f"Background refresh of {key} failed: {e!r}")
+        finally:
+            _refresh_tasks.pop(key, None)
+
+    _refresh_tasks[key] = asyncio.create_task(refresh())
+
+
+# Keys of stale cache entries used while handling the current request
+_stale_keys: ContextVar[list | None] = ContextVar("proxy_cache_stale_keys", default=None)
+
+
+def start_stale_tracking() -> Token:
+    return _stale_keys.set([])
+
+
+def reset_stale_tracking(token: Token) -> None:
+    _stale_keys.reset(token)
+
+
+def mark_stale(key: str) -> None:
+    stale_keys = _stale_keys.get()
+    if stale_keys is not None:
+        stale_keys.append(key)
+
+
+def get_stale_keys() -> list:
+    return _stale_keys.get() or []
 
 
 def proxy_record_cache_key(record_id: str) -> str:
     return f"proxy_record:{record_id}"
 
 
+def proxy_resource_cache_key(resource_type: str, resource_id: str) -> str:
+    return f"proxy_resource:{resource_type}:{resource_id}"
+
+
 def proxy_records_cache_key(query_params_before_search: list) -> str:
-    normalized_params = [[str(key), str(value)] for key, value in query_params_before_search]
-    return "proxy_records:" + json.dumps(normalized_params, sort_keys=False, separators=(",", ":"))
+    """
+    Get a cache key for search results from the canonical search query, so the same
+    search spelled in a different way (e.g. with a different param order) uses the same key.
+    """
+    return "proxy_records:" + search_query.get_key(search_query.canonicalize(query_params_before_search))
+
+
+def get_facet_combination(query_params: list) -> str:
+    """
+    Get the combination of facets used in a search, e.g. "content_types+q+subjects".
+    Values are left out, so the hit rate is logged per kind of search.
+    """
+    keys = {str(key).lstrip("-") for key, _ in query_params if key not in SEARCH_CACHE_IGNORE_KEYS}
+    return "+".join(sorted(keys)) or "(none)"
+
+
+class SearchCacheStats:
+    """
+    Count search cache hits and misses per facet combination.
+    """
+
+    def __init__(self, log_interval: int = SEARCH_CACHE_STATS_LOG_INTERVAL):
+        self.log_interval = log_interval
+        self.lookups = 0
+        self.stats: dict[str, dict[str, int]] = {}
+
+    def record(self, query_params: list, hit: bool) -> None:
+        facet_combination = get_facet_combination(query_params)
+        stats = self.stats.setdefault(facet_combination, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+
+        self.lookups += 1
+        if self.lookups % self.log_interval == 0:
+            self.log()
+
+    def get_hit_rates(self) -> dict:
+        hit_rates = {}
+        for facet_combination, stats in self.stats.items():
+            lookups = stats["hits"] + stats["misses"]
+            hit_rates[facet_combination] = {**stats, "hit_rate": round(stats["hits"] / lookups, 3)}
+        return hit_rates
+
+    def log(self) -> None:
+        hit_rates = json.dumps(self.get_hit_rates(), ensure_ascii=False)
+        proxy_cache_log.info(f"Search cache hit rates after {self.lookups} lookups (expire={PROXY_CACHE_SEARCH_EXPIRE}): {hit_rates}")
+        proxy_cache_log.info(f"Memory cache stats: {json.dumps(memory_cache.get_stats())}")
+
+
+search_cache_stats = SearchCacheStats()
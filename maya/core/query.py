@@ -10,6 +10,9 @@ Functions:
 - get_str_from_list: Converts a list of (key, value) tuples into a URL-encoded query string with
   optional filtering and normalization.
 - get_search: Extracts the "q" (search) parameter from a request.
+
+Classes:
+- QueryState: Parses a query string once and builds links with a param added, removed or inverted.
 """
 
 from starlette.requests import Request
@@ -63,3 +66,58 @@ def get_search(request: Request) -> str:
     query_params = request.query_params
     q = query_params.get("q", "")
     return q
+
+
+class QueryState:
+    """
+    The params of a query string as created by `get_str_from_list`, e.g. "content_types=61&-subjects=12&".
+    The query string is parsed once. Links with a param added, removed or inverted (negated or
+    not negated) are built from a lookup of the param, not by searching the query string.
+    """
+
+    def __init__(self, query_str: str):
+        self.query_str = query_str
+        self._items = [item for item in query_str.split("&") if item]
+
+        # Positions of each encoded item, e.g. {"content_types=61": [0]}
+        self._positions: dict[str, list[int]] = {}
+        for position, item in enumerate(self._items):
+            self._positions.setdefault(item, []).append(position)
+
+    def _get_item(self, key: str, value: str) -> str:
+        return f"{key}={quote_plus(value)}"
+
+    def _replace(self, old_item: str, new_item: str | None) -> str:
+        """
+        Get the query string with all occurrences of old_item replaced. Removed if new_item is None.
+        """
+        items: list[str | None] = list(self._items)
+        for position in self._positions[old_item]:
+            items[position] = new_item
+
+        return "".join(f"{item}&" for item in items if item is not None)
+
+    def get_add_link(self, key: str, value: str) -> str:
+        return f"{self.query_str}{self._get_item(key, value)}&"
+
+    def get_remove_link(self, key: str, value: str) -> str:
+        """
+        Get the query string without the param. A negated param is removed before a not negated param.
+        """
+        item = self._get_item(key, value)
+        if f"-{item}" in self._positions:
+            return self._replace(f"-{item}", None)
+        if item in self._positions:
+            return self._replace(item, None)
+        return self.query_str
+
+    def get_invert_link(self, key: str, value: str) -> str:
+        """
+        Get the query string with the param negated, or not negated if it is negated.
+        """
+        item = self._get_item(key, value)
+        if f"-{item}" in self._positions:
+            return self._replace(f"-{item}", item)
+        if item in self._positions:
+            return self._replace(item, f"-{item}")
+        return self.query_str
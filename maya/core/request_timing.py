@@ -0,0 +1,93 @@
+"""
+Request-local timing of the work done while handling a request.
+
+Timings are grouped in categories and kept in a context variable, so concurrent
+requests on the same worker never mix their timings. The timings are exposed as
+a `Server-Timing` response header and as a structured log line.
+
+Categories:
+- upstream: calls to the external API
+- cache: proxy cache lookups and writes
+- normalize: normalization of records, resources and search results
+- render: template rendering
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from time import perf_counter
+import typing
+
+TIMING_CATEGORIES = ("upstream", "cache", "normalize", "render")
+
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> Token:
+    """
+    Start collecting timings for the current request.
+
+    The dict is created here and only mutated afterwards. Tasks created during the
+    request (e.g. by asyncio.gather) copy the context and share the same dict.
+    """
+    return _request_timings.set({})
+
+
+def reset_request_timing(token: Token) -> None:
+    _request_timings.reset(token)
+
+
+def get_request_timings() -> dict:
+    """
+    Get the timings of the current request, e.g.
+    {"upstream": {"GET_/v1/proxy/records/000309478": [0.12]}, "render": {"records/record.html": [0.01]}}
+    """
+    return _request_timings.get() or {}
+
+
+def add_time(category: str, name: str, elapsed: float) -> None:
+    """
+    Add an elapsed time (seconds) to the current request. Ignored outside a request.
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        return
+
+    timings.setdefault(category, {}).setdefault(name, []).append(elapsed)
+
+
+@contextmanager
+def measure(category: str, name: str = "") -> typing.Iterator[None]:
+    """
+    Measure the time spent inside the with block.
+    """
+    time_begin = perf_counter()
+    try:
+        yield
+    finally:
+        add_time(category, name or category, perf_counter() - time_begin)
+
+
+def get_timing_summary(timings: dict) -> dict:
+    """
+    Sum up timings per category, e.g. {"upstream": {"count": 2, "duration": 0.3}}
+    """
+    summary = {}
+    for category in TIMING_CATEGORIES:
+        category_timings = timings.get(category, {})
+        elapsed_list = [elapsed for elapsed_list in category_timings.values() for elapsed in elapsed_list]
+        summary[category] = {"count": len(elapsed_list), "duration": sum(elapsed_list)}
+    return summary
+
+
+def get_server_timing_header(timings: dict, total: float) -> str:
+    """
+    Format timings as a Server-Timing header value. Durations are in milliseconds, e.g.
+    upstream;dur=120.3;desc="2 calls", cache;dur=1.2;desc="1 calls", ..., total;dur=140.1
+    """
+    metrics = []
+    for category, values in get_timing_summary(timings).items():
+        duration_ms = values["duration"] * 1000
+        metrics.append(f'{category};dur={duration_ms:.1f};desc="{values["count"]} calls"')
+
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
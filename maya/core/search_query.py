@@ -0,0 +1,63 @@
+"""
+Canonical representation of a search query.
+
+The same search can be spelled in many ways: params in a different order, padded ids
+("collection=000007"), "amp;" artifacts in keys ("amp;content_types=61") and duplicate
+params. A canonical search query is a sorted tuple of unique (key, value) pairs with all
+of this normalized away. It is hashable and compares equal for equal searches, e.g.
+
+    canonicalize([("subjects", "12"), ("amp;collection", "0007"), ("subjects", "12")])
+    -> (("collection", "7"), ("subjects", "12"))
+
+Values are normalized the same way as `query.get_str_from_list` does when the query
+string for the API is built, so searches with the same canonical query get the same
+search result.
+"""
+
+import json
+import typing
+
+SearchQuery = tuple[tuple[str, str], ...]
+
+
+def normalize_key(key: typing.Any) -> str:
+    return str(key).replace("amp;", "")
+
+
+def normalize_value(value: typing.Any) -> str:
+    """
+    Remove leading zeros. E.g. "000096" -> "96", but "0" is kept.
+    """
+    value = str(value)
+    if value == "0":
+        return value
+    return value.lstrip("0")
+
+
+def canonicalize(query_params: typing.Iterable, remove_keys: typing.Iterable[str] = ()) -> SearchQuery:
+    """
+    Get the canonical search query from a list of (key, value) pairs.
+    """
+    remove_keys = set(remove_keys)
+    pairs = set()
+    for key, value in query_params:
+        key = normalize_key(key)
+        if key in remove_keys:
+            continue
+        pairs.add((key, normalize_value(value)))
+
+    return tuple(sorted(pairs))
+
+
+def get_key(search_query: SearchQuery) -> str:
+    """
+    Get a compact string from a canonical search query, e.g. for cache keys.
+    """
+    return json.dumps(to_list(search_query), separators=(",", ":"), ensure_ascii=False)
+
+
+def to_list(search_query: SearchQuery) -> list:
+    """
+    Get the canonical search query as a JSON serializable list of [key, value] lists.
+    """
+    return [list(pair) for pair in search_query]
@@ -0,0 +1,79 @@
+"""
+Coalesce identical concurrent upstream requests (single-flight).
+
+Concurrent callers using the same key share one in-flight fetch and its parsed result.
+The key is removed as soon as the fetch is done, so nothing is cached here.
+
+Callers may mutate the returned result (e.g. `get_record_data` mutates a record).
+A result shared by more than one caller is therefore deep-copied for every caller.
+A result fetched for a single caller is returned as is.
+
+Usage:
+
+    key = single_flight.get_key(url, "anonymous")
+    record = await single_flight.run(key, fetch_record)
+"""
+
+import asyncio
+import copy
+import typing
+
+from maya.core.logging import get_log
+
+log = get_log()
+
+
+class _InFlight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+_in_flight: dict[str, _InFlight] = {}
+
+
+def get_key(url: str, scope: str = "anonymous") -> str:
+    """
+    Get a single-flight key from a URL and an auth scope, e.g. "anonymous" or "user".
+    """
+    return f"{scope}:{url}"
+
+
+async def run(key: str, fetch: typing.Callable[[], typing.Awaitable[typing.Any]]) -> typing.Any:
+    """
+    Run fetch once for all concurrent callers using the same key.
+    Exceptions raised by fetch are raised for all callers.
+    """
+    in_flight = _in_flight.get(key)
+    if in_flight is None:
+        in_flight = _InFlight(asyncio.ensure_future(_fetch(key, fetch)))
+        in_flight.task.add_done_callback(_retrieve_exception)
+        _in_flight[key] = in_flight
+    else:
+        log.debug(f"Single-flight request joined: {key}")
+
+    in_flight.waiters += 1
+
+    # Shield the shared fetch so a cancelled caller does not cancel it for the other callers
+    result = await asyncio.shield(in_flight.task)
+
+    if in_flight.waiters == 1:
+        return result
+
+    return copy.deepcopy(result)
+
+
+async def _fetch(key: str, fetch: typing.Callable[[], typing.Awaitable[typing.Any]]) -> typing.Any:
+    try:
+        return await fetch()
+    finally:
+        # No new callers may join once the result is ready. This keeps the waiters count final.
+        _in_flight.pop(key, None)
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    """
+    Mark the exception as retrieved in case all callers were cancelled.
+    """
+    if not task.cancelled():
+        task.exception()
@@ -28,6 +28,7 @@ from maya.core.dynamic_settings import get_setting
 from maya.core.logging import get_log
 from maya.core.date_format import date_format
 from maya.core.paths import get_base_dir_path
+from maya.core.request_timing import measure
 import json
 import re
 import markdown
@@ -106,13 +107,23 @@ def _markdown(text: str, safe: bool = True):
     return markdown.markdown(text, extensions=["fenced_code", TocExtension(permalink=False)])
 
 
+class _TimedJinja2Templates(Jinja2Templates):
+    """
+    Jinja2Templates that adds the template render time to the request timings.
+    """
+
+    def TemplateResponse(self, *args, **kwargs):
+        with measure("render"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
 env = Environment(
     loader=FileSystemLoader(template_dirs),
     autoescape=select_autoescape(),
     trim_blocks=True,
     lstrip_blocks=True,
 )
-templates = Jinja2Templates(
+templates = _TimedJinja2Templates(
     context_processors=[_get_app_context],
     env=env,
 )
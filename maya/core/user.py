@@ -2,11 +2,16 @@
 This module provides utility functions for managing user session data and permissions
 within a Starlette-based web application.
 
+Classes:
+- Principal: The current user as resolved once per request (logged-in state, verified state and permissions).
+
 Functions:
+- principal_from_me: Creates a Principal from the "me" endpoint response.
 - permissions_as_list: Extracts and sorts a list of permission names from a permission dictionary.
 - permission_translated: Translates the highest priority permission in a list into a human-readable string.
 """
 
+import dataclasses
 from enum import IntEnum
 
 from maya.core.translate import translate
@@ -22,6 +27,40 @@ class V2UserRole(IntEnum):
     ADMIN = 30
 
 
+@dataclasses.dataclass(frozen=True)
+class Principal:
+    """
+    The current user. Anonymous users are represented by ANONYMOUS_PRINCIPAL.
+    """
+
+    is_logged_in: bool = False
+    is_verified: bool = False
+    permissions: tuple[str, ...] = ()
+    me: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def permissions_list(self) -> list[str]:
+        return list(self.permissions)
+
+    def has_permission(self, permission: str) -> bool:
+        return permission in self.permissions
+
+
+ANONYMOUS_PRINCIPAL = Principal()
+
+
+def principal_from_me(me: dict) -> Principal:
+    """
+    Return a logged-in Principal from the "me" endpoint response.
+    """
+    return Principal(
+        is_logged_in=True,
+        is_verified=bool(me.get("is_verified")),
+        permissions=tuple(permissions_from_me(me)),
+        me=me,
+    )
+
+
 def permissions_as_list(permissions: list[dict]) -> list[str]:
     """
     Return a sorted list of permission names from the v1 permission payload.
@@ -36,7 +36,46 @@ async def test_get(request: Request):
 import aiosqlite
 import json
 import time
-from typing import Any
+import zlib
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Union
+
+from maya.core.dynamic_settings import settings
+from maya.database.utils import DatabaseConnection
+
+# Max number of "?" placeholders used in a single statement
+SQLITE_MAX_VARIABLES = 500
+
+# Values with a serialized size of at least this many characters are stored zlib compressed.
+# None disables compression.
+CACHE_COMPRESS_MIN_SIZE: Optional[int] = settings.get("cache_compress_min_size", 1024)
+CACHE_COMPRESS_LEVEL = 6
+
+
+def dumps(data: Any) -> str:
+    """
+    Serialize a cache value as compact JSON.
+    """
+    return json.dumps(data, separators=(",", ":"))
+
+
+def encode_value(json_data: str) -> Union[str, bytes]:
+    """
+    Encode serialized JSON for the value column. Large values are stored as a zlib compressed BLOB.
+    """
+    if CACHE_COMPRESS_MIN_SIZE is None or len(json_data) < CACHE_COMPRESS_MIN_SIZE:
+        return json_data
+    return zlib.compress(json_data.encode("utf-8"), CACHE_COMPRESS_LEVEL)
+
+
+def decode_value(value: Union[str, bytes]) -> str:
+    """
+    Decode a value from the value column. TEXT values (e.g. rows written before
+    compression was added) are plain JSON. BLOB values are zlib compressed JSON.
+    """
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
 
 
 class DatabaseCache:
@@ -51,7 +90,13 @@ class DatabaseCache:
         """
         Set a cache value for a key using a single-row upsert.
         """
-        json_data = json.dumps(data)
+        await self.set_raw(key, dumps(data), int(time.time()))
+        return True
+
+    async def set_raw(self, key: str, json_data: str, unix_timestamp: int) -> None:
+        """
+        Set an already serialized cache value for a key. The value is compressed if it is large.
+        """
         await self.connection.execute(
             """
             INSERT INTO cache (key, value, unix_timestamp)
@@ -60,9 +105,8 @@ class DatabaseCache:
                 value = excluded.value,
                 unix_timestamp = excluded.unix_timestamp
             """,
-            (key, json_data, int(time.time())),
+            (key, encode_value(json_data), unix_timestamp),
         )
-        return True
 
     async def get(self, key: str, expire_in: int = 0) -> Any:
         """
@@ -72,21 +116,77 @@ class DatabaseCache:
         Expired values are left in place for set() or delete_expired() to
         replace or remove, keeping cache reads read-only under concurrency.
         """
+        result = await self.get_raw(key)
+
+        if result:
+            json_data, unix_timestamp = result
+            if not is_expired(unix_timestamp, expire_in):
+                return json.loads(json_data)
+        return None
+
+    async def get_raw(self, key: str) -> Optional[tuple[str, int]]:
+        """
+        Get the serialized value and the unix timestamp for a key, expired or not.
+        """
         cursor = await self.connection.execute(
             "SELECT value, unix_timestamp FROM cache WHERE key = ?",
             (key,),
         )
         result = await cursor.fetchone()
-
         if result:
-            if expire_in == 0:
-                return json.loads(result["value"])
-
-            current_time = int(time.time())
-            if current_time - result["unix_timestamp"] < expire_in:
-                return json.loads(result["value"])
+            return decode_value(result["value"]), result["unix_timestamp"]
         return None
 
+    async def get_many(self, keys: Iterable[str], expire_in: int = 0) -> dict[str, Any]:
+        """
+        Get the values for many keys with a single query per SQLITE_MAX_VARIABLES keys.
+        Keys that do not exist or are expired are left out of the returned dict.
+        """
+        values = {}
+        for key, (json_data, unix_timestamp) in (await self.get_many_raw(keys)).items():
+            if not is_expired(unix_timestamp, expire_in):
+                values[key] = json.loads(json_data)
+        return values
+
+    async def get_many_raw(self, keys: Iterable[str]) -> dict[str, tuple[str, int]]:
+        """
+        Get the serialized values and the unix timestamps for many keys, expired or not.
+        """
+        keys = list(set(keys))
+        results = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            keys_chunk = keys[start : start + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" for _ in keys_chunk)
+            cursor = await self.connection.execute(
+                f"SELECT key, value, unix_timestamp FROM cache WHERE key IN ({placeholders})",
+                keys_chunk,
+            )
+            for row in await cursor.fetchall():
+                results[row["key"]] = (decode_value(row["value"]), row["unix_timestamp"])
+        return results
+
+    async def set_many(self, items: dict[str, Any]) -> None:
+        """
+        Set many cache values using a single multi-row upsert per SQLITE_MAX_VARIABLES values.
+        """
+        unix_timestamp = int(time.time())
+        rows = [(key, encode_value(dumps(data)), unix_timestamp) for key, data in items.items()]
+
+        chunk_size = SQLITE_MAX_VARIABLES // 3
+        for start in range(0, len(rows), chunk_size):
+            rows_chunk = rows[start : start + chunk_size]
+            placeholders = ", ".join("(?, ?, ?)" for _ in rows_chunk)
+            await self.connection.execute(
+                f"""
+                INSERT INTO cache (key, value, unix_timestamp)
+                VALUES {placeholders}
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    unix_timestamp = excluded.unix_timestamp
+                """,
+                [value for row in rows_chunk for value in row],
+            )
+
     async def delete(self, id: int) -> None:
         """
         Delete a cache value by id
@@ -94,6 +194,36 @@ class DatabaseCache:
         await self.connection.execute("DELETE FROM cache WHERE id = ?", (id,))
         return None
 
+    async def set_tags(self, key: str, tags: Iterable[str]) -> None:
+        """
+        Replace the tags of a cache key. Tags are used to invalidate related entries, e.g. "record:309478".
+        """
+        await self.connection.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+        await self.connection.executemany(
+            "INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+            [(tag, key) for tag in set(tags)],
+        )
+
+    async def delete_tags(self, tags: Iterable[str]) -> list[str]:
+        """
+        Delete all cache values tagged with any of the tags. Returns the deleted keys.
+        """
+        tags = list(set(tags))
+        if not tags:
+            return []
+
+        placeholders = ", ".join("?" for _ in tags)
+        cursor = await self.connection.execute(f"SELECT DISTINCT key FROM cache_tags WHERE tag IN ({placeholders})", tags)
+        keys = [row["key"] for row in await cursor.fetchall()]
+
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            keys_chunk = keys[start : start + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" for _ in keys_chunk)
+            await self.connection.execute(f"DELETE FROM cache WHERE key IN ({placeholders})", keys_chunk)
+            await self.connection.execute(f"DELETE FROM cache_tags WHERE key IN ({placeholders})", keys_chunk)
+
+        return keys
+
     async def delete_expired(self, expire_in: int) -> int:
         """
         Delete cache values older than the provided TTL.
@@ -107,3 +237,238 @@ class DatabaseCache:
             (cutoff,),
         )
         return cursor.rowcount
+
+    async def delete_expired_batch(self, key_prefix: str, expire_in: int, batch_size: int) -> int:
+        """
+        Delete at most batch_size values with keys starting with key_prefix that are
+        older than expire_in seconds. Returns the number of deleted values.
+        """
+        cutoff = int(time.time()) - expire_in
+        cursor = await self.connection.execute(
+            """
+            SELECT id, key FROM cache
+            WHERE unix_timestamp <= ? AND substr(key, 1, ?) = ?
+            LIMIT ?
+            """,
+            (cutoff, len(key_prefix), key_prefix, batch_size),
+        )
+        rows = list(await cursor.fetchall())
+        await self._delete_rows(rows)
+        return len(rows)
+
+    async def delete_oldest_batch(self, batch_size: int) -> tuple[int, int]:
+        """
+        Delete the batch_size oldest values. Returns the number of deleted values and their size.
+        """
+        cursor = await self.connection.execute(
+            """
+            SELECT id, key, LENGTH(key) + IFNULL(LENGTH(value), 0) AS size FROM cache
+            ORDER BY unix_timestamp
+            LIMIT ?
+            """,
+            (batch_size,),
+        )
+        rows = list(await cursor.fetchall())
+        await self._delete_rows(rows)
+        return len(rows), sum(row["size"] for row in rows)
+
+    async def get_size(self) -> tuple[int, int]:
+        """
+        Get the number of values and their approximate size in bytes.
+        """
+        cursor = await self.connection.execute(
+            "SELECT COUNT(*) AS num_rows, IFNULL(SUM(LENGTH(key) + IFNULL(LENGTH(value), 0)), 0) AS size FROM cache"
+        )
+        result = await cursor.fetchone()
+        if not result:
+            return 0, 0
+        return result["num_rows"], result["size"]
+
+    async def _delete_rows(self, rows: list) -> None:
+        """
+        Delete rows (selected with id and key) and their tags.
+        """
+        for start in range(0, len(rows), SQLITE_MAX_VARIABLES):
+            rows_chunk = rows[start : start + SQLITE_MAX_VARIABLES]
+            placeholders = ", ".join("?" for _ in rows_chunk)
+            await self.connection.execute(f"DELETE FROM cache WHERE id IN ({placeholders})", [row["id"] for row in rows_chunk])
+            await self.connection.execute(f"DELETE FROM cache_tags WHERE key IN ({placeholders})", [row["key"] for row in rows_chunk])
+
+
+def is_expired(unix_timestamp: int, expire_in: int) -> bool:
+    """
+    Check if a value set at unix_timestamp is expired. If expire_in is 0, the value never expires.
+    """
+    if expire_in == 0:
+        return False
+    return int(time.time()) - unix_timestamp >= expire_in
+
+
+class MemoryCache:
+    """
+    Bounded in-process LRU cache holding serialized values.
+
+    Values are kept as JSON strings and parsed on every hit, so callers always get a
+    fresh object they may mutate. The size of an entry is approximated by the length
+    of its JSON string.
+
+    Entries are kept for at most max_age seconds (0 means no limit) before they are read
+    again from the next tier. This bounds how long an entry invalidated by another
+    process is served from memory.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024, max_age: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (json_data, unix_timestamp, time the entry was added to memory)
+        self._entries: OrderedDict[str, tuple[str, int, float]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get_raw(self, key: str, expire_in: int = 0) -> Optional[str]:
+        """
+        Get the serialized value for a key if it exists and is not expired.
+        """
+        entry = self.get_entry(key, expire_in)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def get_entry(self, key: str, expire_in: int = 0) -> Optional[tuple[str, int]]:
+        """
+        Get the serialized value and the unix timestamp for a key if it exists and is not expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        json_data, unix_timestamp, added_at = entry
+        if is_expired(unix_timestamp, expire_in):
+            self.misses += 1
+            return None
+
+        if self.max_age and time.monotonic() - added_at >= self.max_age:
+            self.delete(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return json_data, unix_timestamp
+
+    def get(self, key: str, expire_in: int = 0) -> Any:
+        json_data = self.get_raw(key, expire_in)
+        if json_data is None:
+            return None
+        return json.loads(json_data)
+
+    def set_raw(self, key: str, json_data: str, unix_timestamp: int) -> None:
+        """
+        Set a serialized value and evict the least recently used entries if the cache is full.
+        """
+        if not self.enabled:
+            return
+
+        self.delete(key)
+
+        # Never keep a single entry larger than the full budget
+        if len(json_data) > self.max_bytes:
+            return
+
+        self._entries[key] = (json_data, unix_timestamp, time.monotonic())
+        self.num_bytes += len(json_data)
+
+        while len(self._entries) > self.max_entries or self.num_bytes > self.max_bytes:
+            _, (evicted_json_data, _, _) = self._entries.popitem(last=False)
+            self.num_bytes -= len(evicted_json_data)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.num_bytes -= len(entry[0])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.num_bytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.num_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """
+    A MemoryCache (L1) in front of the sqlite3 DatabaseCache (L2).
+
+    A get is served from memory when possible. Otherwise it falls through to sqlite3
+    and populates the memory cache. A set writes to both.
+    """
+
+    def __init__(self, database_connection: DatabaseConnection, memory_cache: MemoryCache):
+        self.database_connection = database_connection
+        self.memory_cache = memory_cache
+
+    async def get(self, key: str, expire_in: int = 0) -> Any:
+        entry = await self.get_entry(key, expire_in)
+        if entry is None:
+            return None
+        return entry[0]
+
+    async def get_entry(self, key: str, expire_in: int = 0) -> Optional[tuple[Any, int]]:
+        """
+        Get the value and the unix timestamp for a key if it exists and is not expired.
+        """
+        memory_entry = self.memory_cache.get_entry(key, expire_in)
+        if memory_entry is not None:
+            json_data, unix_timestamp = memory_entry
+            return json.loads(json_data), unix_timestamp
+
+        async with self.database_connection.transaction_scope_async() as connection:
+            result = await DatabaseCache(connection).get_raw(key)
+
+        if not result:
+            return None
+
+        json_data, unix_timestamp = result
+        if is_expired(unix_timestamp, expire_in):
+            return None
+
+        self.memory_cache.set_raw(key, json_data, unix_timestamp)
+        return json.loads(json_data), unix_timestamp
+
+    async def set(self, key: str, data: Any, tags: Optional[Iterable[str]] = None) -> None:
+        json_data = dumps(data)
+        unix_timestamp = int(time.time())
+
+        async with self.database_connection.write_transaction_scope_async() as connection:
+            database_cache = DatabaseCache(connection)
+            await database_cache.set_raw(key, json_data, unix_timestamp)
+            if tags is not None:
+                await database_cache.set_tags(key, tags)
+
+        self.memory_cache.set_raw(key, json_data, unix_timestamp)
+
+    async def delete_tags(self, tags: Iterable[str]) -> list[str]:
+        """
+        Delete all values tagged with any of the tags from both tiers. Returns the deleted keys.
+        """
+        async with self.database_connection.write_transaction_scope_async() as connection:
+            keys = await DatabaseCache(connection).delete_tags(tags)
+
+        for key in keys:
+            self.memory_cache.delete(key)
+        return keys
@@ -24,9 +24,21 @@ async def get_user(user_id: int):
         user = cursor.fetchone()
         return user
 ```
+
+Connection pooling:
+
+When the app is running, asynchronous transaction scopes use a connection pool per
+database URL (opened and closed in the app lifespan with `open_connection_pools` and
+`close_connection_pools`). Each pool keeps long-lived reader connections for
+`transaction_scope_async` and a single serialized writer connection for
+`write_transaction_scope_async`. Outside the app (CLI, cron, tests) a new connection is
+opened and closed per transaction scope.
 """
 
+import asyncio
 import sqlite3
+import time
+import typing
 import aiosqlite
 from contextlib import asynccontextmanager, contextmanager
 from maya.core.logging import get_log
@@ -41,6 +53,175 @@ SQLITE_CONNECTION_PRAGMAS = (
     "PRAGMA synchronous=NORMAL;",
 )
 
+# Idle pooled connections are checked with a "SELECT 1" before being used again
+SQLITE_POOL_HEALTH_CHECK_IDLE_SECONDS = 60
+
+
+async def _connect_async(database_url: str) -> aiosqlite.Connection:
+    """
+    Create and configure an asynchronous database connection.
+    """
+    connection = await aiosqlite.connect(
+        database_url,
+        timeout=SQLITE_CONNECTION_TIMEOUT_SECONDS,
+        isolation_level=None,
+    )
+    connection.row_factory = sqlite3.Row
+    for pragma in SQLITE_CONNECTION_PRAGMAS:
+        await connection.execute(pragma)
+    return connection
+
+
+async def _close_quietly(connection: aiosqlite.Connection) -> None:
+    try:
+        await connection.close()
+    except Exception:
+        log.exception("Error closing pooled database connection")
+
+
+class ConnectionPool:
+    """
+    Long-lived aiosqlite connections for a single database URL.
+
+    Up to `size` idle reader connections are kept. If all readers are in use an extra
+    connection is opened and closed after use, so a reader is never waited for.
+    Writes are serialized on a single writer connection.
+    """
+
+    def __init__(self, database_url: str, size: int):
+        self.database_url = database_url
+        self.size = size
+        self._idle_readers: list[tuple[aiosqlite.Connection, float]] = []
+        self._writer: typing.Optional[aiosqlite.Connection] = None
+        self._writer_released_at = 0.0
+        self._writer_lock = asyncio.Lock()
+        self._closed = False
+
+    @asynccontextmanager
+    async def reader(self):
+        connection = await self._acquire_reader()
+        try:
+            yield connection
+        finally:
+            await self._release_reader(connection)
+
+    @asynccontextmanager
+    async def writer(self):
+        # Wait for the writer as long as sqlite3 would wait for a lock held by another process
+        try:
+            await asyncio.wait_for(self._writer_lock.acquire(), timeout=SQLITE_CONNECTION_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise sqlite3.OperationalError("database is locked (pooled writer connection is busy)")
+
+        try:
+            if self._writer is None:
+                self._writer = await _connect_async(self.database_url)
+            else:
+                self._writer = await self._check_health(self._writer, self._writer_released_at)
+
+            connection = self._writer
+            try:
+                yield connection
+            finally:
+                if self._closed or not await self._reset(connection):
+                    self._writer = None
+                    await _close_quietly(connection)
+                self._writer_released_at = time.monotonic()
+        finally:
+            self._writer_lock.release()
+
+    async def _acquire_reader(self) -> aiosqlite.Connection:
+        if self._idle_readers:
+            connection, released_at = self._idle_readers.pop()
+            return await self._check_health(connection, released_at)
+
+        return await _connect_async(self.database_url)
+
+    async def _release_reader(self, connection: aiosqlite.Connection) -> None:
+        if self._closed or len(self._idle_readers) >= self.size or not await self._reset(connection):
+            await _close_quietly(connection)
+            return
+
+        self._idle_readers.append((connection, time.monotonic()))
+
+    async def _check_health(self, connection: aiosqlite.Connection, released_at: float) -> aiosqlite.Connection:
+        """
+        Replace a connection that has been idle for a while and no longer responds.
+        """
+        if time.monotonic() - released_at < SQLITE_POOL_HEALTH_CHECK_IDLE_SECONDS:
+            return connection
+
+        try:
+            await connection.execute("SELECT 1")
+            return connection
+        except Exception:
+            log.warning(f"Replacing unhealthy pooled database connection: {self.database_url}")
+            await _close_quietly(connection)
+            return await _connect_async(self.database_url)
+
+    async def _reset(self, connection: aiosqlite.Connection) -> bool:
+        """
+        Make sure a connection is not left inside a transaction before it is reused.
+        E.g. if the task using it was cancelled. Returns False if the connection should be discarded.
+        """
+        try:
+            if connection.in_transaction:
+                await connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._closed = True
+        idle_readers, self._idle_readers = self._idle_readers, []
+        for connection, _ in idle_readers:
+            await _close_quietly(connection)
+
+        async with self._writer_lock:
+            if self._writer is not None:
+                await _close_quietly(self._writer)
+                self._writer = None
+
+
+_connection_pools: dict[str, ConnectionPool] = {}
+_connection_pool_size: typing.Optional[int] = None
+
+
+async def open_connection_pools(size: int) -> None:
+    """
+    Enable connection pools. Called from the app lifespan. A size of 0 disables pooling.
+    Pools are created per database URL on first use.
+    """
+    global _connection_pool_size
+    _connection_pool_size = size if size > 0 else None
+
+
+async def close_connection_pools() -> None:
+    """
+    Close all pooled connections. Called from the app lifespan.
+    """
+    global _connection_pool_size
+    _connection_pool_size = None
+
+    pools = list(_connection_pools.values())
+    _connection_pools.clear()
+    for pool in pools:
+        await pool.close()
+
+
+def get_connection_pool(database_url: str) -> typing.Optional[ConnectionPool]:
+    """
+    Get the connection pool for a database URL. None if pools are not opened.
+    """
+    if _connection_pool_size is None or not database_url or database_url == ":memory:":
+        return None
+
+    pool = _connection_pools.get(database_url)
+    if pool is None:
+        pool = ConnectionPool(database_url, _connection_pool_size)
+        _connection_pools[database_url] = pool
+    return pool
+
 
 class DatabaseConnection:
     def __init__(self, database_url):
@@ -108,18 +289,7 @@ class DatabaseConnection:
         if not self.database_url:
             raise ValueError("Database URL was not set")
 
-        connection = await aiosqlite.connect(
-            self.database_url,
-            timeout=SQLITE_CONNECTION_TIMEOUT_SECONDS,
-            isolation_level=None,
-        )
-        connection.row_factory = sqlite3.Row
-        await self._configure_async_connection(connection)
-        return connection
-
-    async def _configure_async_connection(self, connection: aiosqlite.Connection) -> None:
-        for pragma in SQLITE_CONNECTION_PRAGMAS:
-            await connection.execute(pragma)
+        return await _connect_async(self.database_url)
 
     @asynccontextmanager
     async def transaction_scope_async(self):
@@ -141,10 +311,30 @@ class DatabaseConnection:
     async def _transaction_scope_async(self, begin_statement):
         """
         Asynchronous transaction scope context manager.
+        Uses a pooled connection when connection pools are opened.
         """
+        pool = get_connection_pool(self.database_url)
+        if pool is not None:
+            pooled_connection = pool.writer() if begin_statement == "BEGIN IMMEDIATE" else pool.reader()
+            async with pooled_connection as connection:
+                async with self._transaction_async(connection, begin_statement):
+                    yield connection
+            return
+
         connection = await self.get_db_connection_async()
         try:
-            await connection.execute(begin_statement)
+            async with self._transaction_async(connection, begin_statement):
+                yield connection
+        finally:
+            await connection.close()
+
+    @asynccontextmanager
+    async def _transaction_async(self, connection: aiosqlite.Connection, begin_statement):
+        """
+        Begin a transaction. Commit it on success and roll it back on errors.
+        """
+        await connection.execute(begin_statement)
+        try:
             yield connection
             await connection.commit()
         except (sqlite3.Error, aiosqlite.Error):
@@ -153,5 +343,3 @@ class DatabaseConnection:
         except Exception:
             await connection.rollback()
             raise
-        finally:
-            await connection.close()
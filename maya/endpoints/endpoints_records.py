@@ -10,47 +10,110 @@ from maya.core.context import get_context
 from maya.core.logging import get_log
 from maya.core import api
 from maya.core import cookie
+from maya.core import etag
+from maya.core import search_query
+from maya.core import navigation_store
+from maya.core import prefetch
 from maya.core.dataclasses import RecordPagination
 import asyncio
+import functools
 import json
 import typing
 import copy
-from maya.endpoints.endpoints_utils import get_record_data
+from maya.endpoints.endpoints_utils import get_record_data, set_record_presigned_urls
 
 log = get_log()
 
 
 def _get_search_query_params(query_params: list) -> list:
-    """Use the search query params as a stable cache key and fetch template."""
-    return [tuple(item) for item in query_params if item[0] != "start"]
+    """Use the canonical search query params as a stable cache key and fetch template."""
+    return list(search_query.canonicalize(query_params, remove_keys=["start"]))
 
 
-def _get_search_page_size(query_params: list) -> int:
-    for key, value in query_params:
-        if key == "size":
-            try:
-                return max(int(value), 1)
-            except (TypeError, ValueError):
-                break
-    return 20
+# Number of record ids per id-only (view=ids) page. The id pages are cursor-paginated, so
+# a page is found by following next_cursor from the first page. The page that holds the
+# current record is stored as the navigation window together with its next_cursor.
+NAVIGATION_ID_PAGE_SIZE = 1000
 
+# Record navigation is limited to the positions the api returns search results for
+NAVIGATION_MAX_POSITION = api.MAX_SEARCH_RESULTS
 
-def _get_search_page_cache(request: Request, query_params: list) -> typing.Optional[dict]:
+# Max number of id pages a single request may fetch
+NAVIGATION_MAX_ID_PAGES = NAVIGATION_MAX_POSITION // NAVIGATION_ID_PAGE_SIZE
+
+# Query params that are replaced when fetching an id page
+ID_WINDOW_REPLACE_KEYS = {"view", "size", "start", "cursor"}
+
+
+def _get_id_window_query_params(query_params: list, cursor: typing.Optional[str] = None) -> list:
+    """
+    Get the query params for an id-only (view=ids) page of NAVIGATION_ID_PAGE_SIZE ids.
+    """
+    window_query_params = [(key, value) for key, value in query_params if key not in ID_WINDOW_REPLACE_KEYS]
+    window_query_params.extend([("view", "ids"), ("size", str(NAVIGATION_ID_PAGE_SIZE))])
+    if cursor:
+        window_query_params.append(("cursor", cursor))
+    return window_query_params
+
+
+async def _fetch_id_window(
+    query_params: list, position: int, use_cache: bool, cache: typing.Optional[dict] = None
+) -> typing.Optional[dict]:
+    """
+    Fetch the id page that contains the position. If the position is on the page after the
+    stored window, only that page is fetched using the stored next_cursor. Otherwise
+    next_cursor is followed from the first page, at most NAVIGATION_MAX_ID_PAGES pages.
+    The last id of the previous page is kept, so the previous record is in the window.
+    """
+    start = 0
+    cursor = None
+    previous_ids: list = []
+    if cache and cache.get("next_cursor"):
+        cache_end = cache["start"] + len(cache["record_ids"])
+        if cache_end < position <= cache_end + NAVIGATION_ID_PAGE_SIZE:
+            start = cache_end
+            cursor = cache["next_cursor"]
+            previous_ids = cache["record_ids"][-1:]
+
+    for _ in range(NAVIGATION_MAX_ID_PAGES):
+        ids_result = await api.proxies_view_ids_from_list(_get_id_window_query_params(query_params, cursor), use_cache=use_cache)
+        page_ids = ids_result.get("result")
+        if not isinstance(page_ids, list):
+            return None
+
+        page_ids = [str(record_id) for record_id in page_ids]
+        cursor = ids_result.get("next_cursor") or None
+        if position <= start + len(page_ids) or not cursor or not page_ids:
+            return {"start": start - len(previous_ids), "record_ids": previous_ids + page_ids, "next_cursor": cursor}
+
+        start += len(page_ids)
+        previous_ids = page_ids[-1:]
+
+    return None
+
+
+def _window_contains(cache: dict, position: int) -> bool:
+    return cache["start"] < position <= cache["start"] + len(cache["record_ids"])
+
+
+async def _get_search_page_cache(request: Request, query_params: list) -> typing.Optional[dict]:
     """
     Get the internal ephemeral cache for the active search page.
     """
     try:
-        cache = request.session.get("record_navigation_cache")
+        cache = await navigation_store.get_navigation_state(request)
         assert isinstance(cache, dict)
 
-        cached_query_params = [tuple(item) for item in cache["query_params"]]
-        if cached_query_params != query_params:
+        cached_query_params = list(search_query.canonicalize(cache["query_params"]))
+        if cached_query_params != list(search_query.canonicalize(query_params)):
             return None
 
         start = int(cache["start"])
         size = int(cache["size"])
         total = int(cache["total"])
         record_ids = [str(record_id) for record_id in cache["record_ids"]]
+        next_cursor = cache.get("next_cursor")
+        assert next_cursor is None or isinstance(next_cursor, str)
 
         return {
             "query_params": cached_query_params,
@@ -58,50 +121,56 @@ def _get_search_page_cache(request: Request, query_params: list) -> typing.Optio
             "size": size,
             "total": total,
             "record_ids": record_ids,
+            "next_cursor": next_cursor,
         }
     except (AssertionError, KeyError, TypeError, ValueError):
         return None
 
 
-def _set_search_page_cache(request: Request, cache: dict) -> None:
-    """Persist the internal ephemeral record navigation cache in the session."""
-    request.session["record_navigation_cache"] = {
-        "query_params": [list(item) for item in cache["query_params"]],
-        "start": cache["start"],
-        "size": cache["size"],
-        "total": cache["total"],
-        "record_ids": cache["record_ids"],
-    }
+async def _set_search_page_cache(request: Request, cache: dict) -> None:
+    """Persist the internal ephemeral record navigation cache in the navigation store."""
+    await navigation_store.set_navigation_state(
+        request,
+        {
+            "query_params": [list(item) for item in cache["query_params"]],
+            "start": cache["start"],
+            "size": cache["size"],
+            "total": cache["total"],
+            "record_ids": cache["record_ids"],
+            "next_cursor": cache.get("next_cursor"),
+        },
+    )
 
 
 async def _get_search_page_for_position(request: Request, query_params: list, total: int, position: int) -> typing.Optional[dict]:
     """
-    Get the cached search page that contains the absolute search position.
-    Fetch a fresh page only when navigation crosses the cached page boundaries.
+    Get the cached record ids that contain the absolute search position.
+    Fetch an id window only when navigation leaves the cached ids. The window is fetched
+    from id-only pages (view=ids), which are cached per canonical query for anonymous users.
+    Positions after NAVIGATION_MAX_POSITION are refused.
     """
-    size = _get_search_page_size(query_params)
-    expected_start = ((position - 1) // size) * size
+    if position > NAVIGATION_MAX_POSITION:
+        return None
 
-    cache = _get_search_page_cache(request, query_params)
-    if cache and cache["start"] == expected_start and cache["size"] == size:
+    cache = await _get_search_page_cache(request, query_params)
+    if cache and _window_contains(cache, position):
         return cache
 
-    page_query_params = query_params.copy()
-    page_query_params.append(("start", str(expected_start)))
-    search_result = await api.proxies_records(request, page_query_params)
-
-    try:
-        cache = {
-            "query_params": query_params,
-            "start": int(search_result.get("start", expected_start)),
-            "size": int(search_result.get("size", size)),
-            "total": int(search_result.get("total", total)),
-            "record_ids": [str(record["id"]) for record in search_result.get("result", []) if record.get("id")],
-        }
-    except (TypeError, ValueError):
+    use_cache = not await api.is_logged_in(request)
+    window = await _fetch_id_window(query_params, position, use_cache, cache)
+    if window is None:
         return None
 
-    _set_search_page_cache(request, cache)
+    cache = {
+        "query_params": query_params,
+        "start": window["start"],
+        "size": NAVIGATION_ID_PAGE_SIZE,
+        "total": total,
+        "record_ids": window["record_ids"],
+        "next_cursor": window["next_cursor"],
+    }
+
+    await _set_search_page_cache(request, cache)
     return cache
 
 
@@ -186,6 +255,15 @@ async def _get_record_pagination(request: Request) -> typing.Optional[RecordPagi
     return record_pagination_obj
 
 
+def _prefetch_adjacent_records(request: Request, record_pagination: RecordPagination) -> None:
+    """
+    Prefetch the next and previous record of the search into the record cache.
+    """
+    for record_id in (record_pagination.next_record, record_pagination.prev_record):
+        if record_id:
+            prefetch.schedule(f"record:{record_id}", functools.partial(api.proxies_record_get_by_id, request, record_id))
+
+
 async def records_get(request: Request):
     """
     Display a single record
@@ -196,7 +274,15 @@ async def records_get(request: Request):
         raise HTTPException(404)
 
     record_pagination, record = await asyncio.gather(_get_record_pagination(request), api.proxies_record_get_by_id(request, record_id))
-    record, meta_data, record_and_types = await get_record_data(request, record)
+
+    # The page holds the pre-signed URLs, which change before they expire. So they are part of the ETag
+    record = await set_record_presigned_urls(record)
+
+    etag_headers = etag.get_headers(request, record, record_pagination, last_modified=record.get("last_updated"))
+    if etag.is_not_modified(request, etag_headers):
+        return etag.get_not_modified_response(etag_headers)
+
+    record, meta_data, record_and_types = await get_record_data(request, record, presigned_urls_set=True)
 
     context_variables = {
         "title": meta_data["title"],
@@ -208,7 +294,12 @@ async def records_get(request: Request):
     }
 
     context = await get_context(request, context_variables, "record")
-    return templates.TemplateResponse(request, "records/record.html", context)
+    response = templates.TemplateResponse(request, "records/record.html", context, headers=etag_headers)
+
+    if record_pagination and not await api.is_logged_in(request):
+        _prefetch_adjacent_records(request, record_pagination)
+
+    return response
 
 
 async def records_get_misc(request: Request):
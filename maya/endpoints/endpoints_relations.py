@@ -3,17 +3,64 @@ from starlette.responses import JSONResponse
 from maya.core.logging import get_log
 from maya.core.api_error import OpenAwsException
 from maya.core import api
+from maya.core.proxy_cache import get_resource_tag, proxy_cache_invalidate_tags
 from maya.core.relations import format_relations, sort_data
 from maya.core.auth import is_authenticated
 
 log = get_log()
 
 
+def _get_relation_tags(data) -> list[str]:
+    """
+    Get the cache tags of the subject and the object of a relation.
+    """
+    tags = []
+    for part in ("subject", "object"):
+        domain = data.get(f"{part}_domain")
+        id = data.get(f"{part}_id")
+        if domain and id:
+            tags.append(get_resource_tag(str(domain), str(id)))
+    return tags
+
+
+async def _invalidate_relation_cache(data) -> None:
+    try:
+        await proxy_cache_invalidate_tags(_get_relation_tags(data))
+    except Exception:
+        log.exception("Error invalidating the cache after a relation change")
+
+
+async def _get_relation_data(request: Request) -> dict:
+    """
+    Get the subject and the object of the relation to delete. The object is looked up in the
+    relations of the subject. The object in the query params is only used if it is not found.
+    """
+    rel_id = request.path_params.get("rel_id", "")
+    data = {key: request.query_params.get(key) for key in ("subject_domain", "subject_id", "object_domain", "object_id")}
+    if not data["subject_domain"] or not data["subject_id"]:
+        return data
+
+    try:
+        relations = await api.proxies_get_relations(request, str(data["subject_domain"]), str(data["subject_id"]))
+    except Exception:
+        log.exception("Error getting the relations of the subject of a deleted relation")
+        return data
+
+    for relation in relations:
+        if str(relation.get("rel_id")) == rel_id and relation.get("domain") and relation.get("id"):
+            data["object_domain"] = relation["domain"]
+            data["object_id"] = relation["id"]
+            break
+
+    return data
+
+
 async def relations_post(request: Request):
     await is_authenticated(request, permissions=["employee"])
 
     try:
         await api.proxies_post_relations(request)
+        await _invalidate_relation_cache(await request.form())
         return JSONResponse({"error": False, "message": "Relation er oprettet"})
 
     except OpenAwsException as e:
@@ -50,7 +97,10 @@ async def relations_get(request: Request):
 async def relations_delete(request: Request):
     await is_authenticated(request, permissions=["employee"])
     try:
+        # The relation is looked up before it is deleted
+        relation_data = await _get_relation_data(request)
         await api.proxies_delete_relations(request)
+        await _invalidate_relation_cache(relation_data)
         return JSONResponse({"error": False, "message": "Relation er slettet"})
 
     except OpenAwsException as e:
@@ -15,9 +15,11 @@ from maya.core.templates import templates
 from maya.core.context import get_context
 from maya.core.logging import get_log
 from maya.core import api
+from maya.core import etag
 from maya.resources import resource_alter
 from maya.core.hooks import get_hooks
 from maya.core.object_storage import set_presigned_urls_resource
+from maya.core.request_timing import measure
 import json
 
 log = get_log()
@@ -42,10 +44,10 @@ async def _get_resource(request: Request):
     return resource
 
 
-async def _get_resource_context(request):
-    resource = await _get_resource(request)
+async def _get_resource_context(request, resource: dict):
     title = resource["display_label"]
-    resource = resource_alter.resource_alter(resource)
+    with measure("normalize", "resource_alter"):
+        resource = resource_alter.resource_alter(resource)
     resource["meta"]["title"] = title
     resource_type = request.path_params["resource_type"]
 
@@ -75,9 +77,15 @@ async def get_resource(request: Request):
     if not id.isdigit():
         raise HTTPException(status_code=404, detail="Resource id not found")
 
-    context = await _get_resource_context(request)
+    resource = await _get_resource(request)
+
+    etag_headers = etag.get_headers(request, resource)
+    if etag.is_not_modified(request, etag_headers):
+        return etag.get_not_modified_response(etag_headers)
+
+    context = await _get_resource_context(request, resource)
     template_path = resource_templates[resource_type]
-    response = templates.TemplateResponse(request, template_path, context)
+    response = templates.TemplateResponse(request, template_path, context, headers=etag_headers)
     return response
 
 
@@ -91,7 +99,7 @@ async def get_resource_json(request: Request):
         resource_json = json.dumps(resource_api, indent=4, ensure_ascii=False)
         return PlainTextResponse(resource_json)
     elif json_type == "resource_and_types":
-        context = await _get_resource_context(request)
+        context = await _get_resource_context(request, await _get_resource(request))
         resource_json = json.dumps(context["resource"], indent=4, ensure_ascii=False)
         return PlainTextResponse(resource_json)
 
@@ -11,13 +11,19 @@ from maya.core.translate import translate
 from maya.core.logging import get_log
 from maya.core.dynamic_settings import settings
 from maya.core import api
+from maya.core import etag
 import json
+import typing
 from maya.records.normalize_facets import NormalizeFacets
+from maya.records import facet_tree
 from maya.core import query
+from maya.core import search_query
+from maya.core import prefetch
 from maya.core.hooks import get_hooks
 from maya.records import normalize_dates
 from maya.settings_query_params import settings_query_params
-from maya.core.object_storage import set_presigned_urls_search
+from maya.core.object_storage import set_presigned_urls_search_results
+from maya.core.request_timing import measure
 
 log = get_log()
 
@@ -213,11 +219,12 @@ def _get_facets_and_filters(request: Request, search_result: dict, query_params=
     return facets, facets_filters
 
 
-def set_response_cookie(response: Response, context: dict):
+def set_response_cookie(response: Response, context: dict, request: typing.Optional[Request] = None):
     """
     Set cookies for search page
     This is a public function so it can be used in other endpoints where a search may be performed
     It is based on the context values used in the search page, e.g. size, sort and view
+    If the request is given then cookies that the request already has with the same value are not sent again
     """
 
     size = context.get("size")
@@ -233,15 +240,16 @@ def set_response_cookie(response: Response, context: dict):
     search_cookie_value = {
         # Use site specific query params set before search
         "search_query_str": context.get("search_query_str"),
-        "query_params": context.get("query_params_before_search"),
+        "query_params": search_query.to_list(search_query.canonicalize(context.get("query_params_before_search", []))),
         "total": pagination_data["total"],
         "q": context.get("q"),
     }
 
-    response.set_cookie(key="search", value=json.dumps(search_cookie_value), httponly=True)
-    response.set_cookie(key="size", value=size, httponly=True)
-    response.set_cookie(key="sort", value=sort, httponly=True)
-    response.set_cookie(key="view", value=view, httponly=True)
+    cookies = {"search": json.dumps(search_cookie_value), "size": size, "sort": sort, "view": view}
+    for key, value in cookies.items():
+        if request is not None and request.cookies.get(key) == value:
+            continue
+        response.set_cookie(key=key, value=value, httponly=True)
 
     return response
 
@@ -254,10 +262,10 @@ async def _normalize_search_result(records: dict):
     """
     facets_resolved = records["facets_resolved"]
 
-    for record in records["result"]:
+    if settings.get("boto3_presigned_urls", False):
+        await set_presigned_urls_search_results(records["result"])
 
-        if settings.get("boto3_presigned_urls", False):
-            record = await set_presigned_urls_search(record)
+    for record in records["result"]:
 
         record = normalize_dates.split_date_strings(record)
         record = normalize_dates.normalize_dates(record)
@@ -283,17 +291,37 @@ async def _normalize_search_result(records: dict):
     return records
 
 
-def _get_record_navigation_cache(search_result: dict, query_params: list) -> dict:
+def _get_api_query_params(query_params_before_search: list, q: str) -> list:
     """
-    Build an internal, ephemeral cache for record prev/next navigation on the /records page.
+    Get the query params sent to the API.
+    If q is 1 char long then alter it to "" to avoid 400 error from API
     """
-    return {
-        "query_params": [list(item) for item in query_params if item[0] != "start"],
-        "start": int(search_result.get("start", 0)),
-        "size": int(search_result.get("size", len(search_result.get("result", [])) or 0)),
-        "total": int(search_result.get("total", 0)),
-        "record_ids": [record["id"] for record in search_result.get("result", []) if record.get("id")],
-    }
+    # make copy of query_params_before_search
+    query_params = query_params_before_search.copy()
+    if q and len(q) == 1:
+        query_params.append(("q", ""))
+
+    return query_params
+
+
+def _prefetch_next_search_page(request: Request, context_values: dict) -> None:
+    """
+    Prefetch the next search page into the search cache. Skipped if the search cache is disabled.
+    """
+    if api.PROXY_CACHE_SEARCH_EXPIRE is None:
+        return
+
+    pagination_data = context_values["pagination_data"]
+    next_start = pagination_data["start"] + pagination_data["size"]
+    if next_start >= pagination_data["total"]:
+        return
+
+    query_params = [(key, value) for key, value in context_values["query_params_before_search"] if key != "start"]
+    query_params.append(("start", str(next_start)))
+    query_params = _get_api_query_params(query_params, context_values["q"])
+
+    prefetch_key = "search:" + search_query.get_key(search_query.canonicalize(query_params))
+    prefetch.schedule(prefetch_key, lambda: api.proxies_records(request, query_params))
 
 
 async def get_search_context_values(request: Request, extra_query_params: list = []) -> dict:
@@ -325,18 +353,10 @@ async def get_search_context_values(request: Request, extra_query_params: list =
     query_params_before_search = await hooks.before_get_search(query_params=query_params_before_search)
     query_str_search = query.get_str_from_list(query_params_before_search)
 
-    # If q is 1 char long then alter it to "" to avoid 400 error from API
-    # make copy of query_params_before_search
-    query_params_before_search_copy = query_params_before_search.copy()
-    if q and len(q) == 1:
-        query_params_before_search_copy.append(("q", ""))
-
-    search_result = await api.proxies_records(request, query_params_before_search_copy)
-
-    # Store internal ephemeral navigation state for the record page.
-    request.session["record_navigation_cache"] = _get_record_navigation_cache(search_result, query_params_before_search)
+    search_result = await api.proxies_records(request, _get_api_query_params(query_params_before_search, q))
 
-    search_result = await _normalize_search_result(search_result)
+    with measure("normalize", "search_result"):
+        search_result = await _normalize_search_result(search_result)
 
     # Alter query params after search
     # You may want to remove all curators except one after search results are obtained
@@ -344,12 +364,13 @@ async def get_search_context_values(request: Request, extra_query_params: list =
     search_query_str = query.get_str_from_list(query_params_after_search, remove_keys=["start"])
 
     # Get facets and filters
-    facets, facets_filters = _get_facets_and_filters(
-        request,
-        search_result,
-        query_params=query_params_after_search,
-        query_str=search_query_str,
-    )
+    with measure("normalize", "facets"):
+        facets, facets_filters = _get_facets_and_filters(
+            request,
+            search_result,
+            query_params=query_params_after_search,
+            query_str=search_query_str,
+        )
 
     pagination_data = _get_search_pagination_data(request, search_query_str, search_result["total"])
 
@@ -386,24 +407,32 @@ async def search_get(request: Request):
         return JSONResponse(view_ids_json)
 
     context_values = await get_search_context_values(request)
+
+    etag_headers = etag.get_headers(request, context_values["search_result"], context_values["query_params"])
+    if etag.is_not_modified(request, etag_headers):
+        return etag.get_not_modified_response(etag_headers)
+
     context = await get_context(request, context_values=context_values)
 
     if context_values["view"] == "list":
-        response = templates.TemplateResponse(request, "search/search.html", context)
+        response = templates.TemplateResponse(request, "search/search.html", context, headers=etag_headers)
     elif context_values["view"] == "gallery" or context_values["view"] == "grid":
-        response = templates.TemplateResponse(request, "search/search_gallery.html", context)
+        response = templates.TemplateResponse(request, "search/search_gallery.html", context, headers=etag_headers)
     else:
-        response = templates.TemplateResponse(request, "search/search.html", context)
+        response = templates.TemplateResponse(request, "search/search.html", context, headers=etag_headers)
+
+    set_response_cookie(response, context, request)
 
-    set_response_cookie(response, context)
+    if not await api.is_logged_in(request):
+        _prefetch_next_search_page(request, context_values)
 
     return response
 
 
 async def search_get_json(request: Request):
     context_values = await get_search_context_values(request)
-    response = JSONResponse(context_values)
-    set_response_cookie(response, context_values)
+    response = JSONResponse(facet_tree.to_dict(context_values))
+    set_response_cookie(response, context_values, request)
 
     return response
 
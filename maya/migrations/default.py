@@ -90,6 +90,31 @@ drop_error_logs = """
 DROP TABLE IF EXISTS error_logs;
 """
 
+create_cache_tags = """
+CREATE TABLE cache_tags (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tag, key)
+) STRICT, WITHOUT ROWID;
+CREATE INDEX idx_cache_tags_key ON cache_tags (key);
+"""
+
+# Allow zlib compressed BLOB values. Existing TEXT values are kept as they are.
+alter_cache_value_any = """
+DROP INDEX IF EXISTS idx_cache_unix_timestamp;
+ALTER TABLE cache RENAME TO cache_old;
+CREATE TABLE cache (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    value ANY,
+    unix_timestamp INTEGER NOT NULL DEFAULT 0
+) STRICT;
+INSERT INTO cache (id, key, value, unix_timestamp)
+SELECT id, key, value, unix_timestamp FROM cache_old;
+CREATE INDEX idx_cache_unix_timestamp ON cache (unix_timestamp);
+DROP TABLE cache_old;
+"""
+
 # List of migrations with keys
 migrations_default = {
     "create_bookmarks": create_booksmarks_query,
@@ -103,4 +128,6 @@ migrations_default = {
     "alter_bookmarks_table": alter_bookmarks_table,
     "rebuild_cache_table_with_unique_key": rebuild_cache_table_with_unique_key,
     "drop_error_logs": drop_error_logs,
+    "create_cache_tags": create_cache_tags,
+    "alter_cache_value_any": alter_cache_value_any,
 }
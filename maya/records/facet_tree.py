@@ -0,0 +1,150 @@
+"""
+The facet tree from `settings_facets`, compiled once into an immutable structure.
+
+Dicts are compiled into read-only mappings and lists into tuples, so one tree is shared
+by all requests and never copied. The per-request state of a node (count, checked state
+and links) is kept in an overlay keyed by node id. `FacetView` combines a node of the
+tree with the overlay, so templates read it as if it was a plain dict.
+
+Each "default" facet also gets an index of its nodes by id (see `get_facet_index`), so a
+search only touches the ids that are counted or checked, never the whole tree.
+"""
+
+from collections.abc import Mapping
+import functools
+import types
+import typing
+
+from maya.core.dynamic_settings import settings_facets
+from maya.core.query import QueryState
+
+# Keys that hold the child nodes of a top-level facet or a node
+CHILDREN_KEYS = ("content", "children")
+
+_EMPTY_STATE: Mapping = types.MappingProxyType({})
+
+
+def freeze(value: typing.Any) -> typing.Any:
+    """
+    Compile dicts into read-only mappings and lists into tuples, recursively.
+    """
+    if isinstance(value, dict):
+        return types.MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def to_dict(value: typing.Any) -> typing.Any:
+    """
+    Turn read-only mappings, facet views and tuples back into dicts and lists, recursively.
+    E.g. before the facets are serialized as JSON.
+    """
+    if isinstance(value, Mapping):
+        return {key: to_dict(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dict(item) for item in value]
+    return value
+
+
+@functools.cache
+def get_facet_tree() -> Mapping:
+    """
+    Get the compiled facet tree. It is compiled on the first call.
+    """
+    return freeze(settings_facets)
+
+
+@functools.cache
+def get_facet_index(facet_name: str) -> Mapping[str, tuple[str, ...]]:
+    """
+    Get the path labels of the nodes of a facet by node id, e.g.
+    {"64": ("Materialetype > Billeder > By- og gadebilleder",)}
+    The same id may be used by more than one node in the tree.
+    """
+    facet = get_facet_tree()[facet_name]
+    index: dict[str, tuple[str, ...]] = {}
+
+    def add_nodes(nodes: typing.Iterable[Mapping], path_labels: list[str]) -> None:
+        for node in nodes:
+            node_path_labels = path_labels + [node["label"]]
+            index[node["id"]] = index.get(node["id"], ()) + (" > ".join(node_path_labels),)
+            add_nodes(node.get("children", ()), node_path_labels)
+
+    add_nodes(facet["content"], [facet["label"]])
+    return types.MappingProxyType(index)
+
+
+class FacetOverlay:
+    """
+    The per-request state of the nodes of a "default" facet, keyed by node id.
+
+    Only the state of checked nodes is stored. The state of all other nodes is
+    computed when a template reads the node. The add link is only built when it is read.
+    """
+
+    __slots__ = ("_facet_name", "_counts", "_checked", "_query_state")
+
+    def __init__(self, facet_name: str, counts: Mapping, checked: Mapping[str, Mapping], query_state: QueryState):
+        self._facet_name = facet_name
+        self._counts = counts
+        self._checked = checked
+        self._query_state = query_state
+
+    def get_count(self, node_id: str) -> int:
+        try:
+            return self._counts[node_id]["count"]
+        except KeyError:
+            return 0
+
+    def get(self, node_id: typing.Optional[str], default: Mapping = _EMPTY_STATE) -> Mapping:
+        if node_id is None:
+            return default
+
+        count = self.get_count(node_id)
+        checked_state = self._checked.get(node_id)
+        if checked_state is not None:
+            return {"count": count, "checked": True, **checked_state}
+
+        add_link = functools.partial(self._query_state.get_add_link, self._facet_name, node_id)
+        return {"count": count, "checked": False, "add_link": add_link}
+
+
+class FacetView(Mapping):
+    """
+    A read-only view of a facet tree node with the per-request state of the node on top.
+    overlay maps node ids to state, e.g. {"images": {"count": 10, "checked": False, ...}}
+    The state is read from the overlay once, when the view is first read. Callable
+    values in the state (e.g. links) are called when their key is read.
+    """
+
+    __slots__ = ("_node", "_overlay", "_state")
+
+    def __init__(self, node: Mapping, overlay: typing.Union[Mapping, FacetOverlay]):
+        self._node = node
+        self._overlay = overlay
+        self._state: typing.Optional[Mapping] = None
+
+    def _get_state(self) -> Mapping:
+        if self._state is None:
+            self._state = self._overlay.get(self._node.get("id"), _EMPTY_STATE)
+        return self._state
+
+    def __getitem__(self, key: str) -> typing.Any:
+        state = self._get_state()
+        if key in state:
+            value = state[key]
+            return value() if callable(value) else value
+
+        value = self._node[key]
+        if key in CHILDREN_KEYS:
+            return [FacetView(child, self._overlay) for child in value]
+        return value
+
+    def __iter__(self) -> typing.Iterator[str]:
+        state = self._get_state()
+        yield from self._node
+        yield from (key for key in state if key not in self._node)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
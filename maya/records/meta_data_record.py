@@ -53,9 +53,10 @@ async def get_record_meta_data(
     """
     Get usefull meta data for a record
     """
-    is_logged_in = await api.is_logged_in(request)
-    verified = await api.me_verified(request)
-    is_employee = await api.has_permission(request, "employee")
+    principal = await api.get_principal(request)
+    is_logged_in = principal.is_logged_in
+    verified = principal.is_verified
+    is_employee = principal.has_permission("employee")
 
     meta_data = {}
 
@@ -6,9 +6,9 @@ Filters is the list of search filters that are displayed on the top of the searc
 
 from maya.core.logging import get_log
 from starlette.requests import Request
-from maya.core.dynamic_settings import get_settings_facets
+from maya.core.query import QueryState
+from maya.records.facet_tree import FacetOverlay, FacetView, get_facet_index, get_facet_tree
 from maya.settings_query_params import settings_query_params
-from urllib.parse import quote_plus
 
 log = get_log()
 
@@ -20,72 +20,73 @@ class NormalizeFacets:
         self._active_facets = search_result["active_facets"]
         self._query_params = query_params
         self._query_str = query_str
+        self._query_state = QueryState(query_str)
         self._facets_resolved = search_result["facets_resolved"]
-        self._filters: list = []
-        self._facets = get_settings_facets()
+        self._facets = get_facet_tree()
 
         # query params without the "-" (negated) prefix
         self._query_params_cleaned = [(name.lstrip("-"), value) for name, value in self._query_params]
 
         # All query params that are negated
-        self._query_params_negated = [(name.lstrip("-"), value) for name, value in self._query_params if name.startswith("-")]
+        self._query_params_negated = {(name.lstrip("-"), value) for name, value in self._query_params if name.startswith("-")}
 
-    def _transform_default_facets(self, facet_name, children, tree_path_labels=None):
+        # Checked values by query name in query param order, e.g. {"content_types": {"61": None, "64": None}}
+        self._checked_values: dict[str, dict[str, None]] = {}
+        for name, value in self._query_params_cleaned:
+            self._checked_values.setdefault(name, {})[value] = None
+
+    def _get_default_facet_overlay(self, facet_name):
         """
-        Transform the type of "default" facets in order to display them on the search page.
+        Get the state of the nodes of a "default" facet in order to display them on the search page.
+        Only the checked nodes are visited here. The tree is not altered.
         """
+        checked = {}
+        for query_value in self._checked_values.get(facet_name, ()):
+            checked[query_value] = {
+                "remove_link": self._get_remove_link(facet_name, query_value),
+                "invert_link": self._get_invert_link(facet_name, query_value),
+            }
 
-        if tree_path_labels is None:
-            tree_path_labels = [self._facets[facet_name]["label"]]
-
-        for facet in children:
-            tree_path_labels_current = tree_path_labels + [facet["label"]]
-
-            if "children" in facet:
-                self._transform_default_facets(facet_name, facet["children"], tree_path_labels_current)
-
-            try:
-                facet_count = self._active_facets[facet_name][facet["id"]]["count"]
-            except KeyError:
-                facet_count = 0
-
-            facet["count"] = facet_count
-
-            search = (facet_name, facet["id"])
-            if search in self._query_params_cleaned:
-                # If the facet is checked then set checked to True
-                facet["checked"] = True
-
-                remove_link = self._get_remove_link(facet_name, facet["id"])
-                invert_link = self._get_invert_link(facet_name, facet["id"])
+        return FacetOverlay(facet_name, self._active_facets.get(facet_name, {}), checked, self._query_state)
 
-                facet["remove_link"] = remove_link
-                facet["invert_link"] = invert_link
+    def _get_default_facet_filters(self):
+        """
+        Generate a search filter for every checked node of the "default" facets.
+        The labels are read from the facet index.
+        """
+        filters = []
+        for facet_name, query_values in self._checked_values.items():
+            if self._facets.get(facet_name, {}).get("type") != "default":
+                continue
 
-                # Generate a search filter
-                filter = {}
-                filter["negated"] = search in self._query_params_negated
-                filter["label"] = " > ".join(tree_path_labels_current)
-                filter["query_name"] = facet_name
-                filter["query_value"] = facet["id"]
-                filter["remove_link"] = remove_link
-                filter["invert_link"] = invert_link
-                self._filters.append(filter)
+            facet_index = get_facet_index(facet_name)
+            for query_value in query_values:
+                for label in facet_index.get(query_value, ()):
+                    filter = {}
+                    filter["negated"] = (facet_name, query_value) in self._query_params_negated
+                    filter["label"] = label
+                    filter["query_name"] = facet_name
+                    filter["query_value"] = query_value
+                    filter["remove_link"] = self._get_remove_link(facet_name, query_value)
+                    filter["invert_link"] = self._get_invert_link(facet_name, query_value)
+                    filters.append(filter)
 
-            else:
-                facet["checked"] = False
-                facet["add_link"] = self._query_str + f"{facet_name}={facet['id']}&"
+        return filters
 
     def get_transformed_facets(self):
         """
-        Alter the facets content with the count from the search facets. Also add
-        a checked key to the facets content if the facet is checked in the query_params.
+        Get the facets with the count from the search facets. Also add a checked
+        key to the facets content if the facet is checked in the query_params.
+        "default" facets are returned as views of the shared facet tree.
         """
+        facets = {}
         for key, value in self._facets.items():
             if value["type"] == "default":
-                self._transform_default_facets(key, value["content"])
+                facets[key] = FacetView(value, self._get_default_facet_overlay(key))
+            else:
+                facets[key] = value
 
-        return self._facets
+        return facets
 
     def _get_facets_resolved_label(self, key, value):
         """
@@ -144,11 +145,13 @@ class NormalizeFacets:
         """
         Sort the search filters based on the query_params order
         """
-        # remove duplicates
-        filters = [dict(t) for t in {tuple(facet.items()) for facet in filters}]
+        # remove duplicates and keep the first occurrence
+        filters = [dict(t) for t in dict.fromkeys(tuple(facet.items()) for facet in filters)]
 
-        # Sort the search filters based on the query_params order
-        query_order = {(name, value): index for index, (name, value) in enumerate(self._query_params)}
+        # Sort the search filters based on the query_params order. Negated params sort by their cleaned name.
+        query_order: dict[tuple, int] = {}
+        for index, name_value in enumerate(self._query_params_cleaned):
+            query_order.setdefault(name_value, index)
 
         # Sort the search filters based on the query_order
         sorted_facets_checked = sorted(filters, key=lambda x: query_order.get((x["query_name"], x["query_value"]), float("inf")))
@@ -160,15 +163,13 @@ class NormalizeFacets:
         Get all active search filters.
         """
 
-        # self._filters have been populated by the _transform_default_facets method.
-        # This method will only add filters that has not been generated by the _transform_default_facets
-        # method.
-        filters = self._filters
+        # Filters of the "default" facets are labeled with the path in the facet tree
+        filters = self._get_default_facet_filters()
 
-        # Ignore keys where filters have been generated from _transform_default_facets method
+        # Ignore keys where filters have been generated by the _get_default_facet_filters method
         # These has the type "default" in settings_facets
-        ignore_keys = [key for key in self._facets.keys() if self._facets[key].get("type") == "default"]
-        ignore_keys.extend(["size", "start", "sort", "direction", "view", "q"])
+        ignore_keys = {key for key in self._facets.keys() if self._facets[key].get("type") == "default"}
+        ignore_keys.update(["size", "start", "sort", "direction", "view", "q"])
 
         for query_name, query_value in self._query_params_cleaned:
             # Ignore empty query values
@@ -205,27 +206,13 @@ class NormalizeFacets:
         """
         Get the invert link for a facet.
         """
-        query_negated = f"-{query_name}={quote_plus(query_value)}&"
-        query_not_negated = f"{query_name}={quote_plus(query_value)}&"
-
-        # create negated query
-        if query_negated in self._query_str:
-            return self._query_str.replace(query_negated, query_not_negated)
-        else:
-            return self._query_str.replace(query_not_negated, query_negated)
+        return self._query_state.get_invert_link(query_name, query_value)
 
     def _get_remove_link(self, query_name, query_value):
         """
         Get the remove link for a facet.
         """
-        query_negated = f"-{query_name}={quote_plus(query_value)}&"
-        query_not_negated = f"{query_name}={quote_plus(query_value)}&"
-
-        # create remove query
-        if query_negated in self._query_str:
-            return self._query_str.replace(query_negated, "")
-        else:
-            return self._query_str.replace(query_not_negated, "")
+        return self._query_state.get_remove_link(query_name, query_value)
 
 
 def _str_to_date(date: str):
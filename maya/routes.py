@@ -23,7 +23,7 @@ from maya.endpoints import (
 import os
 from maya.core.dynamic_settings import settings
 from maya.core.multi_static import MultiStaticFiles
-from maya.core.paths import get_base_dir_path
+from maya.core.paths import get_base_dir_path, STATIC_PATH_PREFIX
 from maya.core.logging import get_log
 from maya.core.module_loader import load_attr_from_file
 from typing import Any
@@ -109,7 +109,7 @@ async def favicon(request: Request):
 
 # Add basic routes
 routes = [
-    Mount("/static", MultiStaticFiles(directories=_get_static_dirs()), name="static"),
+    Mount(STATIC_PATH_PREFIX, MultiStaticFiles(directories=_get_static_dirs()), name="static"),
     Route("/robots.txt", robots_txt),
     Route("/sitemap.xml", sitemap_xml),
     Route("/sitemap-{name:str}.xml", sitemap_file),
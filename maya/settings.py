@@ -38,6 +38,7 @@ settings: Settings = {
     "log_level": log_level,
     "log_handlers": ["stream", "rotating_file"],
     "log_api_calls": False,
+    "server_timing_header": True,
     "cookie": {
         "name": "session",
         "lifetime": 3600 * 24,  # seconds
@@ -49,6 +50,13 @@ settings: Settings = {
     "api_base_url": "https://dev.openaws.dk/v1",
     "api_base_url_v2": "https://webservice.openaws.dk/v2",
     "api_profile": "v1",
+    "api_client": {
+        "timeout": 7,  # seconds
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30,  # seconds
+        "host_limits": {},
+    },
     "pages": [{"name": "home", "title": "Hjem", "template": "pages/home.html", "url": "/"}],
     "main_menu_top": [
         {"name": "search_get", "title": "Søg", "type": "icon", "icon": "search"},
@@ -94,4 +102,47 @@ settings: Settings = {
     "allow_save_bookmarks": False,
     "allow_theme_toggle": False,
     "ignore_record_keys": [],
+    "sqlite3_pool_size": 4,
+    "users_me_cache_expire": 30,  # seconds
+    "proxy_cache_stale_while_revalidate": 60,  # seconds
+    "proxy_cache_stale_if_error": 60 * 60 * 24,  # seconds
+    "cache_compress_min_size": 1024,  # characters. None disables compression
+    "cache_maintenance": {
+        "batch_size": 1000,
+        "max_rows": 200_000,  # 0 means no limit
+        "max_bytes": 500 * 1024 * 1024,  # 0 means no limit
+        "interval": 60 * 60,  # seconds between background passes. 0 disables them
+    },
+    "proxy_cache_memory": {
+        "max_entries": 1000,
+        "max_bytes": 50 * 1024 * 1024,
+        "max_age": 60,  # seconds
+    },
+    "page_cache": {
+        "enabled": False,
+        "max_entries": 1000,
+        "max_bytes": 100 * 1024 * 1024,
+        "routes": [
+            # seconds. Capped at 150 (half of the pre-signed URL margin). Pages are shared
+            # with their CSP nonce and are only cleared in the worker that invalidates a tag.
+            {"path": "/records/*", "expire": 120},
+            {"path": "/search", "expire": 60},
+            {"path": "/collections/*", "expire": 120},
+            {"path": "/people/*", "expire": 120},
+            {"path": "/locations/*", "expire": 120},
+            {"path": "/creators/*", "expire": 120},
+            {"path": "/events/*", "expire": 120},
+            {"path": "/organisations/*", "expire": 120},
+            {"path": "/collectors/*", "expire": 120},
+        ],
+    },
+    "etag_enabled": True,
+    "prefetch_enabled": False,
+    "prefetch_max_tasks": 8,  # running prefetches per worker
+    "navigation_store_expire": 60 * 60 * 24,  # seconds
+    "navigation_store_memory": {
+        "max_entries": 10000,
+        "max_bytes": 50 * 1024 * 1024,
+        "max_age": 60,  # seconds
+    },
 }
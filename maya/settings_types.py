@@ -52,6 +52,45 @@ class ConcurrencyLimitSettings(TypedDict):
     exclude_paths: NotRequired[list[str]]
 
 
+class ApiClientHostLimitSettings(TypedDict, total=False):
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float  # seconds
+
+
+class ApiClientSettings(TypedDict, total=False):
+    timeout: float  # seconds
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float  # seconds
+    host_limits: dict[str, ApiClientHostLimitSettings]  # e.g. {"https://aarhusiana.appspot.com": {...}}
+
+
+class MemoryCacheSettings(TypedDict, total=False):
+    max_entries: int  # 0 disables the memory cache
+    max_bytes: int
+    max_age: int  # seconds before an entry is read again from sqlite3. 0 means no limit
+
+
+class PageCacheRouteSettings(TypedDict):
+    path: str  # exact path or a path ending with "*"
+    expire: int  # seconds, capped at page_cache.PAGE_CACHE_MAX_EXPIRE
+
+
+class PageCacheSettings(TypedDict, total=False):
+    enabled: bool
+    max_entries: int
+    max_bytes: int  # sum of the cached (gzipped) bodies
+    routes: list[PageCacheRouteSettings]
+
+
+class CacheMaintenanceSettings(TypedDict, total=False):
+    batch_size: int
+    max_rows: int  # 0 means no limit
+    max_bytes: int  # 0 means no limit
+    interval: int  # seconds between background passes in the server. 0 disables them
+
+
 class Settings(TypedDict, total=True):
     api_key: str
     session_secret: str
@@ -70,6 +109,7 @@ class Settings(TypedDict, total=True):
     log_level: int  # logging.DEBUG/INFO/etc. are ints
     log_handlers: list[Literal["stream", "rotating_file"]]
     log_api_calls: bool
+    server_timing_header: NotRequired[bool]
 
     cookie: CookieSettings
     custom_error: str
@@ -77,6 +117,7 @@ class Settings(TypedDict, total=True):
     api_base_url: str
     api_base_url_v2: NotRequired[str]
     api_profile: NotRequired[Literal["v1", "v2"]]
+    api_client: NotRequired[ApiClientSettings]
 
     pages: list[PageSettings]
     main_menu_top: list[MenuItemSettings]
@@ -102,6 +143,20 @@ class Settings(TypedDict, total=True):
     ignore_record_keys: list[str]
 
     sqlite3: NotRequired[Sqlite3Settings]
+    sqlite3_pool_size: NotRequired[int]  # idle reader connections per database. 0 disables pooling
     cron_orders: NotRequired[bool]
     boto3_presigned_urls: NotRequired[bool]
     proxy_cache_expire: NotRequired[int]
+    proxy_cache_search_expire: NotRequired[int]
+    proxy_cache_stale_while_revalidate: NotRequired[int]  # seconds a stale entry is served while it is refreshed
+    proxy_cache_stale_if_error: NotRequired[int]  # seconds a stale entry is served when upstream fails
+    proxy_cache_memory: NotRequired[MemoryCacheSettings]
+    cache_maintenance: NotRequired[CacheMaintenanceSettings]
+    cache_compress_min_size: NotRequired[int | None]  # cache values of at least this size are zlib compressed
+    users_me_cache_expire: NotRequired[int | None]  # seconds. None disables the /users/me cache
+    page_cache: NotRequired[PageCacheSettings]  # rendered pages for anonymous users
+    etag_enabled: NotRequired[bool]  # ETag and conditional GET on record, resource and search pages for anonymous users
+    prefetch_enabled: NotRequired[bool]  # prefetch adjacent records and the next search page for anonymous users
+    prefetch_max_tasks: NotRequired[int]  # running prefetches per worker
+    navigation_store_expire: NotRequired[int]  # seconds the record navigation state of a session is kept
+    navigation_store_memory: NotRequired[MemoryCacheSettings]
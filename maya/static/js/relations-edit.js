@@ -117,7 +117,7 @@ const renderRelationSection = (section, index) => html`
             ${section.data.map(item => html`
                 <div class="record-content">
                 <div class="label">
-                    <span class="relations-delete" @click=${deleteRelation} data-rel-id="${item.rel_id}" title="Fjern relation">x</span>
+                    <span class="relations-delete" @click=${deleteRelation} data-rel-id="${item.rel_id}" data-object-id="${item.id}" data-object-domain="${item.domain ?? ''}" title="Fjern relation">x</span>
                     ${item.rel_label}
                 </div>
                 <div class="content">
@@ -134,7 +134,18 @@ const renderRelationSection = (section, index) => html`
 const deleteRelation = {
     async handleEvent(e) {
         let relId = e.target.dataset.relId;
-        let url = `/relations/${relId}`;
+        let objectId = e.target.dataset.objectId;
+        let objectDomain = e.target.dataset.objectDomain;
+
+        // The subject and the object are sent so the server can clear cached copies of them.
+        // The server looks up the object of the relation and only falls back to these values
+        let params = new URLSearchParams({
+            subject_domain: resourceOriginal.domain,
+            subject_id: resourceOriginal.id,
+            object_domain: objectDomain,
+            object_id: objectId,
+        });
+        let url = `/relations/${relId}?${params.toString()}`;
 
         try {
             await Requests.asyncGetJson(url, 'DELETE');
@@ -114,5 +114,6 @@ settings: Settings = {
     },
     "cron_orders": True,
     "proxy_cache_expire": None,  # 60 * 60 * 24 * 30, one month in seconds
+    "proxy_cache_search_expire": None,  # 60 * 10, ten minutes in seconds
     "boto3_presigned_urls": True,
 }
@@ -2,23 +2,34 @@ from types import SimpleNamespace
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, patch
 
+from maya.core import navigation_store
 from maya.core.dataclasses import SearchCookie
-from maya.endpoints.endpoints_records import _get_record_pagination
+from maya.endpoints import endpoints_records
+from maya.endpoints.endpoints_records import _get_id_window_query_params, _get_record_pagination
 
 
 class TestRecordPagination(IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Keep the navigation state in memory only
+        database_url_patch = patch.object(navigation_store, "database_url", "")
+        database_url_patch.start()
+        self.addCleanup(database_url_patch.stop)
+        self.addCleanup(navigation_store.memory_cache.clear)
+
     async def test_uses_session_cache_for_prev_next_on_same_page(self):
         request = SimpleNamespace(
             query_params={"search": "10"},
             cookies={},
-            session={
-                "record_navigation_cache": {
-                    "query_params": [["size", "20"], ["q", "test"]],
-                    "start": 0,
-                    "size": 20,
-                    "total": 25,
-                    "record_ids": [str(record_id) for record_id in range(1, 21)],
-                }
+            session={},
+        )
+        await navigation_store.set_navigation_state(
+            request,
+            {
+                "query_params": [["size", "20"], ["q", "test"]],
+                "start": 0,
+                "size": 20,
+                "total": 25,
+                "record_ids": [str(record_id) for record_id in range(1, 21)],
             },
         )
         search_cookie = SearchCookie(
@@ -30,7 +41,7 @@ class TestRecordPagination(IsolatedAsyncioTestCase):
 
         with (
             patch("maya.endpoints.endpoints_records.cookie.get_search_cookie", return_value=search_cookie),
-            patch("maya.endpoints.endpoints_records.api.proxies_records", new=AsyncMock()) as proxies_records,
+            patch("maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock()) as proxies_view_ids,
         ):
             pagination = await _get_record_pagination(request)
 
@@ -39,20 +50,22 @@ class TestRecordPagination(IsolatedAsyncioTestCase):
         self.assertEqual(pagination.next_page, 11)
         self.assertEqual(pagination.prev_record, "9")
         self.assertEqual(pagination.next_record, "11")
-        proxies_records.assert_not_awaited()
+        proxies_view_ids.assert_not_awaited()
 
-    async def test_fetches_next_page_when_navigation_crosses_cached_boundary(self):
+    async def test_fetches_id_window_when_navigation_crosses_cached_boundary(self):
         request = SimpleNamespace(
             query_params={"search": "20"},
             cookies={},
-            session={
-                "record_navigation_cache": {
-                    "query_params": [["size", "20"], ["q", "test"]],
-                    "start": 0,
-                    "size": 20,
-                    "total": 25,
-                    "record_ids": [str(record_id) for record_id in range(1, 21)],
-                }
+            session={},
+        )
+        await navigation_store.set_navigation_state(
+            request,
+            {
+                "query_params": [["size", "20"], ["q", "test"]],
+                "start": 0,
+                "size": 20,
+                "total": 25,
+                "record_ids": [str(record_id) for record_id in range(1, 21)],
             },
         )
         search_cookie = SearchCookie(
@@ -61,22 +74,114 @@ class TestRecordPagination(IsolatedAsyncioTestCase):
             total=25,
             q="test",
         )
-        next_page_result = {
-            "start": 20,
-            "size": 20,
-            "total": 25,
-            "result": [{"id": str(record_id)} for record_id in range(21, 26)],
-        }
+        ids_result = {"result": [str(record_id) for record_id in range(1, 26)], "status_code": 0}
 
         with (
             patch("maya.endpoints.endpoints_records.cookie.get_search_cookie", return_value=search_cookie),
-            patch("maya.endpoints.endpoints_records.api.proxies_records", new=AsyncMock(return_value=next_page_result)) as proxies_records,
+            patch(
+                "maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock(return_value=ids_result)
+            ) as proxies_view_ids,
         ):
             pagination = await _get_record_pagination(request)
 
         self.assertEqual(pagination.current_page, 20)
         self.assertEqual(pagination.prev_record, "19")
         self.assertEqual(pagination.next_record, "21")
-        proxies_records.assert_awaited_once_with(request, [("size", "20"), ("q", "test"), ("start", "20")])
-        self.assertEqual(request.session["record_navigation_cache"]["start"], 20)
-        self.assertEqual(request.session["record_navigation_cache"]["record_ids"], ["21", "22", "23", "24", "25"])
+        proxies_view_ids.assert_awaited_once_with([("q", "test"), ("view", "ids"), ("size", "1000")], use_cache=True)
+        navigation_state = await navigation_store.get_navigation_state(request)
+        self.assertEqual(navigation_state["start"], 0)
+        self.assertEqual(navigation_state["record_ids"], [str(record_id) for record_id in range(1, 26)])
+        self.assertEqual(list(request.session), ["navigation_token"])
+
+    async def test_follows_next_cursor_to_the_id_window(self):
+        request = SimpleNamespace(query_params={"search": "1250"}, cookies={}, session={})
+        search_cookie = SearchCookie(search_query_str="q=test&", query_params=[("q", "test")], total=2500, q="test")
+        id_pages = [
+            {"result": [str(record_id) for record_id in range(1, 1001)], "next_cursor": "page2", "status_code": 0},
+            {"result": [str(record_id) for record_id in range(1001, 2001)], "next_cursor": "page3", "status_code": 0},
+        ]
+
+        with (
+            patch("maya.endpoints.endpoints_records.cookie.get_search_cookie", return_value=search_cookie),
+            patch(
+                "maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock(side_effect=id_pages)
+            ) as proxies_view_ids,
+        ):
+            pagination = await _get_record_pagination(request)
+
+        self.assertEqual(pagination.prev_record, "1249")
+        self.assertEqual(pagination.next_record, "1251")
+        self.assertEqual(proxies_view_ids.await_count, 2)
+        self.assertEqual(proxies_view_ids.await_args_list[1].args[0][-1], ("cursor", "page2"))
+        navigation_state = await navigation_store.get_navigation_state(request)
+        self.assertEqual(navigation_state["start"], 999)
+        self.assertEqual(navigation_state["record_ids"], [str(record_id) for record_id in range(1000, 2001)])
+        self.assertEqual(navigation_state["next_cursor"], "page3")
+
+    async def test_uses_stored_next_cursor_when_leaving_the_window(self):
+        request = SimpleNamespace(query_params={"search": "1000"}, cookies={}, session={})
+        await navigation_store.set_navigation_state(
+            request,
+            {
+                "query_params": [["q", "test"]],
+                "start": 0,
+                "size": 1000,
+                "total": 2500,
+                "record_ids": [str(record_id) for record_id in range(1, 1001)],
+                "next_cursor": "page2",
+            },
+        )
+        search_cookie = SearchCookie(search_query_str="q=test&", query_params=[("q", "test")], total=2500, q="test")
+        ids_result = {"result": [str(record_id) for record_id in range(1001, 2001)], "next_cursor": "page3", "status_code": 0}
+
+        with (
+            patch("maya.endpoints.endpoints_records.cookie.get_search_cookie", return_value=search_cookie),
+            patch("maya.endpoints.endpoints_records.api.is_logged_in", new=AsyncMock(return_value=True)),
+            patch(
+                "maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock(return_value=ids_result)
+            ) as proxies_view_ids,
+        ):
+            pagination = await _get_record_pagination(request)
+
+        self.assertEqual(pagination.prev_record, "999")
+        self.assertEqual(pagination.next_record, "1001")
+        proxies_view_ids.assert_awaited_once_with([("q", "test"), ("view", "ids"), ("size", "1000"), ("cursor", "page2")], use_cache=False)
+        navigation_state = await navigation_store.get_navigation_state(request)
+        self.assertEqual(navigation_state["start"], 999)
+        self.assertEqual(navigation_state["next_cursor"], "page3")
+
+    async def test_deep_position_makes_no_upstream_call(self):
+        request = SimpleNamespace(query_params={"search": "900000"}, cookies={}, session={})
+        search_cookie = SearchCookie(search_query_str="q=test&", query_params=[("q", "test")], total=1000000, q="test")
+
+        with (
+            patch("maya.endpoints.endpoints_records.cookie.get_search_cookie", return_value=search_cookie),
+            patch("maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock()) as proxies_view_ids,
+        ):
+            pagination = await _get_record_pagination(request)
+
+        self.assertIsNone(pagination.next_record)
+        self.assertIsNone(pagination.prev_record)
+        proxies_view_ids.assert_not_awaited()
+
+    async def test_number_of_id_pages_per_request_is_limited(self):
+        ids_result = {"result": ["1"], "next_cursor": "next", "status_code": 0}
+
+        with (
+            patch.object(endpoints_records, "NAVIGATION_MAX_ID_PAGES", 3),
+            patch(
+                "maya.endpoints.endpoints_records.api.proxies_view_ids_from_list", new=AsyncMock(return_value=ids_result)
+            ) as proxies_view_ids,
+        ):
+            window = await endpoints_records._fetch_id_window([("q", "test")], 500, use_cache=True)
+
+        self.assertIsNone(window)
+        self.assertEqual(proxies_view_ids.await_count, 3)
+
+    def test_id_window_query_params(self):
+        query_params = [("q", "test"), ("size", "20"), ("sort", "date_from"), ("start", "240"), ("view", "list")]
+
+        self.assertEqual(
+            _get_id_window_query_params(query_params, "abc"),
+            [("q", "test"), ("sort", "date_from"), ("view", "ids"), ("size", "1000"), ("cursor", "abc")],
+        )
@@ -0,0 +1,63 @@
+import os
+import unittest
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import api_client
+from maya.core.dynamic_settings import settings
+
+
+class TestApiClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await api_client.close_async_client()
+
+    async def test_shared_client_is_reused_and_kept_open(self):
+        shared_client = await api_client.open_async_client()
+
+        async with api_client.get_async_client() as client:
+            self.assertIs(client, shared_client)
+
+        async with api_client.get_async_client() as client:
+            self.assertIs(client, shared_client)
+
+        self.assertFalse(shared_client.is_closed)
+
+    async def test_short_lived_client_without_shared_client(self):
+        async with api_client.get_async_client() as client:
+            short_lived_client = client
+
+        self.assertTrue(short_lived_client.is_closed)
+
+    async def test_close_shared_client(self):
+        shared_client = await api_client.open_async_client()
+        await api_client.close_async_client()
+
+        self.assertTrue(shared_client.is_closed)
+
+        async with api_client.get_async_client() as client:
+            self.assertIsNot(client, shared_client)
+
+    async def test_client_does_not_persist_cookies(self):
+        client = await api_client.open_async_client()
+        client.cookies.extract_cookies(_response_with_cookie())
+
+        self.assertEqual(len(client.cookies.jar), 0)
+
+    async def test_host_limits_are_mounted(self):
+        original_api_client = settings.get("api_client")
+        settings["api_client"] = {"host_limits": {"https://aarhusiana.appspot.com": {"max_connections": 2}}}
+        try:
+            client = await api_client.open_async_client()
+            transport = client._transport_for_url(api_client.httpx.URL("https://aarhusiana.appspot.com/autocomplete_v3"))
+            self.assertIsNot(transport, client._transport)
+        finally:
+            settings["api_client"] = original_api_client
+
+
+def _response_with_cookie():
+    request = api_client.httpx.Request("GET", "https://dev.openaws.dk/v1/users/me")
+    return api_client.httpx.Response(200, headers={"Set-Cookie": "session=secret; Path=/"}, request=request)
+
+
+if __name__ == "__main__":
+    unittest.main()
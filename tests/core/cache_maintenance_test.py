@@ -0,0 +1,91 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import cache_maintenance
+from maya.core.migration import Migration
+from maya.database import utils
+from maya.database.cache import DatabaseCache
+from maya.migrations.default import migrations_default
+
+
+class TestCacheMaintenance(unittest.IsolatedAsyncioTestCase):
+    db_path = "/tmp/test_cache_maintenance.db"
+
+    async def asyncSetUp(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        migration = Migration(db_path=self.db_path, migrations=migrations_default)
+        migration.run_migrations()
+        self.database_connection = utils.DatabaseConnection(self.db_path)
+
+    async def _insert(self, key: str, age: int, tags: list[str] = []):
+        async with self.database_connection.write_transaction_scope_async() as connection:
+            cache = DatabaseCache(connection)
+            await cache.set_raw(key, '"value"', int(time.time()) - age)
+            await cache.set_tags(key, tags)
+
+    async def _get_keys(self, table: str = "cache") -> list[str]:
+        async with self.database_connection.transaction_scope_async() as connection:
+            cursor = await connection.execute(f"SELECT key FROM {table} ORDER BY key")
+            return [row["key"] for row in await cursor.fetchall()]
+
+    def _patch(self, expire_rules: list, **maintenance_settings):
+        maintenance_settings = {"batch_size": 2, "max_rows": 0, "max_bytes": 0, "interval": 0, **maintenance_settings}
+        return (
+            patch.object(cache_maintenance, "database_url", self.db_path),
+            patch.object(cache_maintenance, "get_expire_rules", return_value=expire_rules),
+            patch.object(cache_maintenance, "get_maintenance_settings", return_value=maintenance_settings),
+        )
+
+    async def test_expired_values_are_deleted_in_batches(self):
+        for index in range(5):
+            await self._insert(f"boto3_old_{index}", age=7200, tags=[f"tag:{index}"])
+        await self._insert("boto3_new", age=10)
+        await self._insert("proxy_record:1", age=7200)
+
+        url_patch, rules_patch, settings_patch = self._patch([("boto3_", 3600), ("proxy_record:", None)])
+        with url_patch, rules_patch, settings_patch:
+            result = await cache_maintenance.run_cache_maintenance()
+
+        self.assertEqual(result, {"expired": 5, "evicted": 0})
+        self.assertEqual(await self._get_keys(), ["boto3_new", "proxy_record:1"])
+        self.assertEqual(await self._get_keys("cache_tags"), [])
+
+    async def test_oldest_values_are_evicted_above_max_rows(self):
+        for index in range(5):
+            await self._insert(f"key_{index}", age=100 - index)
+
+        url_patch, rules_patch, settings_patch = self._patch([], max_rows=2)
+        with url_patch, rules_patch, settings_patch:
+            result = await cache_maintenance.run_cache_maintenance()
+
+        self.assertEqual(result, {"expired": 0, "evicted": 3})
+        self.assertEqual(await self._get_keys(), ["key_3", "key_4"])
+
+    async def test_max_batches(self):
+        for index in range(5):
+            await self._insert(f"boto3_old_{index}", age=7200)
+
+        url_patch, rules_patch, settings_patch = self._patch([("boto3_", 3600)])
+        with url_patch, rules_patch, settings_patch:
+            result = await cache_maintenance.run_cache_maintenance(max_batches=1)
+
+        self.assertEqual(result["expired"], 2)
+
+    def test_max_age_includes_stale_windows(self):
+        with (
+            patch.object(cache_maintenance.proxy_cache, "PROXY_CACHE_STALE_WHILE_REVALIDATE", 60),
+            patch.object(cache_maintenance.proxy_cache, "PROXY_CACHE_STALE_IF_ERROR", 3600),
+        ):
+            self.assertEqual(cache_maintenance._get_max_age(600), 4200)
+            self.assertEqual(cache_maintenance._get_max_age(None), 0)
+            self.assertIsNone(cache_maintenance._get_max_age(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
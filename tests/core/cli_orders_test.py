@@ -20,15 +20,18 @@ class TestOrdersCli(unittest.TestCase):
 
     async def _test_run_cron_tasks_calls_both_order_crons(self):
         from maya.orders import service as orders_service
+        from maya.core import cache_maintenance
 
         with (
             patch.object(orders_service, "cron_orders_expire", new=AsyncMock(return_value=1)) as expire_mock,
             patch.object(orders_service, "cron_renewal_emails", new=AsyncMock(return_value=1)) as renew_mock,
+            patch.object(cache_maintenance, "run_cache_maintenance", new=AsyncMock()) as cache_maintenance_mock,
         ):
             await cli._run_cron_tasks()
 
         expire_mock.assert_awaited_once()
         renew_mock.assert_awaited_once()
+        cache_maintenance_mock.assert_awaited_once()
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import asyncio
 import os
 import time
 import unittest
+from unittest.mock import patch
 
 os.environ.setdefault("BASE_DIR", "sites/aarhus")
 
@@ -9,7 +10,8 @@ from maya.core.dynamic_settings import init_settings
 from maya.core.logging import get_log
 from maya.core.migration import Migration
 from maya.migrations.tests import migrations_tests
-from maya.database.cache import DatabaseCache
+from maya.migrations.default import migrations_default
+from maya.database.cache import DatabaseCache, MemoryCache, TieredCache
 from maya.database import crud, utils
 
 init_settings()
@@ -158,6 +160,254 @@ class TestDB(unittest.TestCase):
             result = await cursor.fetchone()
             self.assertEqual(result["count"], 1)
 
+    def test_memory_cache_lru_eviction(self):
+        memory_cache = MemoryCache(max_entries=2, max_bytes=1000)
+        now = int(time.time())
+        memory_cache.set_raw("a", '"a"', now)
+        memory_cache.set_raw("b", '"b"', now)
+
+        # Use "a" so "b" becomes the least recently used entry
+        self.assertEqual(memory_cache.get("a"), "a")
+        memory_cache.set_raw("c", '"c"', now)
+
+        self.assertIsNone(memory_cache.get("b"))
+        self.assertEqual(memory_cache.get("a"), "a")
+        self.assertEqual(memory_cache.get("c"), "c")
+        self.assertEqual(memory_cache.get_stats()["evictions"], 1)
+        self.assertEqual(memory_cache.get_stats()["hits"], 3)
+        self.assertEqual(memory_cache.get_stats()["misses"], 1)
+
+    def test_memory_cache_byte_budget(self):
+        memory_cache = MemoryCache(max_entries=100, max_bytes=10)
+        now = int(time.time())
+        memory_cache.set_raw("a", '"aaaa"', now)
+        memory_cache.set_raw("b", '"bbbb"', now)
+        memory_cache.set_raw("too_large", '"xxxxxxxxxxxx"', now)
+
+        self.assertIsNone(memory_cache.get("a"))
+        self.assertEqual(memory_cache.get("b"), "bbbb")
+        self.assertIsNone(memory_cache.get("too_large"))
+        self.assertLessEqual(memory_cache.get_stats()["bytes"], 10)
+
+    def test_memory_cache_expire_in(self):
+        memory_cache = MemoryCache()
+        memory_cache.set_raw("old", '"old"', int(time.time()) - 100)
+
+        self.assertIsNone(memory_cache.get("old", expire_in=10))
+        self.assertEqual(memory_cache.get("old", expire_in=0), "old")
+
+    def test_tiered_cache(self):
+        asyncio.run(self._test_tiered_cache_async())
+
+    async def _test_tiered_cache_async(self):
+        db_path = "/tmp/test_cache.db"
+
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        migration = Migration(db_path=db_path, migrations=migrations_default)
+        migration.run_migrations()
+
+        database_transaction = utils.DatabaseConnection(db_path)
+        async with database_transaction.write_transaction_scope_async() as connection:
+            await DatabaseCache(connection).set("in_sqlite", {"value": "sqlite"})
+
+        memory_cache = MemoryCache()
+        tiered_cache = TieredCache(database_transaction, memory_cache)
+
+        # Falls through to sqlite3 and populates the memory cache
+        self.assertEqual(await tiered_cache.get("in_sqlite", expire_in=10), {"value": "sqlite"})
+        self.assertEqual(memory_cache.get("in_sqlite"), {"value": "sqlite"})
+
+        # set writes to both tiers
+        await tiered_cache.set("new", {"value": "new"})
+        self.assertEqual(memory_cache.get("new"), {"value": "new"})
+        async with database_transaction.transaction_scope_async() as connection:
+            self.assertEqual(await DatabaseCache(connection).get("new"), {"value": "new"})
+
+        # Every get returns a fresh object
+        first = await tiered_cache.get("new")
+        first["value"] = "mutated"
+        self.assertEqual(await tiered_cache.get("new"), {"value": "new"})
+
+    def test_compressed_and_plain_values_are_readable(self):
+        asyncio.run(self._test_compressed_and_plain_values_are_readable_async())
+
+    async def _test_compressed_and_plain_values_are_readable_async(self):
+        db_path = "/tmp/test_cache_codec.db"
+
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        # Migrate a database with a row written before compression was added
+        migrations_before = dict(list(migrations_default.items())[: list(migrations_default).index("alter_cache_value_any")])
+        Migration(db_path=db_path, migrations=migrations_before).run_migrations()
+        database_transaction = utils.DatabaseConnection(db_path)
+        async with database_transaction.write_transaction_scope_async() as connection:
+            await connection.execute(
+                "INSERT INTO cache (key, value, unix_timestamp) VALUES (?, ?, ?)",
+                ("plain", '{"value": "plain"}', int(time.time())),
+            )
+        Migration(db_path=db_path, migrations=migrations_default).run_migrations()
+
+        large_value = {"desc_data": "x" * 5000}
+        async with database_transaction.write_transaction_scope_async() as connection:
+            await DatabaseCache(connection).set("large", large_value)
+            await DatabaseCache(connection).set("small", {"value": "small"})
+
+        async with database_transaction.transaction_scope_async() as connection:
+            cache = DatabaseCache(connection)
+            self.assertEqual(await cache.get("plain"), {"value": "plain"})
+            self.assertEqual(await cache.get("large"), large_value)
+            self.assertEqual(await cache.get("small"), {"value": "small"})
+
+            cursor = await connection.execute("SELECT key, typeof(value) AS type, LENGTH(value) AS size FROM cache ORDER BY key")
+            rows = {row["key"]: (row["type"], row["size"]) for row in await cursor.fetchall()}
+
+        self.assertEqual(rows["plain"][0], "text")
+        self.assertEqual(rows["small"][0], "text")
+        self.assertEqual(rows["large"][0], "blob")
+        self.assertLess(rows["large"][1], 1000)
+
+    def test_get_many_and_set_many(self):
+        asyncio.run(self._test_get_many_and_set_many_async())
+
+    async def _test_get_many_and_set_many_async(self):
+        db_path = "/tmp/test_cache_many.db"
+
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        Migration(db_path=db_path, migrations=migrations_default).run_migrations()
+        database_transaction = utils.DatabaseConnection(db_path)
+
+        items = {f"key_{index}": {"index": index} for index in range(600)}
+        async with database_transaction.write_transaction_scope_async() as connection:
+            await DatabaseCache(connection).set_many(items)
+            await DatabaseCache(connection).set_many({"key_0": {"index": "updated"}})
+            await DatabaseCache(connection).set_raw("expired", '"expired"', int(time.time()) - 100)
+
+        async with database_transaction.transaction_scope_async() as connection:
+            values = await DatabaseCache(connection).get_many(list(items) + ["missing", "expired"], expire_in=10)
+
+        self.assertEqual(len(values), 600)
+        self.assertEqual(values["key_0"], {"index": "updated"})
+        self.assertEqual(values["key_599"], {"index": 599})
+
+    def test_memory_cache_max_age(self):
+        memory_cache = MemoryCache(max_age=60)
+        memory_cache.set_raw("a", '"a"', int(time.time()))
+
+        self.assertEqual(memory_cache.get("a"), "a")
+        with patch("maya.database.cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(memory_cache.get("a"))
+        self.assertEqual(memory_cache.get_stats()["entries"], 0)
+
+    def test_tiered_cache_delete_tags(self):
+        asyncio.run(self._test_tiered_cache_delete_tags_async())
+
+    async def _test_tiered_cache_delete_tags_async(self):
+        db_path = "/tmp/test_cache_tags.db"
+
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+        migration = Migration(db_path=db_path, migrations=migrations_default)
+        migration.run_migrations()
+
+        database_transaction = utils.DatabaseConnection(db_path)
+        memory_cache = MemoryCache()
+        tiered_cache = TieredCache(database_transaction, memory_cache)
+
+        await tiered_cache.set("proxy_record:1", {"id": 1}, tags=["record:1", "resource:people:7"])
+        await tiered_cache.set("proxy_record:2", {"id": 2}, tags=["record:2"])
+        await tiered_cache.set("proxy_resource:people:7", {"id": 7}, tags=["resource:people:7"])
+
+        deleted_keys = await tiered_cache.delete_tags(["resource:people:7"])
+
+        self.assertEqual(sorted(deleted_keys), ["proxy_record:1", "proxy_resource:people:7"])
+        self.assertIsNone(await tiered_cache.get("proxy_record:1"))
+        self.assertIsNone(await tiered_cache.get("proxy_resource:people:7"))
+        self.assertEqual(await tiered_cache.get("proxy_record:2"), {"id": 2})
+
+        async with database_transaction.transaction_scope_async() as connection:
+            cursor = await connection.execute("SELECT tag, key FROM cache_tags")
+            rows = [(row["tag"], row["key"]) for row in await cursor.fetchall()]
+        self.assertEqual(rows, [("record:2", "proxy_record:2")])
+
+
+class TestConnectionPool(unittest.IsolatedAsyncioTestCase):
+    db_path = "/tmp/test_pool.db"
+
+    async def asyncSetUp(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        migration = Migration(db_path=self.db_path, migrations=migrations_tests)
+        migration.run_migrations()
+        migration.close()
+        await utils.open_connection_pools(2)
+
+    async def asyncTearDown(self):
+        await utils.close_connection_pools()
+
+    async def test_reader_connections_are_reused(self):
+        database_connection = utils.DatabaseConnection(self.db_path)
+        async with database_connection.transaction_scope_async() as connection:
+            first_connection = connection
+
+        async with database_connection.transaction_scope_async() as connection:
+            self.assertIs(connection, first_connection)
+
+    async def test_pools_are_per_database_url(self):
+        self.assertIs(utils.get_connection_pool(self.db_path), utils.get_connection_pool(self.db_path))
+        self.assertIsNot(utils.get_connection_pool(self.db_path), utils.get_connection_pool("/tmp/test_pool_other.db"))
+        self.assertIsNone(utils.get_connection_pool(":memory:"))
+
+    async def test_writes_are_serialized_on_one_writer(self):
+        database_connection = utils.DatabaseConnection(self.db_path)
+        writer_connections = []
+        events = []
+
+        async def insert_user(user_id: str):
+            async with database_connection.write_transaction_scope_async() as connection:
+                writer_connections.append(connection)
+                events.append(f"begin {user_id}")
+                await asyncio.sleep(0.01)
+                await crud.CRUD(connection).insert(
+                    "users", {"user_id": user_id, "user_email": f"{user_id}@example.com", "user_display_name": user_id}
+                )
+                events.append(f"end {user_id}")
+
+        await asyncio.gather(insert_user("1"), insert_user("2"))
+
+        self.assertIs(writer_connections[0], writer_connections[1])
+        self.assertEqual(events, ["begin 1", "end 1", "begin 2", "end 2"])
+
+        async with database_connection.transaction_scope_async() as connection:
+            self.assertEqual(await crud.CRUD(connection).count("users", {}), 2)
+
+    async def test_failed_transaction_is_rolled_back_and_connection_reused(self):
+        database_connection = utils.DatabaseConnection(self.db_path)
+        with self.assertRaises(RuntimeError):
+            async with database_connection.write_transaction_scope_async() as connection:
+                await crud.CRUD(connection).insert("users", {"user_id": "1", "user_email": "1@example.com", "user_display_name": "One"})
+                raise RuntimeError("Test exception")
+
+        async with database_connection.write_transaction_scope_async() as connection:
+            self.assertEqual(await crud.CRUD(connection).count("users", {}), 0)
+
+    async def test_close_connection_pools(self):
+        database_connection = utils.DatabaseConnection(self.db_path)
+        async with database_connection.transaction_scope_async() as connection:
+            pooled_connection = connection
+
+        await utils.close_connection_pools()
+        self.assertIsNone(utils.get_connection_pool(self.db_path))
+
+        with self.assertRaises(ValueError):
+            await pooled_connection.execute("SELECT 1")
+
 
 if __name__ == "__main__":
     unittest.main()
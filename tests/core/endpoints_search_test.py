@@ -0,0 +1,75 @@
+import json
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from starlette.requests import Request
+
+from maya.core import api
+from maya.core import prefetch
+from maya.endpoints import endpoints_search
+
+
+def _request(query_string: bytes = b"") -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/search/json",
+        "query_string": query_string,
+        "headers": [],
+        "session": {},
+    }
+    return Request(scope)
+
+
+def _search_result(total: int = 3) -> dict:
+    return {
+        "result": [],
+        "start": 0,
+        "size": 20,
+        "total": total,
+        "facets_resolved": {},
+        "active_facets": {"content_types": {"61": {"count": 3}}},
+    }
+
+
+class TestSearchEndpoints(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        mock_patch = patch.object(api, "proxies_records", AsyncMock(return_value=_search_result()))
+        mock_patch.start()
+        self.addCleanup(mock_patch.stop)
+
+    async def test_search_get_json_serializes_facets(self):
+        response = await endpoints_search.search_get_json(_request(b"content_types=61"))
+
+        self.assertEqual(response.status_code, 200)
+        facets = json.loads(response.body)["facets"]
+        images = next(node for node in facets["content_types"]["content"] if node["id"] == "61")
+        self.assertEqual(images["count"], 3)
+        self.assertTrue(images["checked"])
+        self.assertIsInstance(images["children"], list)
+
+    async def test_search_does_not_write_navigation_state(self):
+        request = _request(b"q=test")
+        await endpoints_search.search_get_json(request)
+
+        self.assertEqual(request.session, {})
+
+    def test_prefetch_next_search_page(self):
+        context_values = {
+            "pagination_data": {"start": 0, "size": 20, "total": 30},
+            "query_params_before_search": [("q", "test")],
+            "q": "test",
+        }
+        for search_expire, scheduled in ((None, False), (60, True)):
+            with self.subTest(search_expire=search_expire):
+                with patch.object(api, "PROXY_CACHE_SEARCH_EXPIRE", search_expire), patch.object(prefetch, "schedule") as schedule:
+                    endpoints_search._prefetch_next_search_page(_request(), context_values)
+
+                self.assertEqual(schedule.called, scheduled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from maya.core import etag
+from maya.endpoints import endpoints_records, endpoints_utils
+from maya.core.middleware import ResponseHeadersMiddleware
+
+
+def _request(headers: list | None = None, session: dict | None = None, query_string: bytes = b"") -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/records/1",
+        "query_string": query_string,
+        "headers": headers or [],
+        "session": session or {},
+    }
+    return Request(scope)
+
+
+class TestEtag(unittest.TestCase):
+    def test_etag_depends_on_payload_and_page_input(self):
+        record_etag = etag.get_etag(_request(), {"id": "1", "title": "Hus"})
+
+        self.assertEqual(record_etag, etag.get_etag(_request(), {"title": "Hus", "id": "1"}))
+        self.assertNotEqual(record_etag, etag.get_etag(_request(), {"id": "1", "title": "Huse"}))
+        self.assertNotEqual(record_etag, etag.get_etag(_request(query_string=b"search=2"), {"id": "1", "title": "Hus"}))
+        self.assertNotEqual(record_etag, etag.get_etag(_request([(b"cookie", b"dark_theme=1")]), {"id": "1", "title": "Hus"}))
+        self.assertTrue(record_etag.startswith('"') and record_etag.endswith('"'))
+
+    def test_no_headers_for_private_sessions(self):
+        self.assertEqual(etag.get_headers(_request(session={"access_token": "token"}), {}), {})
+        self.assertEqual(etag.get_headers(_request(session={"flash": []}), {}), {})
+        self.assertIn("ETag", etag.get_headers(_request(), {}))
+
+    def test_last_modified(self):
+        self.assertEqual(etag.get_last_modified("2019-05-09T11:38:26.571000"), "Thu, 09 May 2019 11:38:26 GMT")
+        self.assertEqual(etag.get_last_modified("2019-05-09T13:38:26+02:00"), "Thu, 09 May 2019 11:38:26 GMT")
+        self.assertIsNone(etag.get_last_modified("09-05-2019"))
+        self.assertIsNone(etag.get_last_modified(None))
+
+    def test_is_not_modified(self):
+        headers = {"ETag": '"abc"'}
+
+        self.assertTrue(etag.is_not_modified(_request([(b"if-none-match", b'"xyz", W/"abc"')]), headers))
+        self.assertTrue(etag.is_not_modified(_request([(b"if-none-match", b"*")]), headers))
+        self.assertFalse(etag.is_not_modified(_request([(b"if-none-match", b'"xyz"')]), headers))
+        self.assertFalse(etag.is_not_modified(_request(), headers))
+        self.assertFalse(etag.is_not_modified(_request([(b"if-none-match", b"*")]), {}))
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.num_renders = 0
+
+        async def record(request: Request):
+            headers = etag.get_headers(request, {"id": "1"}, last_modified="2019-05-09T11:38:26")
+            if etag.is_not_modified(request, headers):
+                return etag.get_not_modified_response(headers)
+
+            self.num_renders += 1
+            return HTMLResponse(f'<script nonce="{request.state.csp_nonce}"></script>', headers=headers)
+
+        app = Starlette(
+            routes=[Route("/records/1", record)],
+            middleware=[Middleware(ResponseHeadersMiddleware)],
+        )
+        self.client = TestClient(app)
+
+    def test_revalidation_returns_304_without_rendering(self):
+        response = self.client.get("/records/1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+        self.assertEqual(response.headers["last-modified"], "Thu, 09 May 2019 11:38:26 GMT")
+
+        not_modified = self.client.get("/records/1", headers={"If-None-Match": response.headers["etag"]})
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified.headers["etag"], response.headers["etag"])
+        self.assertEqual(not_modified.headers["cache-control"], "no-cache")
+        self.assertNotIn("content-security-policy", not_modified.headers)
+        self.assertEqual(self.num_renders, 1)
+
+    def test_disabled(self):
+        with patch.object(etag, "ETAG_ENABLED", False):
+            response = self.client.get("/records/1")
+
+        self.assertNotIn("etag", response.headers)
+        self.assertNotIn("cache-control", response.headers)
+
+
+class TestRecordEtag(unittest.IsolatedAsyncioTestCase):
+    async def test_record_etag_is_computed_from_presigned_urls(self):
+        async def sign(record):
+            record["representations"]["record_image"] = "https://storage.example/image.jpg?Signature=1"
+            return record
+
+        record = {"id": "1", "representations": {"record_image": "https://storage.example/image.jpg"}}
+        request = _request()
+        request.scope["path_params"] = {"record_id": "1"}
+
+        with (
+            patch.dict(endpoints_utils.settings, {"boto3_presigned_urls": True}),
+            patch.object(endpoints_utils, "set_presigned_urls_record", side_effect=sign),
+            patch.object(endpoints_records.api, "proxies_record_get_by_id", return_value=record),
+            patch.object(endpoints_records, "_get_record_pagination", return_value=None),
+            patch.object(endpoints_records, "get_record_data", side_effect=RuntimeError("rendered")) as get_record_data,
+            patch.object(etag, "get_headers", wraps=etag.get_headers) as get_headers,
+        ):
+            with self.assertRaisesRegex(RuntimeError, "rendered"):
+                await endpoints_records.records_get(request)
+
+        self.assertIn("Signature=1", get_headers.call_args.args[1]["representations"]["record_image"])
+        self.assertTrue(get_record_data.call_args.kwargs["presigned_urls_set"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from starlette.datastructures import State
+
+from maya.core import api_user
+
+
+def _request(access_token: str) -> SimpleNamespace:
+    return SimpleNamespace(session={"access_token": access_token}, state=State())
+
+
+def _client_returning(me: dict) -> MagicMock:
+    response = MagicMock(is_success=True)
+    response.json.return_value = me
+    client = MagicMock()
+    client.get = AsyncMock(return_value=response)
+    return client
+
+
+class TestMeCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        api_user.me_cache.clear()
+
+    def tearDown(self):
+        api_user.me_cache.clear()
+
+    async def _fetch_me(self, request, client):
+        @asynccontextmanager
+        async def get_async_client():
+            yield client
+
+        with patch("maya.core.api_user.get_async_client", get_async_client):
+            return await api_user._fetch_me(request, "https://example.com/v1")
+
+    async def test_me_is_cached_across_requests(self):
+        client = _client_returning({"id": "user-1", "email": "user@example.com"})
+
+        await self._fetch_me(_request("token"), client)
+        me = await self._fetch_me(_request("token"), client)
+
+        self.assertEqual(me["email"], "user@example.com")
+        client.get.assert_awaited_once()
+
+    async def test_cache_is_keyed_by_access_token(self):
+        client = _client_returning({"id": "user-1", "email": "user@example.com"})
+
+        await self._fetch_me(_request("token"), client)
+        await self._fetch_me(_request("other-token"), client)
+
+        self.assertEqual(client.get.await_count, 2)
+        self.assertNotIn("token", api_user.me_cache.entries)
+
+    async def test_invalidate_by_session_and_by_user(self):
+        client = _client_returning({"id": "user-1", "email": "user@example.com"})
+
+        await self._fetch_me(_request("token"), client)
+        api_user.invalidate_me_cache(_request("token"))
+        await self._fetch_me(_request("token"), client)
+        api_user.invalidate_me_cache_user("user-1")
+        await self._fetch_me(_request("token"), client)
+
+        self.assertEqual(client.get.await_count, 3)
+        self.assertEqual(api_user.me_cache.user_keys.keys(), {"user-1"})
+
+    def test_expired_entry_is_removed(self):
+        cache = api_user.MeCache()
+        cache.set("key", {"id": "user-1"})
+
+        with patch("maya.core.api_user.time.monotonic", return_value=10**9):
+            self.assertIsNone(cache.get("key", expire_in=30))
+
+        self.assertEqual(cache.entries, {})
+        self.assertEqual(cache.user_keys, {})
+
+    def test_max_entries(self):
+        cache = api_user.MeCache(max_entries=2)
+        for index in range(3):
+            cache.set(f"key-{index}", {"id": f"user-{index}"})
+
+        self.assertEqual(list(cache.entries), ["key-1", "key-2"])
+        self.assertNotIn("user-0", cache.user_keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,285 +2,400 @@ import asyncio
 import os
 from types import SimpleNamespace
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import AsyncMock, patch
+from unittest.mock import patch
 
-from starlette.datastructures import URL
+from starlette.datastructures import URL, Headers
+from starlette.middleware import Middleware
 
 os.environ.setdefault("BASE_DIR", "sites/aarhus")
 
+from maya.core import proxy_cache
+from maya.core import request_timing
 from maya.core.logging_context import get_client_ip
-from maya.core.middleware import AccessLogMiddleware, ConcurrencyLimitMiddleware, SameOriginMiddleware
-
-
-class FakeRequest:
-    method = "POST"
-    headers = {"origin": "https://blocked.example"}
-    url = URL("http://testserver/records/1")
+from maya.core.middleware import (
+    AccessLogMiddleware,
+    BeforeResponseMiddleware,
+    ConcurrencyLimitMiddleware,
+    ResponseHeadersMiddleware,
+    SameOriginMiddleware,
+    StaticPathSkippingMiddleware,
+)
+
+
+def _scope(url: str = "http://testserver/records/1", method: str = "POST", headers: dict | None = None, client=None) -> dict:
+    url_ = URL(url)
+    return {
+        "type": "http",
+        "method": method,
+        "scheme": url_.scheme,
+        "server": (url_.hostname, url_.port or (443 if url_.scheme == "https" else 80)),
+        "path": url_.path,
+        "root_path": "",
+        "query_string": url_.query.encode(),
+        "headers": [(key.encode(), value.encode()) for key, value in (headers or {}).items()] + [(b"host", url_.netloc.encode())],
+        "client": client,
+    }
+
+
+class FakeApp:
+    """
+    ASGI app that records its calls and sends a plain response after an optional callback.
+    """
+
+    def __init__(self, body: bytes = b"response", on_call=None, headers: list | None = None):
+        self.body = body
+        self.on_call = on_call
+        self.headers = headers or []
+        self.calls: list = []
+
+    async def __call__(self, scope, receive, send):
+        self.calls.append(scope)
+        if self.on_call:
+            await self.on_call(scope)
+        headers = [(b"content-type", b"text/plain"), *self.headers]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+async def _call(middleware, scope: dict) -> SimpleNamespace:
+    messages: list = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return SimpleNamespace(status_code=start["status"], headers=Headers(raw=start["headers"]), body=body)
 
 
 class MiddlewareTest(IsolatedAsyncioTestCase):
     async def test_access_log_exposes_client_ip_to_request_logs_and_resets_it(self):
-        middleware = AccessLogMiddleware(app=None)
-        request = FakeRequest()
-        request.method = "GET"
-        request.headers = {"user-agent": "test-agent"}
-        request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        request.client = SimpleNamespace(host="203.0.113.4", port=0)
-
-        async def call_next(_request):
+        async def assert_client_ip(_scope):
             self.assertEqual(get_client_ip(), "203.0.113.4")
-            return SimpleNamespace(status_code=200)
+
+        middleware = AccessLogMiddleware(app=FakeApp(on_call=assert_client_ip))
+        scope = _scope(
+            "https://www.aarhusarkivet.dk/records/1",
+            method="GET",
+            headers={"user-agent": "test-agent"},
+            client=("203.0.113.4", 0),
+        )
 
         with patch("maya.core.middleware.access_log") as access_log:
-            response = await middleware.dispatch(request, call_next)
+            response = await _call(middleware, scope)
 
         self.assertEqual(response.status_code, 200)
         self.assertIsNone(get_client_ip())
         self.assertIn('203.0.113.4:0 - "GET /records/1" 200', access_log.info.call_args.args[0])
+        self.assertIn('ua="test-agent', access_log.info.call_args.args[0])
+
+    async def test_request_timing_is_kept_per_request_and_sent_as_server_timing(self):
+        both_requests_started = asyncio.Barrier(2)
+
+        def upstream_calls(num_calls):
+            async def on_call(_scope):
+                await both_requests_started.wait()
+                for _ in range(num_calls):
+                    request_timing.add_time("upstream", "GET_/v1/proxy/records", 0.1)
+                    await asyncio.sleep(0)
+
+            return on_call
+
+        first_middleware = ResponseHeadersMiddleware(app=FakeApp(on_call=upstream_calls(1)))
+        second_middleware = ResponseHeadersMiddleware(app=FakeApp(on_call=upstream_calls(3)))
+
+        first_response, second_response = await asyncio.gather(
+            _call(first_middleware, _scope(method="GET")),
+            _call(second_middleware, _scope(method="GET")),
+        )
+
+        self.assertIn('upstream;dur=100.0;desc="1 calls"', first_response.headers["Server-Timing"])
+        self.assertIn('upstream;dur=300.0;desc="3 calls"', second_response.headers["Server-Timing"])
+        self.assertIn("render;dur=0.0", first_response.headers["Server-Timing"])
+        self.assertEqual(request_timing.get_request_timings(), {})
+
+    async def test_response_from_stale_cache_entry_is_marked(self):
+        async def on_call(_scope):
+            proxy_cache.mark_stale("proxy_record:000001")
+
+        middleware = ResponseHeadersMiddleware(app=FakeApp(on_call=on_call))
+        response = await _call(middleware, _scope(method="GET"))
+
+        self.assertEqual(response.headers[proxy_cache.STALE_HEADER], "stale")
+        self.assertEqual(proxy_cache.get_stale_keys(), [])
+
+    async def test_response_headers_use_the_nonce_of_the_request_state(self):
+        nonces = []
+
+        async def on_call(scope):
+            nonces.append(scope["state"]["csp_nonce"])
+            self.assertIn("time_begin", scope["state"])
+
+        middleware = ResponseHeadersMiddleware(app=FakeApp(on_call=on_call))
+        response = await _call(middleware, _scope("http://testserver/auth/login", method="GET"))
+
+        self.assertIn(f"'nonce-{nonces[0]}'", response.headers["Content-Security-Policy"])
+        self.assertEqual(response.headers["Cache-Control"], "no-store")
+
+        record_response = await _call(middleware, _scope("http://testserver/records/1", method="GET"))
+        self.assertNotIn("Cache-Control", record_response.headers)
+
+    async def test_static_files_only_get_cache_control(self):
+        app = FakeApp(headers=[(b"etag", b'"static"')])
+        middleware = ResponseHeadersMiddleware(app=app)
+
+        response = await _call(middleware, _scope("http://testserver/static/css/default.css", method="GET"))
+
+        self.assertEqual(response.headers["Cache-Control"], "public, max-age=31536000")
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertNotIn("Content-Security-Policy", response.headers)
+        self.assertNotIn("state", app.calls[0])
+
+    async def test_static_path_skipping_middleware(self):
+        class AddHeaderMiddleware:
+            def __init__(self, app, header: str):
+                self.app = app
+                self.header = header
+
+            async def __call__(self, scope, receive, send):
+                async def send_with_header(message):
+                    if message["type"] == "http.response.start":
+                        message["headers"] = message["headers"] + [(self.header.encode(), b"1")]
+                    await send(message)
+
+                await self.app(scope, receive, send_with_header)
+
+        middleware = StaticPathSkippingMiddleware(FakeApp(), middleware=Middleware(AddHeaderMiddleware, header="x-wrapped"))
+
+        response = await _call(middleware, _scope("http://testserver/records/1", method="GET"))
+        static_response = await _call(middleware, _scope("http://testserver/static/css/default.css", method="GET"))
+
+        self.assertEqual(response.headers["x-wrapped"], "1")
+        self.assertNotIn("x-wrapped", static_response.headers)
+
+    async def test_before_response_hooks_alter_headers(self):
+        class Hooks:
+            async def before_response(self, response):
+                response.set_cookie("search", "value")
+                return response
+
+        middleware = BeforeResponseMiddleware(app=FakeApp())
+        with patch("maya.core.middleware.get_hooks", return_value=Hooks()):
+            response = await _call(middleware, _scope(method="GET"))
+
+        self.assertIn("search=value", response.headers["set-cookie"])
+        self.assertEqual(response.body, b"response")
 
     async def test_search_concurrency_limit_rejects_excess_request(self):
+        first_request_started = asyncio.Event()
+        finish_first_request = asyncio.Event()
+
+        async def slow_search(scope):
+            if scope["query_string"] == b"q=aarhus":
+                first_request_started.set()
+                await finish_first_request.wait()
+
+        app = FakeApp(on_call=slow_search)
         middleware = ConcurrencyLimitMiddleware(
-            app=None,
+            app=app,
             limits=[
                 {"max": 1, "retry_after": 7, "paths": ["/search", "/search/json"]},
                 {"max": 2, "retry_after": 5, "paths": ["*"]},
             ],
         )
-        first_request_started = asyncio.Event()
-        finish_first_request = asyncio.Event()
-
-        async def slow_search(_request):
-            first_request_started.set()
-            await finish_first_request.wait()
-            return "first response"
 
-        first_request = FakeRequest()
-        first_request.method = "GET"
-        first_request.url = URL("https://www.aarhusarkivet.dk/search?q=aarhus")
-        first_task = asyncio.create_task(middleware.dispatch(first_request, slow_search))
+        first_task = asyncio.create_task(_call(middleware, _scope("https://www.aarhusarkivet.dk/search?q=aarhus", method="GET")))
         await first_request_started.wait()
 
-        rejected_call_next = AsyncMock()
-        rejected_request = FakeRequest()
-        rejected_request.method = "GET"
-        rejected_request.url = URL("https://www.aarhusarkivet.dk/search?q=archive")
-        response = await middleware.dispatch(rejected_request, rejected_call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/search?q=archive", method="GET"))
 
         self.assertEqual(response.status_code, 429)
         self.assertEqual(response.body, b"Too Many Requests")
         self.assertEqual(response.headers["retry-after"], "7")
         self.assertEqual(response.headers["cache-control"], "no-store")
-        rejected_call_next.assert_not_called()
+        self.assertEqual(len(app.calls), 1)
 
-        record_request = FakeRequest()
-        record_request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        record_call_next = AsyncMock(return_value="record response")
-        record_response = await middleware.dispatch(record_request, record_call_next)
+        record_response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/records/1"))
 
-        self.assertEqual(record_response, "record response")
-        record_call_next.assert_called_once_with(record_request)
+        self.assertEqual(record_response.body, b"response")
+        self.assertEqual(app.calls[-1]["path"], "/records/1")
 
         finish_first_request.set()
-        self.assertEqual(await first_task, "first response")
+        self.assertEqual((await first_task).body, b"response")
 
     async def test_search_concurrency_limit_covers_json_endpoint(self):
-        middleware = ConcurrencyLimitMiddleware(
-            app=None,
-            limits=[{"max": 1, "retry_after": 5, "paths": ["/search", "/search/json"]}],
-        )
         first_request_started = asyncio.Event()
         finish_first_request = asyncio.Event()
 
-        async def slow_search(_request):
-            first_request_started.set()
-            await finish_first_request.wait()
-            return "first response"
+        async def slow_search(scope):
+            if scope["path"] == "/search":
+                first_request_started.set()
+                await finish_first_request.wait()
 
-        search_request = FakeRequest()
-        search_request.url = URL("https://www.aarhusarkivet.dk/search")
-        first_task = asyncio.create_task(middleware.dispatch(search_request, slow_search))
+        app = FakeApp(on_call=slow_search)
+        middleware = ConcurrencyLimitMiddleware(
+            app=app,
+            limits=[{"max": 1, "retry_after": 5, "paths": ["/search", "/search/json"]}],
+        )
+        first_task = asyncio.create_task(_call(middleware, _scope("https://www.aarhusarkivet.dk/search")))
         await first_request_started.wait()
 
-        json_request = FakeRequest()
-        json_request.url = URL("https://www.aarhusarkivet.dk/search/json?q=aarhus")
-        call_next = AsyncMock()
-        response = await middleware.dispatch(json_request, call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/search/json?q=aarhus"))
 
         self.assertEqual(response.status_code, 429)
-        call_next.assert_not_called()
+        self.assertEqual(len(app.calls), 1)
 
         finish_first_request.set()
         await first_task
 
     async def test_search_concurrency_limit_does_not_limit_other_paths(self):
+        app = FakeApp(body=b"record response")
         middleware = ConcurrencyLimitMiddleware(
-            app=None,
+            app=app,
             limits=[{"max": 1, "retry_after": 5, "paths": ["/search", "/search/json"]}],
         )
-        request = FakeRequest()
-        request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        call_next = AsyncMock(return_value="record response")
 
-        response = await middleware.dispatch(request, call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/records/1"))
 
-        self.assertEqual(response, "record response")
-        call_next.assert_called_once_with(request)
+        self.assertEqual(response.body, b"record response")
+        self.assertEqual(len(app.calls), 1)
 
     async def test_search_concurrency_limit_releases_slot_after_error(self):
+        async def fail_once(_scope):
+            if len(app.calls) == 1:
+                raise RuntimeError("search failed")
+
+        app = FakeApp(body=b"search response", on_call=fail_once)
         middleware = ConcurrencyLimitMiddleware(
-            app=None,
+            app=app,
             limits=[{"max": 1, "retry_after": 5, "paths": ["/search", "/search/json"]}],
         )
-        request = FakeRequest()
-        request.method = "GET"
-        request.url = URL("https://www.aarhusarkivet.dk/search")
-        failing_call_next = AsyncMock(side_effect=RuntimeError("search failed"))
 
         with self.assertRaisesRegex(RuntimeError, "search failed"):
-            await middleware.dispatch(request, failing_call_next)
+            await _call(middleware, _scope("https://www.aarhusarkivet.dk/search", method="GET"))
 
-        successful_call_next = AsyncMock(return_value="search response")
-        response = await middleware.dispatch(request, successful_call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/search", method="GET"))
 
-        self.assertEqual(response, "search response")
-        successful_call_next.assert_called_once_with(request)
+        self.assertEqual(response.body, b"search response")
+        self.assertEqual(len(app.calls), 2)
 
     async def test_global_wildcard_limits_all_paths(self):
-        middleware = ConcurrencyLimitMiddleware(
-            app=None,
-            limits=[{"max": 1, "retry_after": 9, "paths": ["*"]}],
-        )
         first_request_started = asyncio.Event()
         finish_first_request = asyncio.Event()
 
-        async def slow_request(_request):
-            first_request_started.set()
-            await finish_first_request.wait()
-            return "first response"
+        async def slow_request(scope):
+            if scope["path"] == "/records/1":
+                first_request_started.set()
+                await finish_first_request.wait()
 
-        record_request = FakeRequest()
-        record_request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        first_task = asyncio.create_task(middleware.dispatch(record_request, slow_request))
+        app = FakeApp(on_call=slow_request)
+        middleware = ConcurrencyLimitMiddleware(
+            app=app,
+            limits=[{"max": 1, "retry_after": 9, "paths": ["*"]}],
+        )
+        first_task = asyncio.create_task(_call(middleware, _scope("https://www.aarhusarkivet.dk/records/1")))
         await first_request_started.wait()
 
-        home_request = FakeRequest()
-        home_request.url = URL("https://www.aarhusarkivet.dk/")
-        call_next = AsyncMock()
-        response = await middleware.dispatch(home_request, call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/"))
 
         self.assertEqual(response.status_code, 429)
         self.assertEqual(response.headers["retry-after"], "9")
-        call_next.assert_not_called()
+        self.assertEqual(len(app.calls), 1)
 
         finish_first_request.set()
         await first_task
 
     async def test_trailing_wildcard_limits_matching_prefix(self):
-        middleware = ConcurrencyLimitMiddleware(
-            app=None,
-            limits=[{"max": 1, "retry_after": 5, "paths": ["/records/*"]}],
-        )
         first_request_started = asyncio.Event()
         finish_first_request = asyncio.Event()
 
-        async def slow_record(_request):
-            first_request_started.set()
-            await finish_first_request.wait()
-            return "first response"
+        async def slow_record(scope):
+            if scope["path"] == "/records/1":
+                first_request_started.set()
+                await finish_first_request.wait()
 
-        first_request = FakeRequest()
-        first_request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        first_task = asyncio.create_task(middleware.dispatch(first_request, slow_record))
+        app = FakeApp(on_call=slow_record)
+        middleware = ConcurrencyLimitMiddleware(
+            app=app,
+            limits=[{"max": 1, "retry_after": 5, "paths": ["/records/*"]}],
+        )
+        first_task = asyncio.create_task(_call(middleware, _scope("https://www.aarhusarkivet.dk/records/1")))
         await first_request_started.wait()
 
-        second_request = FakeRequest()
-        second_request.url = URL("https://www.aarhusarkivet.dk/records/2")
-        call_next = AsyncMock()
-        response = await middleware.dispatch(second_request, call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/records/2"))
 
         self.assertEqual(response.status_code, 429)
-        call_next.assert_not_called()
+        self.assertEqual(len(app.calls), 1)
 
         finish_first_request.set()
         await first_task
 
     async def test_excluded_path_uses_its_own_limit(self):
+        global_request_started = asyncio.Event()
+        finish_global_request = asyncio.Event()
+
+        async def slow_global_request(scope):
+            if scope["path"] == "/records/1":
+                global_request_started.set()
+                await finish_global_request.wait()
+
+        app = FakeApp(on_call=slow_global_request)
         middleware = ConcurrencyLimitMiddleware(
-            app=None,
+            app=app,
             limits=[
                 {"max": 2, "retry_after": 5, "paths": ["/static/*"]},
                 {"max": 1, "retry_after": 5, "paths": ["*"], "exclude_paths": ["/static/*"]},
             ],
         )
-        global_request_started = asyncio.Event()
-        finish_global_request = asyncio.Event()
-
-        async def slow_global_request(_request):
-            global_request_started.set()
-            await finish_global_request.wait()
-            return "global response"
-
-        record_request = FakeRequest()
-        record_request.url = URL("https://www.aarhusarkivet.dk/records/1")
-        global_task = asyncio.create_task(middleware.dispatch(record_request, slow_global_request))
+        global_task = asyncio.create_task(_call(middleware, _scope("https://www.aarhusarkivet.dk/records/1")))
         await global_request_started.wait()
 
-        static_request = FakeRequest()
-        static_request.url = URL("https://www.aarhusarkivet.dk/static/css/default.css")
-        static_call_next = AsyncMock(return_value="static response")
-        response = await middleware.dispatch(static_request, static_call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/static/css/default.css"))
 
-        self.assertEqual(response, "static response")
-        static_call_next.assert_called_once_with(static_request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(app.calls[-1]["path"], "/static/css/default.css")
 
-        blocked_record_request = FakeRequest()
-        blocked_record_request.url = URL("https://www.aarhusarkivet.dk/records/2")
-        blocked_call_next = AsyncMock()
-        blocked_response = await middleware.dispatch(blocked_record_request, blocked_call_next)
+        blocked_response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/records/2"))
 
         self.assertEqual(blocked_response.status_code, 429)
-        blocked_call_next.assert_not_called()
+        self.assertEqual(len(app.calls), 2)
 
         finish_global_request.set()
         await global_task
 
     async def test_same_origin_middleware_allows_configured_origin(self):
-        middleware = SameOriginMiddleware(app=None, allowed_origins=["https://api.openaws.dk"])
-        call_next = AsyncMock()
-        call_next.return_value = "response"
-        request = FakeRequest()
-        request.headers = {"origin": "https://api.openaws.dk"}
+        app = FakeApp()
+        middleware = SameOriginMiddleware(app=app, allowed_origins=["https://api.openaws.dk"])
 
-        response = await middleware.dispatch(request, call_next)
+        response = await _call(middleware, _scope(headers={"origin": "https://api.openaws.dk"}))
 
-        self.assertEqual(response, "response")
-        call_next.assert_called_once_with(request)
+        self.assertEqual(response.body, b"response")
+        self.assertEqual(len(app.calls), 1)
 
     async def test_same_origin_middleware_allows_exempt_path_without_origin(self):
-        middleware = SameOriginMiddleware(app=None, exempt_path_prefixes=["/webhook/"])
-        call_next = AsyncMock()
-        call_next.return_value = "response"
-        request = FakeRequest()
-        request.headers = {}
-        request.url = URL("https://www.aarhusarkivet.dk/webhook/mail/token/verify")
+        app = FakeApp()
+        middleware = SameOriginMiddleware(app=app, exempt_path_prefixes=["/webhook/"])
 
-        response = await middleware.dispatch(request, call_next)
+        response = await _call(middleware, _scope("https://www.aarhusarkivet.dk/webhook/mail/token/verify"))
 
-        self.assertEqual(response, "response")
-        call_next.assert_called_once_with(request)
+        self.assertEqual(response.body, b"response")
+        self.assertEqual(len(app.calls), 1)
 
     async def test_same_origin_middleware_logs_error_code_and_url_for_forbidden_origin(self):
-        middleware = SameOriginMiddleware(app=None, allowed_origins=[])
-        call_next = AsyncMock()
-        request = FakeRequest()
-        request.client = SimpleNamespace(host="203.0.113.4", port=0)
+        app = FakeApp()
+        middleware = SameOriginMiddleware(app=app, allowed_origins=[])
+        scope = _scope(headers={"origin": "https://blocked.example"}, client=("203.0.113.4", 0))
 
         with patch("maya.core.middleware.log") as log:
-            response = await middleware.dispatch(request, call_next)
+            response = await _call(middleware, scope)
 
         self.assertEqual(response.status_code, 403)
         self.assertEqual(response.body, b'{"error":true,"message":"Forbidden. Bad Origin."}')
-        call_next.assert_not_called()
+        self.assertEqual(app.calls, [])
         log.exception.assert_called_once_with(
             "Forbidden request from origin: https://blocked.example",
             extra={
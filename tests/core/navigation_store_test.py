@@ -0,0 +1,73 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import navigation_store
+from maya.core.migration import Migration
+from maya.database import utils
+from maya.database.cache import MemoryCache, TieredCache
+from maya.migrations.default import migrations_default
+
+STATE = {"query_params": [["q", "test"]], "start": 0, "size": 20, "total": 2, "record_ids": ["1", "2"]}
+
+
+class TestNavigationStore(unittest.IsolatedAsyncioTestCase):
+    db_path = "/tmp/test_navigation_store.db"
+
+    async def asyncSetUp(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        Migration(db_path=self.db_path, migrations=migrations_default).run_migrations()
+        self.database_connection = utils.DatabaseConnection(self.db_path)
+        self.memory_cache = MemoryCache(max_entries=100)
+        self.store = TieredCache(self.database_connection, self.memory_cache)
+
+        patches = [
+            patch.object(navigation_store, "database_url", self.db_path),
+            patch.object(navigation_store, "memory_cache", self.memory_cache),
+            patch.object(navigation_store, "navigation_store", self.store),
+        ]
+        for state_patch in patches:
+            state_patch.start()
+            self.addCleanup(state_patch.stop)
+
+    async def test_session_without_token_has_no_state(self):
+        request = SimpleNamespace(session={})
+
+        self.assertIsNone(await navigation_store.get_navigation_state(request))
+        self.assertEqual(request.session, {})
+
+    async def test_session_only_holds_a_short_token(self):
+        request = SimpleNamespace(session={"record_navigation_cache": STATE})
+
+        await navigation_store.set_navigation_state(request, STATE)
+
+        self.assertEqual(list(request.session), ["navigation_token"])
+        self.assertLessEqual(len(request.session["navigation_token"]), 16)
+        self.assertEqual(await navigation_store.get_navigation_state(request), STATE)
+
+    async def test_state_is_read_from_sqlite3_on_a_memory_miss(self):
+        request = SimpleNamespace(session={})
+        await navigation_store.set_navigation_state(request, STATE)
+
+        self.memory_cache.clear()
+
+        self.assertEqual(await navigation_store.get_navigation_state(request), STATE)
+
+    async def test_unchanged_state_is_not_written_again(self):
+        request = SimpleNamespace(session={})
+
+        with patch.object(self.store, "set", wraps=self.store.set) as store_set:
+            await navigation_store.set_navigation_state(request, STATE)
+            await navigation_store.set_navigation_state(request, STATE)
+            await navigation_store.set_navigation_state(request, {**STATE, "start": 20})
+
+        self.assertEqual(store_set.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
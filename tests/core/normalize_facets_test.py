@@ -0,0 +1,135 @@
+import os
+import unittest
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core.query import QueryState
+from maya.records.facet_tree import FacetOverlay, FacetView, freeze, get_facet_index, get_facet_tree, to_dict
+from maya.records.normalize_facets import NormalizeFacets
+
+
+def _normalize_facets(active_facets: dict, query_params: list, query_str: str) -> NormalizeFacets:
+    search_result = {"active_facets": active_facets, "facets_resolved": {}}
+    return NormalizeFacets(None, search_result, query_params=query_params, query_str=query_str)  # type: ignore
+
+
+def _find(nodes, node_id: str):
+    for node in nodes:
+        if node["id"] == node_id:
+            return node
+        found = _find(node.get("children", []), node_id)
+        if found is not None:
+            return found
+    return None
+
+
+class TestFacetTree(unittest.TestCase):
+    def test_freeze(self):
+        frozen = freeze({"content": [{"id": "1", "children": [{"id": "2"}]}]})
+
+        self.assertEqual(frozen["content"][0]["children"][0]["id"], "2")
+        self.assertIsInstance(frozen["content"], tuple)
+        with self.assertRaises(TypeError):
+            frozen["content"][0]["count"] = 1  # type: ignore
+
+    def test_to_dict(self):
+        node = freeze({"id": "1", "children": [{"id": "2"}]})
+        view = FacetView(node, {"2": {"count": 1, "add_link": lambda: "link"}})
+
+        self.assertEqual(to_dict(view), {"id": "1", "children": [{"id": "2", "count": 1, "add_link": "link"}]})
+        self.assertIs(type(to_dict(view)["children"]), list)
+
+    def test_facet_tree_is_compiled_once(self):
+        self.assertIs(get_facet_tree(), get_facet_tree())
+
+    def test_view_reads_overlay_before_node(self):
+        node = freeze({"id": "1", "label": "Images", "children": [{"id": "2", "label": "Photos"}]})
+        view = FacetView(node, {"1": {"count": 3}, "2": {"count": 1, "checked": True}})
+
+        self.assertEqual(view["label"], "Images")
+        self.assertEqual(view["count"], 3)
+        self.assertEqual(view["children"][0]["count"], 1)
+        self.assertTrue(view["children"][0]["checked"])
+        self.assertIn("children", view)
+        self.assertNotIn("children", view["children"][0])
+        self.assertEqual(set(view), {"id", "label", "children", "count"})
+
+    def test_facet_index(self):
+        facet_index = get_facet_index("content_types")
+        facet = get_facet_tree()["content_types"]
+        images = _find(facet["content"], "61")
+        city_images = _find(facet["content"], "64")
+
+        self.assertEqual(facet_index["61"], (f"{facet['label']} > {images['label']}",))
+        self.assertEqual(facet_index["64"], (f"{facet['label']} > {images['label']} > {city_images['label']}",))
+        self.assertIs(get_facet_index("content_types"), facet_index)
+
+    def test_overlay_computes_state_of_unchecked_nodes(self):
+        overlay = FacetOverlay("subjects", {"1": {"count": 2}}, {"2": {"remove_link": ""}}, QueryState("subjects=2&"))
+
+        self.assertEqual(overlay.get("2"), {"count": 0, "checked": True, "remove_link": ""})
+
+        view = FacetView(freeze({"id": "1", "label": "Subject"}), overlay)
+        self.assertEqual(view["count"], 2)
+        self.assertFalse(view["checked"])
+        self.assertEqual(view["add_link"], "subjects=2&subjects=1&")
+
+
+class TestNormalizeFacets(unittest.TestCase):
+    def test_counts_checked_and_links(self):
+        normalize_facets = _normalize_facets(
+            {"content_types": {"61": {"count": 10}, "64": {"count": 4}}},
+            [("content_types", "64")],
+            "content_types=64&",
+        )
+        facets = normalize_facets.get_transformed_facets()
+        content = facets["content_types"]["content"]
+
+        images = _find(content, "61")
+        self.assertEqual(images["count"], 10)
+        self.assertFalse(images["checked"])
+        self.assertEqual(images["add_link"], "content_types=64&content_types=61&")
+
+        city_images = _find(content, "64")
+        self.assertEqual(city_images["count"], 4)
+        self.assertTrue(city_images["checked"])
+        self.assertEqual(city_images["remove_link"], "")
+        self.assertEqual(city_images["invert_link"], "-content_types=64&")
+
+        self.assertEqual(_find(content, "95")["count"], 0)
+
+        filters = normalize_facets.get_filters()
+        self.assertEqual(len(filters), 1)
+        self.assertEqual(filters[0]["query_value"], "64")
+        self.assertEqual(filters[0]["label"], f"{facets['content_types']['label']} > {images['label']} > {city_images['label']}")
+
+    def test_filters_for_an_id_used_by_more_than_one_node(self):
+        facet_index = get_facet_index("subjects")
+        node_id = next(node_id for node_id, labels in facet_index.items() if len(labels) > 1)
+
+        filters = _normalize_facets({}, [("-subjects", node_id)], f"-subjects={node_id}&").get_filters()
+
+        self.assertEqual(sorted(filter["label"] for filter in filters), sorted(facet_index[node_id]))
+        self.assertTrue(all(filter["negated"] for filter in filters))
+        self.assertTrue(all(filter["remove_link"] == "" for filter in filters))
+
+    def test_filters_follow_the_query_param_order(self):
+        query_params = [("content_types", "64"), ("-content_types", "61"), ("content_types", "95"), ("content_types", "64")]
+        for ordered_params in (query_params, query_params[::-1]):
+            filters = _normalize_facets({}, ordered_params, "").get_filters()
+
+            expected = list(dict.fromkeys(value for _, value in ordered_params))
+            self.assertEqual([filter["query_value"] for filter in filters], expected)
+
+    def test_searches_do_not_alter_the_shared_tree(self):
+        _normalize_facets({"content_types": {"61": {"count": 10}}}, [("content_types", "61")], "content_types=61&").get_transformed_facets()
+        facets = _normalize_facets({}, [], "").get_transformed_facets()
+
+        images = _find(facets["content_types"]["content"], "61")
+        self.assertEqual(images["count"], 0)
+        self.assertFalse(images["checked"])
+        self.assertNotIn("count", _find(get_facet_tree()["content_types"]["content"], "61"))
+
+
+if __name__ == "__main__":
+    unittest.main()
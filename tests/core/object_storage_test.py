@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import object_storage
+from maya.core.migration import Migration
+from maya.database.cache import DatabaseCache
+from maya.database.utils import DatabaseConnection
+from maya.migrations.default import migrations_default
+
+STORAGE_URL = "https://nbg1.your-objectstorage.com/aca-access/520/"
+
+
+def _sign(url: str) -> str:
+    return url + "?signature=abc"
+
+
+class TestObjectStorage(unittest.IsolatedAsyncioTestCase):
+    db_path = "/tmp/test_object_storage.db"
+
+    async def asyncSetUp(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        Migration(db_path=self.db_path, migrations=migrations_default).run_migrations()
+        self.database_url_patch = patch.object(object_storage, "database_url", self.db_path)
+        self.database_url_patch.start()
+        object_storage.presigned_url_memo.clear()
+
+    async def asyncTearDown(self):
+        self.database_url_patch.stop()
+
+    async def test_search_results_are_signed_in_one_batch(self):
+        search_results = [
+            {"thumbnail": STORAGE_URL + "000520432_t.jpg", "portrait": STORAGE_URL + "000520432_p.jpg"},
+            {"thumbnail": STORAGE_URL + "000520432_t.jpg"},
+            {"thumbnail": "https://example.com/not_signed.jpg"},
+            {},
+        ]
+
+        with patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=_sign)) as generate_mock:
+            await object_storage.set_presigned_urls_search_results(search_results)
+
+        self.assertEqual(search_results[0]["thumbnail"], _sign(STORAGE_URL + "000520432_t.jpg"))
+        self.assertEqual(search_results[0]["portrait"], _sign(STORAGE_URL + "000520432_p.jpg"))
+        self.assertEqual(search_results[1]["thumbnail"], _sign(STORAGE_URL + "000520432_t.jpg"))
+        self.assertEqual(search_results[2]["thumbnail"], "https://example.com/not_signed.jpg")
+        self.assertEqual(generate_mock.await_count, 2)
+
+    async def test_cached_urls_are_not_signed_again(self):
+        def get_resource():
+            return {"thumbnail": STORAGE_URL + "1_t.jpg", "portrait": [STORAGE_URL + "1_p.jpg"], "highlights": [STORAGE_URL + "1_h.jpg"]}
+
+        with patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=_sign)) as generate_mock:
+            await object_storage.set_presigned_urls_resource(get_resource())
+            signed_resource = await object_storage.set_presigned_urls_resource(get_resource())
+
+        self.assertEqual(generate_mock.await_count, 3)
+        self.assertEqual(signed_resource["portrait"], [_sign(STORAGE_URL + "1_p.jpg")])
+        self.assertEqual(signed_resource["highlights"], [_sign(STORAGE_URL + "1_h.jpg")])
+
+    async def test_url_is_kept_if_signing_fails(self):
+        record = {"thumbnail": STORAGE_URL + "2_t.jpg", "representations": {"record_image": STORAGE_URL + "2_r.jpg"}}
+
+        with patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=Exception("No credentials"))):
+            await object_storage.set_presigned_urls_record(record)
+
+        self.assertEqual(record["thumbnail"], STORAGE_URL + "2_t.jpg")
+        self.assertEqual(record["representations"]["record_image"], STORAGE_URL + "2_r.jpg")
+
+    async def test_memoized_urls_skip_the_database(self):
+        url = STORAGE_URL + "3_t.jpg"
+        with patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=_sign)):
+            await object_storage.set_presigned_urls_record({"thumbnail": url})
+
+        with patch.object(object_storage, "DatabaseConnection") as database_connection_mock:
+            record = await object_storage.set_presigned_urls_record({"thumbnail": url})
+
+        self.assertEqual(record["thumbnail"], _sign(url))
+        database_connection_mock.assert_called_once()
+        database_connection_mock.return_value.transaction_scope_async.assert_not_called()
+
+    async def test_urls_close_to_expiry_are_signed_again(self):
+        url = STORAGE_URL + "4_t.jpg"
+        async with DatabaseConnection(self.db_path).write_transaction_scope_async() as connection:
+            signed_at = int(time.time()) - object_storage.PRESIGNED_URL_MAX_AGE - 1
+            await DatabaseCache(connection).set_raw(f"boto3_{url}", '"old_signature"', signed_at)
+
+        with patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=_sign)) as generate_mock:
+            record = await object_storage.set_presigned_urls_record({"thumbnail": url})
+
+        self.assertEqual(record["thumbnail"], _sign(url))
+        generate_mock.assert_awaited_once()
+
+    async def test_urls_are_signed_concurrently_with_bounded_fan_out(self):
+        running = 0
+        max_running = 0
+
+        async def sign_slowly(url):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return _sign(url)
+
+        resource = {"highlights": [STORAGE_URL + f"5_{index}.jpg" for index in range(20)]}
+        with (
+            patch.object(object_storage, "PRESIGN_CONCURRENCY", 4),
+            patch.object(object_storage, "_generate_presigned_url", new=AsyncMock(side_effect=sign_slowly)),
+        ):
+            await object_storage.set_presigned_urls_resource(resource)
+
+        self.assertEqual(max_running, 4)
+        self.assertEqual(resource["highlights"][19], _sign(STORAGE_URL + "5_19.jpg"))
+
+    async def test_s3_client_is_shared(self):
+        with patch.object(object_storage, "_s3_client", None), patch.object(object_storage.boto3, "client") as client_mock:
+            client_mock.return_value.generate_presigned_url.side_effect = lambda **kwargs: "signed/" + kwargs["Params"]["Key"]
+            first = await object_storage._generate_presigned_url(STORAGE_URL.replace("520/", "") + "520/1.jpg")
+            second = await object_storage._generate_presigned_url(STORAGE_URL.replace("520/", "") + "520/2.jpg")
+
+        self.assertEqual((first, second), ("signed/520/1.jpg", "signed/520/2.jpg"))
+        client_mock.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from maya.core import page_cache
+from maya.core import proxy_cache
+from maya.core.object_storage import BOTO3_EXPIRE_MARGIN
+from maya.core.middleware import PageCacheMiddleware, ResponseHeadersMiddleware
+
+
+def _request(path: str, query_string: bytes = b"", session: dict | None = None, headers: list | None = None) -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or [],
+        "session": session or {},
+    }
+    return Request(scope)
+
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        page_cache_settings = {**page_cache.get_page_cache_settings(), "enabled": True}
+        settings_patch = patch.object(page_cache, "_page_cache_settings", page_cache_settings)
+        settings_patch.start()
+        self.addCleanup(settings_patch.stop)
+        self.addCleanup(page_cache.page_cache.clear)
+
+        self.num_renders = 0
+
+        async def record(request: Request):
+            self.num_renders += 1
+            nonce = request.state.csp_nonce
+            return HTMLResponse(f'<script nonce="{nonce}"></script>' + "record " * 200, headers={"ETag": '"record-1"'})
+
+        async def record_json(request: Request):
+            self.num_renders += 1
+            return JSONResponse({"id": 1})
+
+        app = Starlette(
+            routes=[Route("/records/1", record), Route("/records/1/json/record", record_json)],
+            middleware=[Middleware(ResponseHeadersMiddleware), Middleware(PageCacheMiddleware), Middleware(GZipMiddleware)],
+        )
+        self.client = TestClient(app)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get("/records/1")
+        second = self.client.get("/records/1")
+
+        self.assertEqual(self.num_renders, 1)
+        self.assertEqual(first.headers[page_cache.PAGE_CACHE_HEADER], "miss")
+        self.assertEqual(second.headers[page_cache.PAGE_CACHE_HEADER], "hit")
+        self.assertEqual(second.headers["content-encoding"], "gzip")
+        self.assertEqual(second.text, first.text)
+
+    def test_cached_page_keeps_its_csp_nonce(self):
+        self.client.get("/records/1")
+        response = self.client.get("/records/1")
+
+        nonce = response.text.split('nonce="')[1].split('"')[0]
+        self.assertIn(f"'nonce-{nonce}'", response.headers["content-security-policy"])
+
+    def test_cached_page_is_revalidated(self):
+        self.client.get("/records/1")
+        response = self.client.get("/records/1", headers={"If-None-Match": '"record-1"'})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], '"record-1"')
+        self.assertEqual(response.headers[page_cache.PAGE_CACHE_HEADER], "hit")
+        self.assertEqual(self.num_renders, 1)
+
+    def test_cookies_that_change_the_output_are_part_of_the_key(self):
+        self.client.get("/records/1")
+        self.client.cookies.set("dark_theme", "1")
+        self.client.get("/records/1")
+
+        self.assertEqual(self.num_renders, 2)
+
+    def test_only_html_is_cached(self):
+        self.client.get("/records/1/json/record")
+        response = self.client.get("/records/1/json/record")
+
+        self.assertEqual(self.num_renders, 2)
+        self.assertNotIn(page_cache.PAGE_CACHE_HEADER, response.headers)
+
+
+class TestPageCacheRules(unittest.TestCase):
+    def setUp(self):
+        page_cache_settings = {**page_cache.get_page_cache_settings(), "enabled": True}
+        settings_patch = patch.object(page_cache, "_page_cache_settings", page_cache_settings)
+        settings_patch.start()
+        self.addCleanup(settings_patch.stop)
+
+    def test_expire_per_route(self):
+        self.assertEqual(page_cache.get_expire(_request("/records/000001")), 120)
+        self.assertEqual(page_cache.get_expire(_request("/search")), 60)
+        self.assertEqual(page_cache.get_expire(_request("/people/1")), 120)
+        self.assertIsNone(page_cache.get_expire(_request("/auth/login")))
+
+    def test_expire_is_capped_below_the_presigned_url_margin(self):
+        page_cache._page_cache_settings["routes"] = [{"path": "/records/*", "expire": 3600}]
+
+        self.assertEqual(page_cache.get_expire(_request("/records/1")), page_cache.PAGE_CACHE_MAX_EXPIRE)
+        self.assertLess(page_cache.PAGE_CACHE_MAX_EXPIRE, BOTO3_EXPIRE_MARGIN)
+
+    def test_invalidating_tags_clears_the_page_cache(self):
+        page_cache.page_cache.set("a", page_cache.CachedPage(200, [], b"12345", None, float("inf")))
+        self.addCleanup(page_cache.page_cache.clear)
+
+        with patch.object(proxy_cache, "database_url", ""):
+            asyncio.run(proxy_cache.proxy_cache_invalidate_tags(["record:1"]))
+
+        self.assertIsNone(page_cache.page_cache.get("a"))
+
+    def test_bypass_for_access_token_and_flash_messages(self):
+        self.assertIsNone(page_cache.get_expire(_request("/records/1", session={"access_token": "token"})))
+        self.assertIsNone(page_cache.get_expire(_request("/records/1", session={"flash": [{"message": "Saved"}]})))
+        self.assertEqual(page_cache.get_expire(_request("/records/1", session={"navigation_token": "abc"})), 120)
+
+    def test_key_uses_sorted_query_string(self):
+        self.assertEqual(
+            page_cache.get_key(_request("/search", b"q=hus&content_types=61")),
+            page_cache.get_key(_request("/search", b"content_types=61&q=hus")),
+        )
+        self.assertNotEqual(
+            page_cache.get_key(_request("/search", b"q=hus")),
+            page_cache.get_key(_request("/search", b"q=hus", headers=[(b"accept-encoding", b"gzip")])),
+        )
+
+    def test_lru_eviction_by_size(self):
+        cache = page_cache.PageCache(max_entries=10, max_bytes=10)
+        for key in ("a", "b", "c"):
+            cache.set(key, page_cache.CachedPage(200, [], b"12345", None, float("inf")))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.num_bytes, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
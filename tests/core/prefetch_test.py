@@ -0,0 +1,66 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import prefetch
+from maya.core import request_timing
+
+
+class TestPrefetch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for name, value in (("PREFETCH_ENABLED", True), ("PREFETCH_MAX_TASKS", 2)):
+            setting_patch = patch.object(prefetch, name, value)
+            setting_patch.start()
+            self.addCleanup(setting_patch.stop)
+
+    async def asyncTearDown(self):
+        await prefetch.cancel_all()
+
+    async def test_disabled_by_default(self):
+        with patch.object(prefetch, "PREFETCH_ENABLED", False):
+            self.assertFalse(prefetch.schedule("record:1", asyncio.Event().wait))
+
+    async def test_same_key_and_budget(self):
+        self.assertTrue(prefetch.schedule("record:1", asyncio.Event().wait))
+        self.assertFalse(prefetch.schedule("record:1", asyncio.Event().wait))
+        self.assertTrue(prefetch.schedule("record:2", asyncio.Event().wait))
+        self.assertFalse(prefetch.schedule("record:3", asyncio.Event().wait))
+
+    async def test_finished_prefetch_frees_the_budget(self):
+        async def fail():
+            raise RuntimeError("upstream down")
+
+        prefetch.schedule("record:1", fail)
+        prefetch.schedule("record:2", asyncio.sleep)  # type: ignore
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(prefetch._tasks, {})
+        self.assertTrue(prefetch.schedule("record:3", asyncio.Event().wait))
+
+    async def test_cancel_all(self):
+        prefetch.schedule("record:1", asyncio.Event().wait)
+        task = prefetch._tasks["record:1"]
+
+        await prefetch.cancel_all()
+
+        self.assertTrue(task.cancelled())
+        self.assertEqual(prefetch._tasks, {})
+
+    async def test_prefetch_is_not_counted_in_request_timings(self):
+        async def fetch():
+            request_timing.add_time("upstream", "prefetch", 1.0)
+
+        token = request_timing.start_request_timing()
+        try:
+            prefetch.schedule("record:1", fetch)
+            await asyncio.sleep(0.01)
+            self.assertEqual(request_timing.get_request_timings(), {})
+        finally:
+            request_timing.reset_request_timing(token)
+
+
+if __name__ == "__main__":
+    unittest.main()
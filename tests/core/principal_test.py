@@ -0,0 +1,71 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from starlette.datastructures import State
+
+from maya.core import api
+from maya.core import user
+
+
+def _request(session: dict) -> SimpleNamespace:
+    return SimpleNamespace(session=session, state=State())
+
+
+class TestPrincipal(unittest.IsolatedAsyncioTestCase):
+    @patch("maya.core.api.users_me_get", new_callable=AsyncMock)
+    async def test_anonymous_request_skips_user_adapter(self, mock_users_me_get):
+        request = _request({})
+
+        self.assertFalse(await api.is_logged_in(request))
+        self.assertFalse(await api.me_verified(request))
+        self.assertEqual(await api.me_permissions(request), [])
+        self.assertFalse(await api.has_permission(request, "employee"))
+
+        self.assertIs(request.state.principal, user.ANONYMOUS_PRINCIPAL)
+        mock_users_me_get.assert_not_awaited()
+
+    @patch("maya.core.api.users_me_get", new_callable=AsyncMock)
+    async def test_principal_is_resolved_once_per_request(self, mock_users_me_get):
+        mock_users_me_get.return_value = {"email": "user@example.com", "is_verified": True, "role": 10}
+        request = _request({"access_token": "token"})
+
+        self.assertTrue(await api.is_logged_in(request))
+        self.assertTrue(await api.me_verified(request))
+        self.assertEqual(await api.me_permissions(request), ["employee", "user"])
+        self.assertTrue(await api.has_permission(request, "employee"))
+        self.assertFalse(await api.has_permission(request, "admin"))
+
+        mock_users_me_get.assert_awaited_once_with(request)
+
+    @patch("maya.core.api.users_me_get", new_callable=AsyncMock)
+    async def test_invalid_access_token_is_anonymous(self, mock_users_me_get):
+        mock_users_me_get.side_effect = Exception("Unauthorized")
+        request = _request({"access_token": "expired"})
+
+        principal = await api.get_principal(request)
+
+        self.assertIs(principal, user.ANONYMOUS_PRINCIPAL)
+        self.assertEqual(await api.me_get(request), {})
+        mock_users_me_get.assert_awaited_once()
+
+    @patch("maya.core.api.users_me_get", new_callable=AsyncMock)
+    async def test_clear_principal(self, mock_users_me_get):
+        request = _request({})
+        await api.get_principal(request)
+
+        request.session["access_token"] = "token"
+        mock_users_me_get.return_value = {"email": "user@example.com", "is_verified": False, "role": 0}
+        api.clear_principal(request)
+
+        principal = await api.get_principal(request)
+        self.assertTrue(principal.is_logged_in)
+        self.assertFalse(principal.is_verified)
+        self.assertEqual(principal.permissions, ("user",))
+
+
+if __name__ == "__main__":
+    unittest.main()
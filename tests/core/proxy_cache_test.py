@@ -0,0 +1,193 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+import httpx
+
+from maya.core import api
+from maya.core import proxy_cache
+from maya.core.proxy_cache import CacheEntry, SearchCacheStats, get_facet_combination, get_record_tags, proxy_records_cache_key
+from maya.endpoints.endpoints_relations import _get_relation_data, _get_relation_tags
+
+
+class TestProxyCache(unittest.TestCase):
+    def test_records_cache_key_ignores_param_order(self):
+        key_a = proxy_records_cache_key([("content_types", "96"), ("subjects", "1"), ("size", "20")])
+        key_b = proxy_records_cache_key([("size", "20"), ("subjects", "1"), ("content_types", "96")])
+
+        self.assertEqual(key_a, key_b)
+        self.assertTrue(key_a.startswith("proxy_records:"))
+
+    def test_facet_combination_ignores_values_and_presentation_params(self):
+        query_params = [("content_types", "96"), ("-subjects", "1"), ("size", "20"), ("start", "40"), ("q", "aarhus")]
+
+        self.assertEqual(get_facet_combination(query_params), "content_types+q+subjects")
+        self.assertEqual(get_facet_combination([("size", "20")]), "(none)")
+
+    def test_search_cache_stats_hit_rate(self):
+        stats = SearchCacheStats(log_interval=1000)
+        stats.record([("content_types", "96")], hit=True)
+        stats.record([("content_types", "97")], hit=False)
+        stats.record([("q", "aarhus")], hit=False)
+
+        hit_rates = stats.get_hit_rates()
+
+        self.assertEqual(hit_rates["content_types"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+        self.assertEqual(hit_rates["q"]["hit_rate"], 0.0)
+
+    def test_record_tags(self):
+        record = {
+            "collection": {"id": 1, "label": "Aarhus Stadsarkiv"},
+            "people": [{"id": 123, "display_label": "Person"}],
+            "locations": [{"id": "0045"}],
+        }
+
+        self.assertEqual(
+            get_record_tags("000309478", record),
+            ["record:309478", "resource:collections:1", "resource:people:123", "resource:locations:45"],
+        )
+
+    def test_relation_tags(self):
+        data = {"subject_domain": "events", "subject_id": "12", "object_domain": "people", "object_id": "0034"}
+
+        self.assertEqual(_get_relation_tags(data), ["resource:events:12", "resource:people:34"])
+        self.assertEqual(_get_relation_tags({"subject_domain": "events"}), [])
+
+
+class TestRelationData(unittest.IsolatedAsyncioTestCase):
+    def _request(self, query_params: dict) -> SimpleNamespace:
+        return SimpleNamespace(path_params={"rel_id": "7"}, query_params=query_params)
+
+    @patch("maya.core.api.proxies_get_relations", new_callable=AsyncMock)
+    async def test_object_is_looked_up_in_the_relations_of_the_subject(self, mock_get_relations):
+        mock_get_relations.return_value = [{"rel_id": 6, "id": "1", "domain": "people"}, {"rel_id": 7, "id": "45", "domain": "locations"}]
+        query_params = {"subject_domain": "events", "subject_id": "12", "object_domain": "people", "object_id": "45"}
+
+        data = await _get_relation_data(self._request(query_params))  # type: ignore
+
+        self.assertEqual(_get_relation_tags(data), ["resource:events:12", "resource:locations:45"])
+
+    @patch("maya.core.api.proxies_get_relations", new_callable=AsyncMock, side_effect=RuntimeError("upstream down"))
+    async def test_query_params_are_used_if_the_lookup_fails(self, _mock_get_relations):
+        query_params = {"subject_domain": "events", "subject_id": "12", "object_domain": "events", "object_id": "45"}
+
+        with patch("maya.endpoints.endpoints_relations.log"):
+            data = await _get_relation_data(self._request(query_params))  # type: ignore
+
+        self.assertEqual(_get_relation_tags(data), ["resource:events:12", "resource:events:45"])
+
+
+class TestProxyRecordsCache(unittest.IsolatedAsyncioTestCase):
+    @patch("maya.core.api.PROXY_CACHE_SEARCH_EXPIRE", 600)
+    @patch("maya.core.api.is_logged_in", new_callable=AsyncMock, return_value=False)
+    @patch(
+        "maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=CacheEntry({"result": [], "total": 0}, 10, 600)
+    )
+    @patch("maya.core.api._proxy_get_json", new_callable=AsyncMock)
+    async def test_anonymous_search_is_served_from_cache(self, mock_get_json, mock_cache_get, _mock_is_logged_in):
+        search_result = await api.proxies_records(SimpleNamespace(), [("content_types", "96"), ("size", "20")])
+
+        self.assertEqual(search_result, {"result": [], "total": 0})
+        mock_get_json.assert_not_called()
+        mock_cache_get.assert_awaited_once_with(proxy_records_cache_key([("size", "20"), ("content_types", "96")]), 600)
+
+    @patch("maya.core.api.PROXY_CACHE_SEARCH_EXPIRE", 600)
+    @patch("maya.core.api.is_logged_in", new_callable=AsyncMock, return_value=True)
+    @patch("maya.core.api.proxy_cache_set", new_callable=AsyncMock)
+    @patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock)
+    @patch("maya.core.api._proxy_get_json", new_callable=AsyncMock, return_value={"result": [], "total": 0})
+    async def test_logged_in_search_skips_cache(self, mock_get_json, mock_cache_get, mock_cache_set, _mock_is_logged_in):
+        await api.proxies_records(SimpleNamespace(), [("content_types", "96")])
+
+        mock_get_json.assert_awaited_once()
+        mock_cache_get.assert_not_called()
+        mock_cache_set.assert_not_called()
+
+    @patch("maya.core.api.PROXY_CACHE_SEARCH_EXPIRE", None)
+    @patch("maya.core.api.is_logged_in", new_callable=AsyncMock)
+    @patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock)
+    @patch("maya.core.api._proxy_get_json", new_callable=AsyncMock, return_value={"result": [], "total": 0})
+    async def test_disabled_search_cache_skips_login_check(self, mock_get_json, mock_cache_get, mock_is_logged_in):
+        await api.proxies_records(SimpleNamespace(), [("content_types", "96")])
+
+        mock_get_json.assert_awaited_once()
+        mock_cache_get.assert_not_called()
+        mock_is_logged_in.assert_not_called()
+
+    @patch("maya.core.api.PROXY_CACHE_SEARCH_EXPIRE", 600)
+    @patch("maya.core.api.proxy_cache_set", new_callable=AsyncMock)
+    @patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=None)
+    @patch("maya.core.api._proxy_get_json", new_callable=AsyncMock, return_value={"result": ["000110308"], "next_cursor": "abc"})
+    async def test_view_ids_cursor_page_is_cached(self, _mock_get_json, _mock_cache_get, mock_cache_set):
+        items = [("content_types", "96"), ("view", "ids"), ("cursor", "abc")]
+        records = await api.proxies_view_ids_from_list(items, use_cache=True)
+
+        self.assertEqual(records["status_code"], 0)
+        mock_cache_set.assert_awaited_once()
+        self.assertEqual(mock_cache_set.call_args.args[0], proxy_records_cache_key(items))
+        self.assertEqual(mock_cache_set.call_args.args[2], 600)
+
+
+def _upstream_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://dev.openaws.dk/v1/proxy/records/000001")
+    response = httpx.Response(status_code, request=request)
+    return httpx.HTTPStatusError("Upstream error", request=request, response=response)
+
+
+@patch("maya.core.proxy_cache.PROXY_CACHE_STALE_WHILE_REVALIDATE", 60)
+@patch("maya.core.proxy_cache.PROXY_CACHE_STALE_IF_ERROR", 3600)
+class TestStaleProxyCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.stale_token = proxy_cache.start_stale_tracking()
+
+    async def asyncTearDown(self):
+        proxy_cache.reset_stale_tracking(self.stale_token)
+
+    async def test_fresh_entry_is_a_hit(self):
+        fetch = AsyncMock()
+        with patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=CacheEntry({"id": 1}, 10, 600)):
+            data, cache_status = await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+
+        self.assertEqual((data, cache_status), ({"id": 1}, "hit"))
+        fetch.assert_not_awaited()
+        self.assertEqual(proxy_cache.get_stale_keys(), [])
+
+    async def test_stale_entry_is_served_while_revalidating(self):
+        fetch = AsyncMock(return_value={"id": 2})
+        with patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=CacheEntry({"id": 1}, 630, 600)):
+            data, cache_status = await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+            # A second request does not start another refresh
+            await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+            await asyncio.sleep(0)
+
+        self.assertEqual((data, cache_status), ({"id": 1}, "stale"))
+        fetch.assert_awaited_once()
+        self.assertEqual(proxy_cache.get_stale_keys(), ["key", "key"])
+
+    async def test_stale_entry_is_served_on_upstream_error(self):
+        fetch = AsyncMock(side_effect=_upstream_error(503))
+        with patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=CacheEntry({"id": 1}, 1200, 600)):
+            data, cache_status = await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+
+        self.assertEqual((data, cache_status), ({"id": 1}, "stale"))
+        self.assertEqual(proxy_cache.get_stale_keys(), ["key"])
+
+    async def test_stale_entry_is_not_served_on_client_error(self):
+        fetch = AsyncMock(side_effect=_upstream_error(404))
+        with patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=CacheEntry({"id": 1}, 1200, 600)):
+            with self.assertRaises(httpx.HTTPStatusError):
+                await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+
+    async def test_timeout_without_stale_entry_is_raised(self):
+        fetch = AsyncMock(side_effect=httpx.ReadTimeout("timeout"))
+        with patch("maya.core.proxy_cache.proxy_cache_get_entry", new_callable=AsyncMock, return_value=None):
+            with self.assertRaises(httpx.ReadTimeout):
+                await proxy_cache.proxy_cache_fetch("key", fetch, 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
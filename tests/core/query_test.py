@@ -0,0 +1,42 @@
+import os
+import unittest
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core.query import QueryState
+
+
+class TestQueryState(unittest.TestCase):
+    def setUp(self):
+        self.query_state = QueryState("q=hus+og+have&content_types=61&-subjects=12&content_types=616&")
+
+    def test_add_link(self):
+        self.assertEqual(self.query_state.get_add_link("subjects", "1"), self.query_state.query_str + "subjects=1&")
+        self.assertEqual(self.query_state.get_add_link("q", "a b"), self.query_state.query_str + "q=a+b&")
+
+    def test_remove_link(self):
+        self.assertEqual(self.query_state.get_remove_link("content_types", "61"), "q=hus+og+have&-subjects=12&content_types=616&")
+        self.assertEqual(self.query_state.get_remove_link("subjects", "12"), "q=hus+og+have&content_types=61&content_types=616&")
+        self.assertEqual(self.query_state.get_remove_link("q", "hus og have"), "content_types=61&-subjects=12&content_types=616&")
+
+    def test_invert_link(self):
+        self.assertEqual(
+            self.query_state.get_invert_link("content_types", "61"), "q=hus+og+have&-content_types=61&-subjects=12&content_types=616&"
+        )
+        self.assertEqual(
+            self.query_state.get_invert_link("subjects", "12"), "q=hus+og+have&content_types=61&subjects=12&content_types=616&"
+        )
+
+    def test_missing_param_keeps_the_query_string(self):
+        self.assertEqual(self.query_state.get_remove_link("content_types", "6"), self.query_state.query_str)
+        self.assertEqual(self.query_state.get_invert_link("content_types", "6"), self.query_state.query_str)
+
+    def test_negated_param_is_removed_first(self):
+        query_state = QueryState("subjects=12&-subjects=12&")
+
+        self.assertEqual(query_state.get_remove_link("subjects", "12"), "subjects=12&")
+        self.assertEqual(query_state.get_invert_link("subjects", "12"), "subjects=12&subjects=12&")
+
+
+if __name__ == "__main__":
+    unittest.main()
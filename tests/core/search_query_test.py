@@ -0,0 +1,45 @@
+import os
+import unittest
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import search_query
+from maya.core.proxy_cache import proxy_records_cache_key
+
+
+class TestSearchQuery(unittest.TestCase):
+    def test_spellings_of_the_same_search_are_equal(self):
+        canonical = search_query.canonicalize([("subjects", "12"), ("collection", "7"), ("size", "20")])
+        spellings = [
+            [("size", "20"), ("collection", "7"), ("subjects", "12")],
+            [("collection", "000007"), ("subjects", "12"), ("size", "20")],
+            [("amp;collection", "7"), ("amp;subjects", "12"), ("size", "20")],
+            [("subjects", "12"), ("collection", "7"), ("subjects", "12"), ("size", "20")],
+        ]
+
+        for query_params in spellings:
+            self.assertEqual(search_query.canonicalize(query_params), canonical)
+            self.assertEqual(hash(search_query.canonicalize(query_params)), hash(canonical))
+
+    def test_canonicalize(self):
+        canonical = search_query.canonicalize(
+            [("start", "40"), ("q", "hus"), ("-subjects", "0"), ("content_types", "061")], remove_keys=["start"]
+        )
+
+        self.assertEqual(canonical, (("-subjects", "0"), ("content_types", "61"), ("q", "hus")))
+
+    def test_list_round_trip(self):
+        canonical = search_query.canonicalize([("q", "æble"), ("size", "20")])
+
+        self.assertEqual(search_query.canonicalize(search_query.to_list(canonical)), canonical)
+        self.assertEqual(search_query.get_key(canonical), '[["q","æble"],["size","20"]]')
+
+    def test_records_cache_key_uses_canonical_query(self):
+        self.assertEqual(
+            proxy_records_cache_key([("collection", "0007"), ("amp;subjects", "12")]),
+            proxy_records_cache_key([("subjects", "12"), ("collection", "7"), ("subjects", "12")]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("BASE_DIR", "sites/aarhus")
+
+from maya.core import single_flight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_identical_calls_share_one_fetch(self):
+        num_fetches = 0
+
+        async def fetch():
+            nonlocal num_fetches
+            num_fetches += 1
+            await asyncio.sleep(0.01)
+            return {"id": "000309478", "representations": {"record_type": "image"}}
+
+        key = single_flight.get_key("https://dev.openaws.dk/v1/proxy/records/000309478")
+        results = await asyncio.gather(*[single_flight.run(key, fetch) for _ in range(5)])
+
+        self.assertEqual(num_fetches, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+
+        # Every caller gets its own copy that can be mutated
+        results[0]["representations"]["record_type"] = "mutated"
+        self.assertEqual(results[1]["representations"]["record_type"], "image")
+
+    async def test_single_caller_gets_result_without_copy(self):
+        record = {"id": "000309478"}
+
+        async def fetch():
+            return record
+
+        result = await single_flight.run(single_flight.get_key("https://dev.openaws.dk/v1/proxy/records/1"), fetch)
+        self.assertIs(result, record)
+
+    async def test_sequential_calls_are_not_coalesced(self):
+        num_fetches = 0
+
+        async def fetch():
+            nonlocal num_fetches
+            num_fetches += 1
+            return {}
+
+        key = single_flight.get_key("https://dev.openaws.dk/v1/proxy/people/1")
+        await single_flight.run(key, fetch)
+        await single_flight.run(key, fetch)
+
+        self.assertEqual(num_fetches, 2)
+
+    async def test_scopes_are_not_coalesced(self):
+        num_fetches = 0
+
+        async def fetch():
+            nonlocal num_fetches
+            num_fetches += 1
+            await asyncio.sleep(0.01)
+            return {}
+
+        url = "https://dev.openaws.dk/v1/proxy/records/1"
+        await asyncio.gather(
+            single_flight.run(single_flight.get_key(url, "anonymous"), fetch),
+            single_flight.run(single_flight.get_key(url, "user"), fetch),
+        )
+
+        self.assertEqual(num_fetches, 2)
+
+    async def test_exception_is_raised_for_all_callers(self):
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        key = single_flight.get_key("https://dev.openaws.dk/v1/proxy/records/2")
+        results = await asyncio.gather(*[single_flight.run(key, fetch) for _ in range(3)], return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelled_caller_does_not_cancel_shared_fetch(self):
+        fetch_started = asyncio.Event()
+
+        async def fetch():
+            fetch_started.set()
+            await asyncio.sleep(0.01)
+            return {"id": "1"}
+
+        key = single_flight.get_key("https://dev.openaws.dk/v1/proxy/records/3")
+        first_task = asyncio.create_task(single_flight.run(key, fetch))
+        await fetch_started.wait()
+        second_task = asyncio.create_task(single_flight.run(key, fetch))
+        await asyncio.sleep(0)
+
+        first_task.cancel()
+        self.assertEqual(await second_task, {"id": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()